@@ -1,21 +1,19 @@
 import datetime
 
-from django.conf import settings
 from django.contrib.sites.models import Site
-from django.core.mail import EmailMessage
 from django.core.paginator import Paginator, EmptyPage
 from django.core.urlresolvers import reverse
 from django.http import HttpResponse, HttpResponseBadRequest, \
     HttpResponseRedirect
 from django.shortcuts import render_to_response, get_object_or_404
-from django.template import RequestContext, Context, loader
+from django.template import RequestContext
 from django.views.decorators.csrf import csrf_protect
 
 from localtv.decorators import require_site_admin, referrer_redirect
 from localtv.models import Video, SiteSettings
 from localtv.admin import feeds
-
-from notification import models as notification
+from localtv.moderation import (approve_videos, reject_videos,
+                                send_approval_notices)
 
 ## --------------------
 ## Video approve/reject
@@ -76,20 +74,7 @@ def approve_video(request):
         current_video.last_featured = datetime.datetime.now()
 
     current_video.save()
-
-    if current_video.user and current_video.user.email:
-        video_approved = notification.NoticeType.objects.get(
-            label="video_approved")
-        if notification.should_send(current_video.user, video_approved, "1"):
-            subject = '[%s] "%s" was approved!' % (
-                current_video.site.name,
-                current_video)
-            t = loader.get_template(
-                'localtv/submit_video/approval_notification_email.txt')
-            c = Context({'current_video': current_video})
-            message = t.render(c)
-            EmailMessage(subject, message, settings.DEFAULT_FROM_EMAIL,
-                         [current_video.user.email]).send(fail_silently=True)
+    send_approval_notices([current_video.pk])
 
     return HttpResponse('SUCCESS')
 
@@ -147,9 +132,7 @@ def reject_all(request):
         return HttpResponseBadRequest(
             'Page number request exceeded available pages')
 
-    for video in page.object_list:
-        video.status = Video.REJECTED
-        video.save()
+    reject_videos(page.object_list)
 
     return HttpResponse('SUCCESS')
 
@@ -167,10 +150,7 @@ def approve_all(request):
         return HttpResponseBadRequest(
             'Page number request exceeded available pages')
 
-    for video in page.object_list:
-        video.status = Video.ACTIVE
-        video.when_approved = datetime.datetime.now()
-        video.save()
+    send_approval_notices(approve_videos(page.object_list))
 
     return HttpResponse('SUCCESS')
 
@@ -180,9 +160,7 @@ def clear_all(request):
     videos = Video.objects.filter(status=Video.UNAPPROVED,
                                   site=Site.objects.get_current())
     if request.POST.get('confirm') == 'yes':
-        for video in videos:
-            video.status = Video.REJECTED
-            video.save()
+        reject_videos(videos)
         return HttpResponseRedirect(reverse('localtv_admin_approve_reject'))
     else:
         return render_to_response('localtv/admin/clear_confirm.html',
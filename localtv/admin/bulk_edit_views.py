@@ -8,8 +8,32 @@ from django.views.decorators.csrf import csrf_protect
 from localtv.decorators import require_site_admin
 from localtv.models import Video, SiteSettings
 from localtv.admin import forms
+from localtv.search.utils import search_video_pks
 from localtv.utils import SortHeaders
 
+
+#: The most search hits listed for bulk editing, which keeps the pk lookup
+#: for them small. Broader searches need to be narrowed down.
+SEARCH_LIMIT = 300
+
+
+def search_videos(videos, search_string, site, indexed=True):
+    """
+    Returns a ``(videos, truncated)`` tuple of the ``videos`` which match
+    ``search_string``. If the videos are ``indexed``, they are limited to the
+    :data:`SEARCH_LIMIT` best matches in the search index, and ``truncated``
+    is ``True`` if there were more; otherwise, only their names and
+    descriptions are searched, which doesn't need any joins.
+
+    """
+    if not indexed:
+        return videos.filter(Q(name__icontains=search_string) |
+                             Q(description__icontains=search_string)), False
+    pks = search_video_pks(search_string, site.pk, SEARCH_LIMIT + 1)
+    return (videos.filter(pk__in=pks[:SEARCH_LIMIT]),
+            len(pks) > SEARCH_LIMIT)
+
+
 @require_site_admin
 @csrf_protect
 def bulk_edit(request, formset_class=forms.VideoFormSet):
@@ -28,6 +52,8 @@ def bulk_edit(request, formset_class=forms.VideoFormSet):
     site_settings = SiteSettings.objects.get_current()
     videos = Video.objects.filter(status=Video.ACTIVE,
                                   site=site_settings.site)
+    # Only active videos are in the search index.
+    indexed = True
 
     if 'filter' in request.GET:
         filter_type = request.GET['filter']
@@ -35,12 +61,14 @@ def bulk_edit(request, formset_class=forms.VideoFormSet):
             videos = videos.exclude(last_featured=None)
         elif filter_type == 'rejected':
             videos = Video.objects.filter(status=Video.REJECTED)
+            indexed = False
         elif filter_type == 'no-attribution':
             videos = videos.filter(authors=None)
         elif filter_type == 'no-category':
             videos = videos.filter(categories=None)
         elif filter_type == 'unapproved':
             videos = Video.objects.filter(status=Video.UNAPPROVED)
+            indexed = False
 
     videos = videos.select_related('feed', 'search', 'site')
 
@@ -51,7 +79,7 @@ def bulk_edit(request, formset_class=forms.VideoFormSet):
         category = ''
 
     if category != '':
-        videos = videos.filter(categories__pk=category).distinct()
+        videos = videos.filter(categories__pk=category)
 
     author = request.GET.get('author', '')
     try:
@@ -60,19 +88,13 @@ def bulk_edit(request, formset_class=forms.VideoFormSet):
         author = ''
 
     if author != '':
-        videos = videos.filter(authors__pk=author).distinct()
+        videos = videos.filter(authors__pk=author)
 
     search_string = request.GET.get('q', '')
+    search_truncated = False
     if search_string != '':
-        videos = videos.filter(
-            Q(description__icontains=search_string) |
-            Q(name__icontains=search_string) |
-            Q(categories__name__icontains=search_string) |
-            Q(user__username__icontains=search_string) |
-            Q(user__first_name__icontains=search_string) |
-            Q(user__last_name__icontains=search_string) |
-            Q(video_service_user__icontains=search_string) |
-            Q(feed__name__icontains=search_string)).distinct()
+        videos, search_truncated = search_videos(videos, search_string,
+                                                 site_settings.site, indexed)
 
     headers = SortHeaders(request, (
             ('Video Title', 'name'),
@@ -123,6 +145,8 @@ def bulk_edit(request, formset_class=forms.VideoFormSet):
                               {'formset': formset,
                                'headers': headers,
                                'search_string': search_string,
+                               'search_truncated': search_truncated,
+                               'search_limit': SEARCH_LIMIT,
                                'page': page,
                                'categories': formset._qs_cache['categories'],
                                'users': formset._qs_cache['authors']},
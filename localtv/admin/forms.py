@@ -21,7 +21,7 @@ from haystack import connections
 
 from tagging.forms import TagField
 
-from localtv import models, utils
+from localtv import models, moderation, utils
 from localtv.settings import API_KEYS
 from localtv.tasks import video_save_thumbnail, feed_update, CELERY_USING
 from localtv.user_profile import forms as user_profile_forms
@@ -479,6 +479,9 @@ class BulkEditVideoFormSet(BaseModelFormSet):
         form.fields['authors'].queryset = self._qs_cache['authors']
         return form
 
+    #: Bulk edits which need each selected video to be saved on its own.
+    per_video_fields = ('thumbnail', 'thumbnail_url')
+
     def clean(self):
         BaseModelFormSet.clean(self)
 
@@ -486,55 +489,99 @@ class BulkEditVideoFormSet(BaseModelFormSet):
             # don't bother doing anything if the form isn't valid
             return
 
+        self.rejected_pks = []
         for form in list(self.deleted_forms):
             form.cleaned_data[DELETION_FIELD_NAME] = False
-            form.instance.status = models.Video.REJECTED
-            form.instance.save()
-        bulk_edits = self.extra_forms[0].cleaned_data
-        for key in list(bulk_edits.keys()): # get the list because we'll be
-                                            # changing the dictionary
-            if not bulk_edits[key]:
-                del bulk_edits[key]
-        bulk_action = self.data.get('bulk_action', '')
-        if bulk_action:
-            bulk_edits['action'] = bulk_action
-        if bulk_edits:
-            for form in self.initial_forms:
-                if not form.cleaned_data['BULK']:
-                    continue
-                for key, value in bulk_edits.items():
-                    if key == 'action': # do something to the video
-                        method = getattr(self, 'action_%s' % value)
-                        method(form)
-                    elif key == 'tags':
-                        form.cleaned_data[key] = value
-                    elif key == 'categories':
-                        # categories append, not replace
-                        form.cleaned_data[key] = (
-                            list(form.cleaned_data[key]) +
-                            list(value))
-                    elif key == 'authors':
-                        form.cleaned_data[key] = value
-                    else:
-                        setattr(form.instance, key, value)
+            self.rejected_pks.append(form.instance.pk)
+        bulk_edits = dict((key, value) for key, value
+                          in self.extra_forms[0].cleaned_data.items()
+                          if value and key != 'BULK')
+        self.bulk_pks = [form.instance.pk for form in self.initial_forms
+                         if form.cleaned_data['BULK']]
+        self.bulk_action = self.data.get('bulk_action', '')
+        if self.bulk_action and not hasattr(self,
+                                            'action_%s' % self.bulk_action):
+            raise ValidationError('Unknown bulk action.')
+        for form in self.initial_forms:
+            if form.instance.pk not in self.bulk_pks:
+                continue
+            for key in self.per_video_fields:
+                if key in bulk_edits:
+                    setattr(form.instance, key, bulk_edits[key])
+                    form._bulk_save = True
+        self.bulk_edits = dict((key, value)
+                               for key, value in bulk_edits.items()
+                               if key not in self.per_video_fields)
 
         self.can_delete = False
 
-    def action_delete(self, form):
-        form.instance.status = models.Video.REJECTED
+    def save_existing_objects(self, commit=True):
+        """
+        Saves the forms which were edited on their own (or which need to be
+        saved for a bulk edit); everything else is applied as set operations
+        across the selected videos by :meth:`save`.
 
-    def action_approve(self, form):
-        form.instance.status = models.Video.ACTIVE
+        """
+        self.changed_objects = []
+        self.deleted_objects = []
+        saved_instances = []
+        for form in self.initial_forms:
+            changed = [name for name in form.changed_data if name != 'BULK']
+            if changed or getattr(form, '_bulk_save', False):
+                self.changed_objects.append((form.instance, changed))
+                saved_instances.append(self.save_existing(form, form.instance,
+                                                          commit=commit))
+                if not commit:
+                    self.saved_forms.append(form)
+        return saved_instances
 
-    def action_unapprove(self, form):
-        form.instance.status = models.Video.UNAPPROVED
+    def save(self, commit=True):
+        saved_instances = super(BulkEditVideoFormSet, self).save(commit)
+        if commit:
+            self.save_bulk_edits()
+        return saved_instances
 
-    def action_feature(self, form):
-        form.instance.status = models.Video.ACTIVE
-        form.instance.last_featured = datetime.datetime.now()
+    def save_bulk_edits(self):
+        """
+        Rejects the videos marked for deletion, then applies the bulk edits
+        and action to the selected videos with a few queries, no matter how
+        many videos are selected.
 
-    def action_unfeature(self, form):
-        form.instance.last_featured = None
+        """
+        manager = models.Video.objects
+        if self.rejected_pks:
+            moderation.reject_videos(manager.filter(pk__in=self.rejected_pks))
+        if not self.bulk_pks:
+            return
+        videos = manager.filter(pk__in=self.bulk_pks)
+        edits = dict(self.bulk_edits)
+        if 'categories' in edits:
+            # categories append, not replace
+            moderation.add_video_categories(videos, edits.pop('categories'))
+        if 'authors' in edits:
+            moderation.set_video_authors(videos, edits.pop('authors'))
+        if 'tags' in edits:
+            moderation.set_video_tags(videos, edits.pop('tags'))
+        if edits:
+            moderation.update_videos(videos, **edits)
+        if self.bulk_action:
+            getattr(self, 'action_%s' % self.bulk_action)(videos)
+
+    def action_delete(self, videos):
+        moderation.reject_videos(videos)
+
+    def action_approve(self, videos):
+        moderation.approve_videos(videos.exclude(
+                                         status=models.Video.ACTIVE))
+
+    def action_unapprove(self, videos):
+        moderation.unapprove_videos(videos)
+
+    def action_feature(self, videos):
+        moderation.feature_videos(videos)
+
+    def action_unfeature(self, videos):
+        moderation.unfeature_videos(videos)
 
 
 VideoFormSet = modelformset_factory(models.Video,
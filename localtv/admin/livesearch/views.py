@@ -57,22 +57,16 @@ class LiveSearchSessionMixin(object):
             exclusions['timestamp'] < datetime.now() - timedelta(0, 300)):
             # Initial session should exclude all videos that already exist
             # on the site.
-            website_urls, file_urls = zip(*[(video.website_url, video.file_url)
-                                             for video in results])
-            exclusions = Video.objects.filter(website_url__in=website_urls,
-                                              file_url__in=file_urls
-                                             ).values_list('website_url',
-                                                           'file_url')
-            if exclusions:
-                website_urls, file_urls = map(set, zip(*list(exclusions)))
-                website_urls.discard('')
-                file_urls.discard('')
-            else:
-                website_urls = file_urls = set()
+            existing = Video.objects.filter(
+                site=Site.objects.get_current()
+            ).existing_identifiers(
+                website_urls=[video.website_url for video in results],
+                file_urls=[video.file_url for video in results]
+            )
             exclusions = {
                 'timestamp': datetime.now(),
-                'website_urls': website_urls,
-                'file_urls': file_urls
+                'website_urls': existing['website_url'],
+                'file_urls': existing['file_url']
             }
             self.request.session[cache_key] = exclusions
         return exclusions
@@ -12,6 +12,7 @@ from django.core.urlresolvers import reverse
 from django.views.decorators.csrf import csrf_protect
 
 from localtv.comments.forms import BulkModerateFormSet
+from localtv.models import RecentComment
 
 def post_comment(request, next=None):
     POST = request.POST.copy()
@@ -114,8 +115,11 @@ def undo(request):
     if request.method == 'POST' and 'actions' in request.POST:
         pks = request.POST['actions'].split('-')
         comments = get_comment_model().objects.filter(pk__in=pks)
+        video_pks = list(RecentComment.objects.filter(comment__in=comments
+                                      ).values_list('video', flat=True))
         # hide the comments
         comments.update(is_public=False, is_removed=False)
+        RecentComment.update_for_videos(video_pks)
         # remove flags
         CommentFlag.objects.filter(
             flag__in=(CommentFlag.MODERATOR_DELETION,
@@ -1,6 +1,9 @@
 from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import lazy
 
 from localtv.models import SiteSettings, Video, Category
+from localtv.utils import get_content_version
 
 
 BROWSE_NAVIGATION_MODULES = [
@@ -9,6 +12,27 @@ BROWSE_NAVIGATION_MODULES = [
 ]
 
 
+def _lazy_root_categories(site_pk, version):
+    """
+    Returns a lazy list of the site's root categories, which is only
+    fetched (from the cache, if possible) when a template uses it.
+
+    """
+    categories = []
+
+    def get_categories():
+        if not categories:
+            key = 'localtv:root_categories:%i:%s' % (site_pk, version)
+            cached = cache.get(key)
+            if cached is None:
+                cached = list(Category.objects._mptt_filter(
+                                     site=site_pk, parent__isnull=True))
+                cache.set(key, cached, 60 * 60)
+            categories.append(cached)
+        return categories[0]
+    return lazy(get_categories, list)()
+
+
 def localtv(request):
     site_settings = SiteSettings.objects.get_current()
 
@@ -21,12 +45,7 @@ def localtv(request):
         if request.user_is_admin():
             display_submit_button = True
 
-    try:
-        cache_invalidator = str(Video.objects.order_by(
-                '-when_modified').values_list(
-                'when_modified', flat=True)[0])
-    except IndexError:
-        cache_invalidator = None
+    cache_invalidator = str(get_content_version(site_settings.site_id))
 
     return  {
         'mc_version': '1.2',
@@ -34,8 +53,8 @@ def localtv(request):
         # Backwards-compatible for custom themes.
         'sitelocation': site_settings,
         'user_is_admin': request.user_is_admin(),
-        'categories':  Category.objects._mptt_filter(site=site_settings.site,
-                                                     parent__isnull=True),
+        'categories': _lazy_root_categories(site_settings.site_id,
+                                            cache_invalidator),
         'cache_invalidator': cache_invalidator,
 
         'display_submit_button': display_submit_button,
@@ -9,6 +9,7 @@ from localtv.contrib.contests.forms import ContestAdminForm
 from localtv.contrib.contests.models import (Contest,
                                              UpVotesAggregate,
                                              AllVotesAggregate)
+from localtv.managers import best_date_field
 from localtv.search.views import VIDEOS_PER_PAGE
 from localtv.models import Video, SiteSettings
 from localtv.utils import SortHeaders
@@ -40,9 +41,8 @@ class ContestDetailView(ContestQuerySetMixin, DetailView):
                               ).filter(status=Video.ACTIVE)
         if Contest.NEW in self.object.detail_columns:
             site_settings = SiteSettings.objects.get_current()
-            context['new_videos'] = base_qs.with_best_date(
-                                               site_settings.use_original_date
-                                            ).order_by('-best_date')
+            context['new_videos'] = base_qs.order_by(
+                      '-' + best_date_field(site_settings.use_original_date))
 
         if Contest.RANDOM in self.object.detail_columns:
             context['random_videos'] = base_qs.order_by('?')
@@ -81,8 +81,7 @@ class ContestListingView(ListView):
         return Video.objects.filter(
             status=Video.ACTIVE,
             contestvideo__contest=self.object,
-            site_id=settings.SITE_ID).with_best_date().order_by(
-            '-best_date')
+            site_id=settings.SITE_ID).order_by('-' + best_date_field())
 
 
 class ContestAdminListView(ContestQuerySetMixin, ListView):
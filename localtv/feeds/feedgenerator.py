@@ -14,6 +14,10 @@ class ThumbnailFeedGenerator(feedgenerator.Atom1Feed):
                 value = unicode(self.opensearch_data[key])
                 handler.addQuickElement(name, value)
 
+        if getattr(self, 'next_link', None):
+            handler.addQuickElement('link', '', {'rel': 'next',
+                                                 'href': self.next_link})
+
     def root_attributes(self):
         attrs = feedgenerator.Atom1Feed.root_attributes(self)
         attrs['xmlns:media'] = 'http://search.yahoo.com/mrss/'
@@ -48,6 +52,8 @@ class JSONGenerator(feedgenerator.SyndicationFeed):
         json['link'] = self.feed['link']
         json['id'] = self.feed['id']
         json['updated'] = unicode(self.latest_post_date())
+        if getattr(self, 'next_link', None):
+            json['next'] = self.next_link
 
     def write_items(self, json):
         json['items'] = []
@@ -17,6 +17,7 @@ from localtv.search.forms import ModelFilterField
 from localtv.search.utils import NormalizedVideoList
 from localtv.search.views import SortFilterMixin
 from localtv.templatetags.filters import simpletimesince
+from localtv.utils import get_content_version
 
 
 FLASH_ENCLOSURE_STATIC_LENGTH = 1
@@ -40,8 +41,11 @@ class BaseVideosFeed(FeedView, SortFilterMixin):
             self.feed_type = JSONGenerator
 
     def _get_cache_key(self, request, vary):
-        return u'localtv_feed_cache:%(domain)s:%(class)s:%(vary)s' % {
-            'domain': Site.objects.get_current().domain,
+        site = Site.objects.get_current()
+        return (u'localtv_feed_cache:%(domain)s:%(version)s:%(class)s:'
+                u'%(vary)s') % {
+            'domain': site.domain,
+            'version': get_content_version(site.pk),
             'class': self.__class__.__name__,
             'vary': sha1(force_unicode(vary).replace(' ', '')).hexdigest(),
         }
@@ -120,6 +124,14 @@ class BaseVideosFeed(FeedView, SortFilterMixin):
         """
         feed = super(BaseVideosFeed, self).get_feed(obj, request)
         feed.opensearch_data = self._get_opensearch_data(obj)
+        if obj.get('next_cursor') is not None:
+            query = request.GET.copy()
+            for param in ('startIndex', 'start-index', 'startPage'):
+                query.pop(param, None)
+            query['cursor'] = obj['next_cursor']
+            feed.next_link = request.build_absolute_uri(
+                                       u'?'.join((request.path,
+                                                  query.urlencode())))
         return feed
 
     def _base_link(self, obj):
@@ -153,14 +165,38 @@ class BaseVideosFeed(FeedView, SortFilterMixin):
                 filter_value = [filter_value]
         form = self.get_form(obj['request'].GET.dict(), filter_value)
         items = NormalizedVideoList(form.search())
-        return self._opensearch_items(items, obj)
+        return self._opensearch_items(items, obj, form)
 
-    def _opensearch_items(self, items, obj):
+    def _opensearch_items(self, items, obj, form=None):
+        """
+        Returns the page of ``items`` requested by the opensearch parameters
+        or, if ``form`` has a cursor, the page after the cursor. The cursor
+        for the following page is stored as ``obj['next_cursor']``.
+
+        """
         opensearch = self._get_opensearch_data(obj)
-        start = opensearch['startindex']
-        end = start + opensearch['itemsperpage']
-        opensearch['totalresults'] = len(items)
-        return items[start:end]
+        count = opensearch['itemsperpage']
+        if form is not None and form.uses_cursor(items):
+            results = list(items[:count + 1])
+            page = results[:count]
+            # Counting everything after the cursor would cost as much as
+            # the offset it replaces, so the total is only an estimate: this
+            # page, plus one if there's more.
+            opensearch['startindex'] = 0
+            opensearch['totalresults'] = len(results)
+            has_next = len(results) > count
+        else:
+            start = opensearch['startindex']
+            opensearch['totalresults'] = len(items)
+            page = list(items[start:start + count])
+            # A capped count doesn't say where the results end, but a short
+            # page does.
+            has_next = len(page) == count and (
+                            start + count < opensearch['totalresults'] or
+                            not items.count_is_exact)
+        if has_next and page and form is not None:
+            obj['next_cursor'] = form.get_cursor(items, page[-1])
+        return page
 
     def _get_opensearch_data(self, obj):
         """
@@ -0,0 +1,105 @@
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import connections
+
+from localtv.models import SiteSettings, Video, Feed
+
+
+class Command(NoArgsCommand):
+    """
+    Runs ``EXPLAIN`` on the main video listing, feed and duplicate-check
+    queries and reports any full table scans, so that missing indexes are
+    caught. On PostgreSQL, sequential scans are disabled while explaining, so
+    a scan is only reported if no index can serve the query at all.
+
+    """
+    help = ('Reports full table scans in the plans of the main video '
+            'listing, feed and duplicate-check queries.')
+
+    option_list = (
+        make_option('--database', action='store', dest='database',
+                    default='default',
+                    help='The database to explain the queries against.'),
+    ) + NoArgsCommand.option_list
+
+    #: The number of rows a listing page asks for.
+    page_size = 15
+
+    def get_queries(self, using):
+        """
+        Returns a list of ``(name, queryset)`` pairs for the queries to
+        explain.
+
+        """
+        site_settings = SiteSettings.objects.get_cached(site=settings.SITE_ID,
+                                                        using=using)
+        videos = Video.objects.db_manager(using)
+        queries = [
+            ('latest', videos.get_latest_videos(site_settings)),
+            ('featured', videos.get_featured_videos(site_settings)),
+            ('approved', videos.get_site_settings_videos(site_settings
+                                          ).order_by('-when_approved')),
+        ]
+        feeds = Feed.objects.using(using).filter(site=settings.SITE_ID)
+        for feed in feeds.order_by('pk')[:1]:
+            queries.append(('feed', videos.in_feed_order(feed,
+                                                          site_settings)))
+        queries = [(name, queryset[:self.page_size])
+                   for name, queryset in queries]
+        existing = videos.filter(site=settings.SITE_ID
+                               ).exclude(status=Video.REJECTED)
+        queries.append(('duplicates', existing.matching_identifiers(
+                             guids=['guid'],
+                             website_urls=['http://example.com/'],
+                             file_urls=['http://example.com/video.mp4'])))
+        return queries
+
+    def explain(self, connection, sql, params):
+        """
+        Returns a list of descriptions of the full table scans in the plan for
+        ``sql``.
+
+        """
+        cursor = connection.cursor()
+        vendor = connection.vendor
+        if vendor == 'postgresql':
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                cursor.execute('EXPLAIN ' + sql, params)
+                rows = cursor.fetchall()
+            finally:
+                cursor.execute('RESET enable_seqscan')
+            return [row[0].strip() for row in rows if 'Seq Scan' in row[0]]
+        elif vendor == 'mysql':
+            cursor.execute('EXPLAIN ' + sql, params)
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            return ['Full scan on %s' % row['table'] for row in rows
+                    if row['type'] == 'ALL']
+        elif vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            details = [row[-1] for row in cursor.fetchall()]
+            return [detail for detail in details
+                    if detail.startswith('SCAN ') and 'INDEX' not in detail]
+        raise CommandError("Can't explain queries on %s." % vendor)
+
+    def handle_noargs(self, **options):
+        using = options['database']
+        connection = connections[using]
+        verbosity = int(options['verbosity'])
+        failures = 0
+        for name, queryset in self.get_queries(using):
+            sql, params = queryset.query.get_compiler(using).as_sql()
+            scans = self.explain(connection, sql, params)
+            if scans:
+                failures += 1
+                self.stdout.write('%s: %i full table scan(s)\n' % (
+                                  name, len(scans)))
+                for scan in scans:
+                    self.stdout.write('    %s\n' % scan)
+            elif verbosity > 1:
+                self.stdout.write('%s: ok\n' % name)
+        if failures:
+            raise CommandError('%i queries use full table scans.' % failures)
@@ -0,0 +1,27 @@
+from optparse import make_option
+
+from django.core.management.base import LabelCommand
+
+from localtv.management import site_too_old
+from localtv.settings import WATCH_RETENTION_DAYS
+
+
+class Command(LabelCommand):
+    option_list = (
+        make_option('--days', action='store', dest='days',
+                    default=WATCH_RETENTION_DAYS, type='int',
+                    help='The number of days of raw watches to keep.'),
+        make_option('--batch-size', action='store', dest='batch_size',
+                    default=1000, type='int',
+                    help='The number of watches to roll up per transaction.'),
+    ) + LabelCommand.option_list
+
+    def handle(self, **options):
+        if site_too_old():
+            return
+
+        from localtv.tasks import rollup_watches, CELERY_USING
+
+        rollup_watches.delay(days=options['days'],
+                             batch_size=options['batch_size'],
+                             using=CELERY_USING)
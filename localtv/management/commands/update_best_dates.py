@@ -0,0 +1,23 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from localtv.management import site_too_old
+from localtv.models import Video
+
+
+class Command(NoArgsCommand):
+    option_list = (
+        make_option('--batch-size', action='store', dest='batch_size',
+                    default=1000, type='int',
+                    help='The number of videos to update per transaction.'),
+        make_option('--database', action='store', dest='database',
+                    default='default',
+                    help='The database to update.'),
+    ) + NoArgsCommand.option_list
+
+    def handle_noargs(self, **options):
+        if site_too_old():
+            return
+        Video.update_best_dates(batch_size=options['batch_size'],
+                                using=options['database'])
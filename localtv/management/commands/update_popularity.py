@@ -1,27 +1,22 @@
-from datetime import datetime, timedelta
 from optparse import make_option
 
 from django.core.management.base import LabelCommand
 
 from localtv.management import site_too_old
-from localtv.models import Video
 
 
 class Command(LabelCommand):
     option_list = (
+        # Kept so that existing cron jobs which pass it don't break.
         make_option('--since', action='store', dest='since', default=11,
-                    type='int', help='The number of days in the past for which all watched videos should be reindexed.'),
+                    type='int', help='Deprecated and ignored; only videos '
+                    'whose watch count changed are reindexed.'),
     ) + LabelCommand.option_list
 
     def handle(self, **options):
         if site_too_old():
             return
 
-        since = options['since']
-        from localtv.tasks import haystack_batch_update, CELERY_USING
+        from localtv.tasks import update_popularity, CELERY_USING
 
-        haystack_batch_update.delay(Video._meta.app_label,
-                                    Video._meta.module_name,
-                                    start=datetime.now() - timedelta(since),
-                                    date_lookup='watch__timestamp',
-                                    using=CELERY_USING)
+        update_popularity.delay(using=CELERY_USING)
@@ -1,41 +1,98 @@
-import datetime
+import uuid
 
 from django.conf import settings
 from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.db import models
 
 
 EMPTY = object()
 
 
+def best_date_field(use_original_date=True):
+    """
+    Returns the name of the :class:`.Video` field holding its best date.
+
+    """
+    if use_original_date:
+        return 'best_date_with_published'
+    return 'best_date'
+
+
 class SiteRelatedManager(models.Manager):
     """
     Returns an object related to a site. That object will be cached heavily
     according to the site id and database. If the object does not exist, it
     will be created.
 
+    Cached objects are kept across requests. Each save stamps a new version
+    in the Django cache, and the first lookup in each request (see
+    :meth:`mark_unverified`) compares the local copy's version against it, so
+    a process only queries the database again when the object has changed.
+
     """
+    #: How long version stamps are kept in the Django cache.
+    version_timeout = 60 * 60 * 24 * 30
+
     def __init__(self):
         super(SiteRelatedManager, self).__init__()
         self._cache = {}
+        self._versions = {}
+        self._verified = set()
+
+    def _version_key(self, using, site_pk):
+        opts = self.model._meta
+        return 'localtv:%s.%s:%s:%i:version' % (opts.app_label,
+                                                opts.module_name, using,
+                                                site_pk)
+
+    def _get_version(self, using, site_pk):
+        """
+        Returns the current version stamp for the instance, creating one if
+        the cache doesn't have it.
+
+        """
+        key = self._version_key(using, site_pk)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, uuid.uuid4().hex, self.version_timeout)
+            version = cache.get(key)
+        return version
+
+    def _bump_version(self, using, site_pk):
+        version = uuid.uuid4().hex
+        cache.set(self._version_key(using, site_pk), version,
+                  self.version_timeout)
+        return version
 
     def get_cached(self, site, using):
         # Make sure we're dealing with a primary key.
         if isinstance(site, Site):
             site = site.pk
         site_pk = int(site)
-        if (using, site_pk) not in self._cache:
+        key = (using, site_pk)
+        if key in self._cache and key not in self._verified:
+            if self._versions.get(key) != self._get_version(using, site_pk):
+                del self._cache[key]
+            else:
+                self._verified.add(key)
+        if key not in self._cache:
+            version = self._get_version(using, site_pk)
             try:
-                instance = self.select_related().get(site=site_pk)
+                instance = self.db_manager(using).select_related().get(
+                                                                 site=site_pk)
             except self.model.DoesNotExist:
                 try:
                     site = Site.objects.using(using).get(pk=site_pk)
                 except Site.DoesNotExist:
                     raise self.model.DoesNotExist
                 instance = self._new_entry(site, using)
-            self._cache[(using, site_pk)] = instance
+            else:
+                self._cache[key] = instance
+                self._versions[key] = version
+            self._verified.add(key)
 
-        return self._cache[(using, site_pk)]
+        return self._cache[key]
 
     def _new_entry(self, site, using):
         """Creates and returns a new entry for the cache."""
@@ -52,9 +109,22 @@ class SiteRelatedManager(models.Manager):
 
     def clear_cache(self):
         self._cache = {}
+        self._versions = {}
+        self._verified = set()
+
+    def mark_unverified(self):
+        """
+        Makes the next lookup of each cached instance check its version.
+        This should be called at the end of each request.
+
+        """
+        self._verified = set()
 
     def _post_save(self, sender, instance, created, raw, using, **kwargs):
-        self._cache[(using, instance.site_id)] = instance
+        key = (using, instance.site_id)
+        self._versions[key] = self._bump_version(*key)
+        self._cache[key] = instance
+        self._verified.add(key)
 
     def contribute_to_class(self, model, name):
         # In addition to the normal contributions, we also attach a post-save
@@ -67,30 +137,67 @@ class SiteRelatedManager(models.Manager):
 
 class VideoQuerySet(models.query.QuerySet):
 
-    def with_best_date(self, use_original_date=True):
-        if use_original_date:
-            published = 'localtv_video.when_published,'
-        else:
-            published = ''
-        return self.extra(select={'best_date': """
-COALESCE(%slocaltv_video.when_approved,
-localtv_video.when_submitted)""" % published})
+    def matching_identifiers(self, guids=(), website_urls=(), file_urls=()):
+        """
+        Returns a QuerySet of videos which have any of the given ``guids``,
+        ``website_urls`` or ``file_urls``. Urls are compared through their
+        indexed hashes, so this runs as a single indexed query no matter how
+        many identifiers are given.
 
-    def _popular_q(self, since=EMPTY):
-        if since is EMPTY:
-            since = datetime.datetime.now() - datetime.timedelta(days=7)
+        """
+        from localtv.utils import hash_url
+        guids = set(guid for guid in guids if guid)
+        website_urls = set(url for url in website_urls if url)
+        file_urls = set(url for url in file_urls if url)
+        q_filter = models.Q()
+        if guids:
+            q_filter |= models.Q(guid__in=guids)
+        if website_urls:
+            q_filter |= models.Q(website_url_hash__in=[
+                                       hash_url(url) for url in website_urls])
+        if file_urls:
+            q_filter |= models.Q(file_url_hash__in=[
+                                          hash_url(url) for url in file_urls])
+        if not q_filter:
+            return self.none()
+        return self.filter(q_filter)
+
+    def existing_identifiers(self, guids=(), website_urls=(), file_urls=()):
+        """
+        Returns a dictionary mapping ``'guid'``, ``'website_url'`` and
+        ``'file_url'`` to the sets of values which are already used by videos
+        in this QuerySet, out of the identifiers given. Runs a single query.
 
-        return models.Q(watch__timestamp__gte=since)
+        """
+        existing = {'guid': set(), 'website_url': set(), 'file_url': set()}
+        rows = self.matching_identifiers(guids, website_urls, file_urls
+                           ).values_list('guid', 'website_url', 'file_url')
+        for guid, website_url, file_url in rows:
+            existing['guid'].add(guid)
+            existing['website_url'].add(website_url)
+            existing['file_url'].add(file_url)
+        for values in existing.values():
+            values.discard('')
+        # Hash collisions are unlikely, but we only report exact matches.
+        existing['guid'] &= set(guids)
+        existing['website_url'] &= set(website_urls)
+        existing['file_url'] &= set(file_urls)
+        return existing
 
     def popular(self, since=EMPTY):
         """
         Returns a QuerySet of videos which have been watched since ``since``,
-        sorted by the number of watches since then.
+        sorted by the number of watches since then. By default, this uses the
+        materialized :attr:`Video.watch_count`; other values of ``since`` are
+        summed from the hourly watch buckets, which are only kept for the
+        popularity window.
 
         """
-        return self.filter(self._popular_q(since)
-                  ).distinct().annotate(watch_count=models.Count('watch')
-                  ).order_by('-watch_count')
+        if since is EMPTY:
+            return self.filter(watch_count__gt=0).order_by('-watch_count')
+        return self.filter(watchbucket__hour__gte=since
+                  ).annotate(watches_since=models.Sum('watchbucket__count')
+                  ).order_by('-watches_since')
 
     def not_popular(self, since=EMPTY):
         """
@@ -98,7 +205,9 @@ localtv_video.when_submitted)""" % published})
         ``since``.
 
         """
-        return self.filter(~self._popular_q(since)).distinct()
+        if since is EMPTY:
+            return self.filter(watch_count=0)
+        return self.exclude(watchbucket__hour__gte=since)
 
 
 class VideoManager(models.Manager):
@@ -106,12 +215,21 @@ class VideoManager(models.Manager):
     def get_query_set(self):
         return VideoQuerySet(self.model, using=self._db)
 
-    def with_best_date(self, *args, **kwargs):
-        return self.get_query_set().with_best_date(*args, **kwargs)
-
     def popular_since(self, *args, **kwargs):
         return self.get_query_set().popular_since(*args, **kwargs)
 
+    def popular(self, *args, **kwargs):
+        return self.get_query_set().popular(*args, **kwargs)
+
+    def not_popular(self, *args, **kwargs):
+        return self.get_query_set().not_popular(*args, **kwargs)
+
+    def matching_identifiers(self, *args, **kwargs):
+        return self.get_query_set().matching_identifiers(*args, **kwargs)
+
+    def existing_identifiers(self, *args, **kwargs):
+        return self.get_query_set().existing_identifiers(*args, **kwargs)
+
     def get_site_settings_videos(self, site_settings=None):
         """
         Returns a QuerySet of videos which are active and tied to the
@@ -147,9 +265,8 @@ class VideoManager(models.Manager):
         if site_settings is None:
             from localtv.models import SiteSettings
             site_settings = SiteSettings.objects.get_current()
-        return self.get_site_settings_videos(site_settings).with_best_date(
-            site_settings.use_original_date
-        ).order_by('-best_date')
+        return self.get_site_settings_videos(site_settings).order_by(
+            '-' + best_date_field(site_settings.use_original_date))
 
     def get_popular_videos(self, site_settings=None):
         """
@@ -172,9 +289,7 @@ class VideoManager(models.Manager):
         # category.approved_set already checks active().
         return category.approved_set.filter(
             site=site_settings.site
-        ).with_best_date(
-            site_settings.use_original_date
-        ).order_by('-best_date')
+        ).order_by('-' + best_date_field(site_settings.use_original_date))
 
     def get_tag_videos(self, tag, site_settings=None):
         """
@@ -200,7 +315,7 @@ class VideoManager(models.Manager):
         """
         return self.get_latest_videos(site_settings).filter(
             models.Q(authors=author) | models.Q(user=author)
-        ).distinct().order_by('-best_date')
+        ).distinct()
 
     def in_feed_order(self, feed=None, site_settings=None):
         """
@@ -1,12 +1,17 @@
+import atexit
 import datetime
 import itertools
 import re
 import urllib2
 import mimetypes
-import operator
 import logging
+import math
+import random
 import sys
+import threading
+import time
 import traceback
+import urlparse
 
 import tagging
 import tagging.models
@@ -14,17 +19,21 @@ import vidscraper
 from bs4 import BeautifulSoup
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib import comments
 from django.contrib.comments.moderation import CommentModerator, moderator
 from django.contrib.sites.models import Site
 from django.contrib.contenttypes import generic
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.mail import EmailMessage
 from django.core.signals import request_finished
 from django.core.validators import ipv4_re
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.template import Context, loader
 from django.template.defaultfilters import slugify
 from django.utils.html import escape as html_escape
+from django.utils.http import http_date
 from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext_lazy as _
 from haystack import connections
@@ -276,10 +285,91 @@ class Source(Thumbnailable):
     auto_categories = models.ManyToManyField("Category", blank=True)
     auto_authors = models.ManyToManyField("auth.User", blank=True,
                                           related_name='auto_%(class)s_set')
+    #: The number of seconds to wait between updates of this source. If this
+    #: is ``None``, ``LOCALTV_SOURCE_UPDATE_INTERVAL`` is used.
+    update_interval = models.PositiveIntegerField(blank=True, null=True)
+    #: When this source is next due to be updated; ``None`` means right away.
+    next_update = models.DateTimeField(blank=True, null=True, db_index=True)
 
     class Meta:
         abstract = True
 
+    def get_update_host(self):
+        """
+        Returns the host which updates of this source are fetched from, for
+        limiting the number of concurrent updates per host. Must be
+        implemented by subclasses.
+
+        """
+        raise NotImplementedError
+
+    def get_update_delay(self, interval=None):
+        """
+        Returns a :class:`datetime.timedelta` of ``interval`` seconds
+        (default: this source's current interval), randomly spread out by
+        ``LOCALTV_SOURCE_UPDATE_JITTER``.
+
+        """
+        if interval is None:
+            interval = (self.update_interval or
+                        lsettings.SOURCE_UPDATE_INTERVAL)
+        jitter = lsettings.SOURCE_UPDATE_JITTER
+        return datetime.timedelta(
+                seconds=interval * random.uniform(1 - jitter, 1 + jitter))
+
+    def get_adaptive_interval(self, using='default'):
+        """
+        Returns an update interval (in seconds) based on how many of this
+        source's last ``LOCALTV_SOURCE_UPDATE_HISTORY`` finished imports found
+        videos. If all of them did, the interval is
+        ``LOCALTV_SOURCE_UPDATE_MIN_INTERVAL``; if none of them did, it's
+        ``LOCALTV_SOURCE_UPDATE_MAX_INTERVAL``, with a logarithmic scale in
+        between. Imports which haven't happened yet count as if they'd lead to
+        ``LOCALTV_SOURCE_UPDATE_INTERVAL``, so new sources start out there.
+        The minimum interval and the history are at least 1.
+
+        """
+        min_interval = max(1, lsettings.SOURCE_UPDATE_MIN_INTERVAL)
+        max_interval = lsettings.SOURCE_UPDATE_MAX_INTERVAL
+        if max_interval <= min_interval:
+            return max_interval
+        history = max(1, lsettings.SOURCE_UPDATE_HISTORY)
+        import_class = self.imports.model
+        counts = list(self.imports.using(using).filter(
+                    status__in=(import_class.COMPLETE, import_class.FAILED)
+                    ).order_by('-start').values_list('videos_imported',
+                                                     flat=True)[:history])
+        found = len([count for count in counts if count])
+
+        scale = math.log(float(max_interval) / min_interval)
+        default = max(min_interval, min(lsettings.SOURCE_UPDATE_INTERVAL,
+                                        max_interval))
+        default_rate = math.log(float(max_interval) / default) / scale
+        rate = (found + default_rate * (history - len(counts))) / history
+        return int(round(max_interval * math.exp(-rate * scale)))
+
+    def schedule_next_update(self, not_modified=False, using='default'):
+        """
+        Adapts this source's update interval to its recent import history
+        (see :meth:`get_adaptive_interval`) and schedules the next update. If
+        the source was ``not_modified``, there's no new import to go by, so
+        the interval grows by half instead, up to
+        ``LOCALTV_SOURCE_UPDATE_MAX_INTERVAL``.
+
+        """
+        if not_modified:
+            interval = (self.update_interval or
+                        lsettings.SOURCE_UPDATE_INTERVAL) * 3 // 2
+            interval = max(lsettings.SOURCE_UPDATE_MIN_INTERVAL,
+                           min(interval, lsettings.SOURCE_UPDATE_MAX_INTERVAL))
+        else:
+            interval = self.get_adaptive_interval(using)
+        self.update_interval = interval
+        self.next_update = datetime.datetime.now() + self.get_update_delay()
+        self.__class__._default_manager.using(using).filter(pk=self.pk
+                        ).update(update_interval=self.update_interval,
+                                 next_update=self.next_update)
+
     def update(self, video_iter, source_import, using='default',
                clear_rejected=False):
         """
@@ -291,6 +381,10 @@ class Source(Thumbnailable):
         If ``clear_rejected`` is ``True``, rejected versions of videos that are
         found in the ``video_iter`` will be deleted and re-imported.
 
+        If ``LOCALTV_IMPORT_BATCH_SIZE`` is greater than 1, the videos are
+        sent to the import tasks in batches of that size rather than one at a
+        time.
+
         """
         author_pks = list(self.auto_authors.values_list('pk', flat=True))
         category_pks = list(self.auto_categories.values_list('pk', flat=True))
@@ -299,23 +393,34 @@ class Source(Thumbnailable):
 
         from localtv.tasks import video_from_vidscraper_video, mark_import_pending
 
+        task_kwargs = {
+            'site_pk': self.site_id,
+            'import_app_label': import_opts.app_label,
+            'import_model': import_opts.module_name,
+            'import_pk': source_import.pk,
+            'status': Video.PENDING,
+            'author_pks': author_pks,
+            'category_pks': category_pks,
+            'clear_rejected': clear_rejected,
+            'using': using,
+        }
+        batch_size = lsettings.IMPORT_BATCH_SIZE
+
         total_videos = 0
+        batch = []
 
         try:
             for vidscraper_video in video_iter:
                 total_videos += 1
+                if batch_size > 1:
+                    batch.append(vidscraper_video)
+                    if len(batch) >= batch_size:
+                        self._enqueue_batch(batch, source_import, task_kwargs)
+                        batch = []
+                    continue
                 try:
-                    video_from_vidscraper_video.delay(
-                        vidscraper_video,
-                        site_pk=self.site_id,
-                        import_app_label=import_opts.app_label,
-                        import_model=import_opts.module_name,
-                        import_pk=source_import.pk,
-                        status=Video.PENDING,
-                        author_pks=author_pks,
-                        category_pks=category_pks,
-                        clear_rejected=clear_rejected,
-                        using=using)
+                    video_from_vidscraper_video.delay(vidscraper_video,
+                                                      **task_kwargs)
                 except Exception:
                     source_import.handle_error(
                         'Import task creation failed for %r' % (
@@ -323,6 +428,8 @@ class Source(Thumbnailable):
                         is_skip=True,
                         with_exception=True,
                         using=using)
+            if batch:
+                self._enqueue_batch(batch, source_import, task_kwargs)
         except Exception:
             source_import.fail(with_exception=True, using=using)
             return
@@ -337,6 +444,26 @@ class Source(Thumbnailable):
                                   import_pk=source_import.pk,
                                   using=using)
 
+    def _enqueue_batch(self, vidscraper_videos, source_import, task_kwargs):
+        """
+        Sends a batch of :class:`vidscraper.videos.Video` instances to a
+        single import task. If the task can't be created, each video in the
+        batch is recorded as skipped.
+
+        """
+        from localtv.tasks import video_from_vidscraper_videos
+        try:
+            video_from_vidscraper_videos.delay(vidscraper_videos,
+                                               **task_kwargs)
+        except Exception:
+            for vidscraper_video in vidscraper_videos:
+                source_import.handle_error(
+                    'Import task creation failed for %r' % (
+                        vidscraper_video.url,),
+                    is_skip=True,
+                    with_exception=True,
+                    using=task_kwargs['using'])
+
 
 class Feed(Source):
     """
@@ -408,22 +535,41 @@ class Feed(Source):
             logging.info('Skipping import of %s: already in progress' % self)
             return
 
-        feed_import = FeedImport.objects.db_manager(using).create(source=self,
-                                                auto_approve=self.auto_approve)
-
         video_iter = vidscraper.auto_feed(
             self.feed_url,
             max_results=None if self.status == self.INACTIVE else 100,
             api_keys=lsettings.API_KEYS,
         )
+        if self.status == self.ACTIVE:
+            video_iter.headers = dict(video_iter.headers,
+                                      **self._get_conditional_headers())
 
         try:
-            video_iter.load()
+            # Fetch the first page before loading it, so that a "304 Not
+            # Modified" response is caught before vidscraper tries to parse
+            # it.
+            video_iter._next_page()
+            not_modified = utils.is_not_modified(video_iter._response)
+            if not not_modified:
+                video_iter.load()
         except Exception:
+            feed_import = FeedImport.objects.db_manager(using).create(
+                                source=self, auto_approve=self.auto_approve)
             feed_import.fail("Data loading failed for {source}",
                              with_exception=True, using=using)
             return
 
+        if not_modified:
+            logging.info('Skipping import of %s: not modified' % self)
+            self.last_updated = datetime.datetime.now()
+            Feed.objects.using(using).filter(pk=self.pk).update(
+                                            last_updated=self.last_updated)
+            self.schedule_next_update(not_modified=True, using=using)
+            return
+
+        feed_import = FeedImport.objects.db_manager(using).create(source=self,
+                                                auto_approve=self.auto_approve)
+
         self.etag = getattr(video_iter, 'etag', None) or ''
         self.last_updated = datetime.datetime.now()
         if self.status == self.INACTIVE:
@@ -441,6 +587,23 @@ class Feed(Source):
         super(Feed, self).update(video_iter, source_import=feed_import,
                                  using=using, **kwargs)
 
+    def get_update_host(self):
+        return urlparse.urlsplit(self.feed_url).netloc.lower()
+
+    def _get_conditional_headers(self):
+        """
+        Returns the headers which let the feed's server answer with "304 Not
+        Modified" if the feed hasn't changed since it was last fetched.
+
+        """
+        headers = {
+            'If-Modified-Since': http_date(
+                                    time.mktime(self.last_updated.timetuple()))
+        }
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        return headers
+
     def source_type(self):
         return self.calculated_source_type
 
@@ -548,16 +711,9 @@ class Category(MPTTModel):
         by decreasing best date.
 
         """
-        opts = self._mptt_meta
-
-        lookups = {
-            'status': Video.ACTIVE,
-            'categories__left__gte': getattr(self, opts.left_attr),
-            'categories__left__lte': getattr(self, opts.right_attr),
-            'categories__tree_id': getattr(self, opts.tree_id_attr)
-        }
-        lookups = self._tree_manager._translate_lookups(**lookups)
-        return Video.objects.filter(**lookups).distinct()
+        return Video.objects.using(self._state.db).filter(
+                        status=Video.ACTIVE,
+                        categorymembership__category=self)
     approved_set = property(approved_set)
 
     def unique_error_message(self, model_class, unique_check):
@@ -628,6 +784,11 @@ class SavedSearch(Source):
             search_import.fail("All searches failed for {source}",
                                with_exception=False, using=using)
 
+    def get_update_host(self):
+        # Saved searches hit all of the search suites, so they are limited
+        # as a single group.
+        return u'search'
+
     def source_type(self):
         return u'Search'
 
@@ -689,6 +850,9 @@ class SourceImport(models.Model):
     auto_approve = models.BooleanField()
     status = models.CharField(max_length=10, choices=STATUS_CHOICES,
                               default=STARTED)
+    #: The number of haystack update batches which still need to run before
+    #: the import is complete.
+    index_batches_pending = models.PositiveIntegerField(default=0)
 
     class Meta:
         get_latest_by = 'start'
@@ -741,6 +905,7 @@ class SourceImport(models.Model):
         if is_skip:
             self.__class__._default_manager.using(using).filter(pk=self.pk
                         ).update(videos_skipped=models.F('videos_skipped') + 1)
+            self.check_videos_handled(using)
 
     def get_index_creation_kwargs(self, video, vidscraper_video):
         return {
@@ -762,6 +927,48 @@ class SourceImport(models.Model):
                     **self.get_index_creation_kwargs(video, vidscraper_video))
         self.__class__._default_manager.using(using).filter(pk=self.pk
                     ).update(videos_imported=models.F('videos_imported') + 1)
+        self.check_videos_handled(using)
+
+    def handle_videos(self, videos, using='default'):
+        """
+        Batched version of :meth:`handle_video`. Creates the index instances
+        for all the ``videos`` in a single query. Each video is expected to
+        have the ``_vidscraper_video`` attribute set by
+        :meth:`Video.from_vidscraper_video`.
+
+        """
+        if not videos:
+            return
+        index_model = self.indexes.model
+        index_model._default_manager.db_manager(using).bulk_create([
+            index_model(**self.get_index_creation_kwargs(video,
+                                                 video._vidscraper_video))
+            for video in videos])
+        self.__class__._default_manager.using(using).filter(pk=self.pk
+            ).update(videos_imported=models.F('videos_imported') + len(videos))
+        self.check_videos_handled(using)
+
+    def check_videos_handled(self, using='default'):
+        """
+        Queues :func:`localtv.tasks.mark_import_pending` if every video in
+        the import has been imported or skipped, according to the atomically
+        updated counters. This is called whenever the counters change, so
+        that the import moves on as soon as its last video is handled.
+
+        """
+        handled = self.__class__._default_manager.using(using).filter(
+            pk=self.pk,
+            status=self.STARTED,
+            total_videos__isnull=False,
+            total_videos__lte=(models.F('videos_imported') +
+                               models.F('videos_skipped'))).exists()
+        if handled:
+            from localtv.tasks import mark_import_pending
+            opts = self._meta
+            mark_import_pending.delay(import_app_label=opts.app_label,
+                                      import_model=opts.module_name,
+                                      import_pk=self.pk,
+                                      using=using)
 
     def fail(self, message="Import failed for {source}", with_exception=False,
              using='default'):
@@ -775,6 +982,7 @@ class SourceImport(models.Model):
         self.handle_error(message.format(source=self.source),
                           with_exception=with_exception, using=using)
         self.get_videos(using).delete()
+        self.source.schedule_next_update(using=using)
 
 
 class FeedImport(SourceImport):
@@ -872,8 +1080,18 @@ class Video(Thumbnailable):
     when_submitted = models.DateTimeField(auto_now_add=True)
     when_approved = models.DateTimeField(null=True, blank=True)
     when_published = models.DateTimeField(null=True, blank=True)
+    #: The approval (or submission) date, stored so that "newest" listings
+    #: can be sorted with an index.
+    best_date = models.DateTimeField(null=True, db_index=True, editable=False)
+    #: The publish date, falling back to :attr:`best_date`.
+    best_date_with_published = models.DateTimeField(null=True, db_index=True,
+                                                    editable=False)
     last_featured = models.DateTimeField(null=True, blank=True)
     status = models.IntegerField(choices=STATUS_CHOICES, default=UNAPPROVED)
+    #: The number of watches during the popularity window. This is
+    #: recomputed from :class:`WatchBucket` by :meth:`WatchBucket.update_watch_counts`.
+    watch_count = models.PositiveIntegerField(default=0, db_index=True,
+                                              editable=False)
     feed = models.ForeignKey(Feed, null=True, blank=True)
     website_url = models.URLField(
         verbose_name='Original Video Page URL (optional)',
@@ -884,6 +1102,12 @@ class Video(Thumbnailable):
     flash_enclosure_url = models.URLField(verify_exists=False, max_length=2048,
                                           blank=True)
     guid = models.CharField(max_length=250, blank=True)
+    #: Hashes of the website_url and file_url, for indexed duplicate lookups.
+    #: These are indexed together with the site.
+    website_url_hash = models.CharField(max_length=40, blank=True,
+                                        editable=False)
+    file_url_hash = models.CharField(max_length=40, blank=True,
+                                     editable=False)
     user = models.ForeignKey('auth.User', null=True, blank=True)
     search = models.ForeignKey(SavedSearch, null=True, blank=True)
     video_service_user = models.CharField(max_length=250, blank=True)
@@ -907,8 +1131,7 @@ class Video(Thumbnailable):
         return self.name
 
     def clean(self):
-        if not self.embed_code and not self.file_url:
-            raise ValidationError("Video has no embed code or file url.")
+        self.clean_media()
 
         qs = Video.objects.using(self._state.db).filter(site=self.site_id
                                               ).exclude(status=Video.REJECTED)
@@ -916,39 +1139,45 @@ class Video(Thumbnailable):
         if self.pk is not None:
             qs = qs.exclude(pk=self.pk)
 
-        if self.guid and qs.filter(guid=self.guid).exists():
+        existing = qs.existing_identifiers(guids=[self.guid],
+                                           website_urls=[self.website_url],
+                                           file_urls=[self.file_url])
+
+        if existing['guid']:
             raise ValidationError("Another video with the same guid "
                                   "already exists.")
 
-        if (self.website_url and
-            qs.filter(website_url=self.website_url).exists()):
+        if existing['website_url']:
             raise ValidationError("Another video with the same website url "
                                   "already exists.")
 
-        if self.file_url and qs.filter(file_url=self.file_url).exists():
+        if existing['file_url']:
             raise ValidationError("Another video with the same file url "
                                   "already exists.")
 
+    def clean_media(self):
+        """
+        Checks that the video has something to play; this is the part of
+        :meth:`clean` which doesn't need to query the database.
+
+        """
+        if not self.embed_code and not self.file_url:
+            raise ValidationError("Video has no embed code or file url.")
+
     def clear_rejected_duplicates(self):
         """
         Deletes rejected copies of this video based on the file_url,
         website_url, and guid fields.
 
         """
-        if not any((self.website_url, self.file_url, self.guid)):
-            return
-
-        q_filter = models.Q()
-        if self.website_url:
-            q_filter |= models.Q(website_url=self.website_url)
-        if self.file_url:
-            q_filter |= models.Q(file_url=self.file_url)
-        if self.guid:
-            q_filter |= models.Q(guid=self.guid)
-        qs = Video.objects.using(self._state.db).filter(
+        Video.objects.using(self._state.db).filter(
             site=self.site_id,
-            status=Video.REJECTED).filter(q_filter)
-        qs.delete()
+            status=Video.REJECTED
+        ).matching_identifiers(
+            guids=[self.guid],
+            website_urls=[self.website_url],
+            file_urls=[self.file_url]
+        ).delete()
 
     @models.permalink
     def get_absolute_url(self):
@@ -1031,36 +1260,11 @@ class Video(Thumbnailable):
             if authors:
                 instance.authors = authors
             if video.user:
-                name = video.user
-                if ' ' in name:
-                    first, last = name.split(' ', 1)
-                else:
-                    first, last = name, ''
-                author, created = User.objects.db_manager(using).get_or_create(
-                    username=name[:30],
-                    defaults={'first_name': first[:30],
-                              'last_name': last[:30]})
-                if created:
-                    author.set_unusable_password()
-                    author.save()
-                    utils.get_profile_model()._default_manager.db_manager(using
-                        ).create(user=author, website=video.user_url or '')
-                instance.authors.add(author)
+                instance.authors.add(cls._get_vidscraper_author_pk(
+                                                video, using, source_import))
             if categories:
                 instance.categories = categories
-            if video.tags:
-                if settings.FORCE_LOWERCASE_TAGS:
-                    fix = lambda t: t.lower().strip()
-                else:
-                    fix = lambda t: t.strip()
-                tags = set(fix(tag) for tag in video.tags if tag.strip())
-                for tag_name in tags:
-                    tag, created = \
-                        tagging.models.Tag._default_manager.db_manager(
-                        using).get_or_create(name=tag_name)
-                    tagging.models.TaggedItem._default_manager.db_manager(
-                        using).create(
-                        tag=tag, object=instance)
+            cls._save_vidscraper_tags([instance], using)
             if source_import is not None:
                 source_import.handle_video(instance, video, using)
             post_video_from_vidscraper.send(sender=cls, instance=instance,
@@ -1077,6 +1281,148 @@ class Video(Thumbnailable):
             instance.save_m2m = save_m2m
         return instance
 
+    @classmethod
+    def bulk_save_m2m(cls, videos, using='default', source_import=None,
+                      authors=None, categories=None, update_index=True):
+        """
+        Batched version of the ``save_m2m()`` method which
+        :meth:`from_vidscraper_video` attaches to unsaved instances. The
+        ``videos`` must already be saved. Author, category and import index
+        rows for the whole batch are created with one query each.
+
+        """
+        if not videos:
+            return
+        author_pks = set(author.pk for author in authors or ())
+        author_rows = set()
+        category_rows = set()
+        for instance in videos:
+            video = instance._vidscraper_video
+            video_authors = set(author_pks)
+            if video.user:
+                video_authors.add(cls._get_vidscraper_author_pk(
+                                                video, using, source_import))
+            author_rows.update((instance.pk, pk) for pk in video_authors)
+            category_rows.update((instance.pk, category.pk)
+                                 for category in categories or ())
+        cls._save_vidscraper_tags(videos, using)
+
+        through = cls.authors.through
+        through._default_manager.db_manager(using).bulk_create([
+            through(video_id=video_pk, user_id=user_pk)
+            for video_pk, user_pk in author_rows])
+        through = cls.categories.through
+        through._default_manager.db_manager(using).bulk_create([
+            through(video_id=video_pk, category_id=category_pk)
+            for video_pk, category_pk in category_rows])
+        CategoryMembership.update_for_videos(
+            [video_pk for video_pk, category_pk in category_rows], using=using)
+
+        if source_import is not None:
+            source_import.handle_videos(videos, using)
+        for instance in videos:
+            post_video_from_vidscraper.send(sender=cls, instance=instance,
+                                   vidscraper_video=instance._vidscraper_video,
+                                   using=using)
+        if update_index:
+            from localtv.tasks import haystack_update
+            index = connections[using].get_unified_index().get_index(cls)
+            index._enqueue(cls._meta.app_label, cls._meta.module_name,
+                           [instance.pk for instance in videos],
+                           haystack_update, using=using)
+
+    #: Maps (database, import, author name) to the pks of the users created
+    #: for vidscraper authors, so that each import only needs to look up each
+    #: of its authors once.
+    _vidscraper_author_cache = utils.LRUCache(1000)
+
+    @classmethod
+    def _get_vidscraper_author_pk(cls, video, using='default',
+                                  source_import=None):
+        """
+        Returns the pk of the :class:`User` for the ``user`` of the given
+        :class:`vidscraper.videos.Video`. Within an import, the lookup is
+        only done once per author.
+
+        """
+        if source_import is None:
+            return cls._get_vidscraper_author(video, using).pk
+        key = (using, source_import._meta.module_name, source_import.pk,
+               video.user)
+        pk = cls._vidscraper_author_cache.get(key)
+        if pk is None:
+            pk = cls._get_vidscraper_author(video, using).pk
+            cls._vidscraper_author_cache[key] = pk
+        return pk
+
+    @classmethod
+    def _save_vidscraper_tags(cls, instances, using='default'):
+        """
+        Tags each of the saved ``instances`` with the tags of its
+        :class:`vidscraper.videos.Video`. All the tags are looked up (or
+        created) at once, and the tagged items are inserted with one query.
+
+        """
+        tag_names = [(instance, cls._get_vidscraper_tag_names(
+                                            instance._vidscraper_video))
+                     for instance in instances]
+        all_names = set()
+        for instance, names in tag_names:
+            all_names.update(names)
+        if not all_names:
+            return
+        tags = utils.get_tags_in_bulk(all_names, using)
+        content_type = ContentType.objects.db_manager(using).get_for_model(cls)
+        rows = set()
+        for instance, names in tag_names:
+            rows.update((tags[name].pk, instance.pk) for name in names)
+        tagging.models.TaggedItem._default_manager.db_manager(using
+            ).bulk_create([
+                tagging.models.TaggedItem(tag_id=tag_pk,
+                                          content_type=content_type,
+                                          object_id=object_pk)
+                for tag_pk, object_pk in rows])
+
+    @staticmethod
+    def _get_vidscraper_author(video, using='default'):
+        """
+        Returns a :class:`User` for the ``user`` of the given
+        :class:`vidscraper.videos.Video`, creating one (with a profile) if
+        necessary.
+
+        """
+        name = video.user
+        if ' ' in name:
+            first, last = name.split(' ', 1)
+        else:
+            first, last = name, ''
+        author, created = User.objects.db_manager(using).get_or_create(
+            username=name[:30],
+            defaults={'first_name': first[:30],
+                      'last_name': last[:30]})
+        if created:
+            author.set_unusable_password()
+            author.save()
+            utils.get_profile_model()._default_manager.db_manager(using
+                ).create(user=author, website=video.user_url or '')
+        return author
+
+    @staticmethod
+    def _get_vidscraper_tag_names(video):
+        """
+        Returns the set of normalized tag names for the given
+        :class:`vidscraper.videos.Video`.
+
+        """
+        if not video.tags:
+            return set()
+        if settings.FORCE_LOWERCASE_TAGS:
+            fix = lambda t: t.lower().strip()
+        else:
+            fix = lambda t: t.strip()
+        # Tags can only be 50 characters long.
+        return set(fix(tag)[:50] for tag in video.tags if tag.strip())
+
     def get_tags(self):
         if self.pk is None:
             vidscraper_video = getattr(self, '_vidscraper_video', None)
@@ -1124,6 +1470,28 @@ class Video(Thumbnailable):
             # XXX warning?
             return None
 
+    @classmethod
+    def update_best_dates(cls, batch_size=1000, using='default'):
+        """
+        Recalculates :attr:`best_date` and :attr:`best_date_with_published`
+        for every video, ``batch_size`` videos at a time. Each batch is
+        committed on its own.
+
+        """
+        manager = cls._default_manager.using(using)
+        max_pk = manager.aggregate(max_pk=models.Max('pk'))['max_pk'] or 0
+        for start in xrange(0, max_pk + 1, batch_size):
+            videos = manager.filter(pk__gte=start, pk__lt=start + batch_size)
+            with transaction.commit_on_success(using=using):
+                videos.filter(when_approved__isnull=True).update(
+                    best_date=models.F('when_submitted'))
+                videos.filter(when_approved__isnull=False).update(
+                    best_date=models.F('when_approved'))
+                videos.filter(when_published__isnull=True).update(
+                    best_date_with_published=models.F('best_date'))
+                videos.filter(when_published__isnull=False).update(
+                    best_date_with_published=models.F('when_published'))
+
     def when(self):
         """
         Simple method for getting the when_published date if the video came
@@ -1183,24 +1551,16 @@ class Video(Thumbnailable):
     @property
     def all_categories(self):
         """
-        Returns a set of all the categories to which this video belongs.
+        Returns a set of all the categories to which this video belongs. If
+        these have been prefetched (see
+        :meth:`localtv.search_indexes.VideoIndex.prefetch_batch`), no
+        queries are needed.
 
         """
-        categories = self.categories.all()
-        if not categories:
-            return categories
-        q_list = []
-        opts = Category._mptt_meta
-        for category in categories:
-            l = {
-                'left__lte': getattr(category, opts.left_attr),
-                'right__gte': getattr(category, opts.right_attr),
-                'tree_id': getattr(category, opts.tree_id_attr)
-            }
-            l = Category._tree_manager._translate_lookups(**l)
-            q_list.append(models.Q(**l))
-        q = reduce(operator.or_, q_list)
-        return Category.objects.using(self._state.db).filter(q)
+        if hasattr(self, '_all_categories'):
+            return self._all_categories
+        return Category.objects.using(self._state.db).filter(
+                                          categorymembership__video=self)
 
 
 def pre_save_video_set_calculated_source_type(instance, **kwargs):
@@ -1210,6 +1570,25 @@ models.signals.pre_save.connect(pre_save_video_set_calculated_source_type,
                                 sender=Video)
 
 
+def pre_save_video_set_url_hashes(instance, **kwargs):
+    # Keep the url hashes used for duplicate checks in sync with the urls.
+    instance.website_url_hash = utils.hash_url(instance.website_url)
+    instance.file_url_hash = utils.hash_url(instance.file_url)
+models.signals.pre_save.connect(pre_save_video_set_url_hashes,
+                                sender=Video)
+
+
+def pre_save_video_set_best_dates(instance, **kwargs):
+    # when_submitted is only filled in after pre_save for new videos, so
+    # their best date may be a moment earlier; update_best_dates() is exact.
+    instance.best_date = (instance.when_approved or instance.when_submitted or
+                          datetime.datetime.now())
+    instance.best_date_with_published = (instance.when_published or
+                                         instance.best_date)
+models.signals.pre_save.connect(pre_save_video_set_best_dates,
+                                sender=Video)
+
+
 class Watch(models.Model):
     """
     Record of a video being watched.
@@ -1221,7 +1600,11 @@ class Watch(models.Model):
      - ip_address: IP address of the user
     """
     video = models.ForeignKey(Video)
-    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+    #: Not ``auto_now_add``, so that buffered watches keep the time they
+    #: happened at rather than the time they're written.
+    timestamp = models.DateTimeField(default=datetime.datetime.now,
+                                     editable=False, blank=True,
+                                     db_index=True)
     user = models.ForeignKey('auth.User', blank=True, null=True)
     ip_address = models.IPAddressField()
 
@@ -1230,7 +1613,8 @@ class Watch(models.Model):
         """
         Adds a record of a watched video to the database.  If the request came
         from localhost, check to see if it was forwarded to (hopefully) get the
-        right IP address.
+        right IP address.  The watch is written by :data:`watch_buffer`, so
+        it may not be in the database yet when this returns.
         """
         ignored_bots = getattr(settings, 'LOCALTV_WATCH_IGNORED_USER_AGENTS',
                                ('bot', 'spider', 'crawler'))
@@ -1249,10 +1633,471 @@ class Watch(models.Model):
         else:
             user = None
 
+        if not Class._is_new_watch(video, user, ip):
+            return
+
+        watch_buffer.add(video, user, ip)
+
+    @staticmethod
+    def _is_new_watch(video, user, ip):
+        """
+        Returns ``False`` if the user (or, for anonymous users, the IP
+        address) has already watched the video within the last
+        ``WATCH_DEDUPE_WINDOW`` seconds. This only touches the cache.
+
+        """
+        window = lsettings.WATCH_DEDUPE_WINDOW
+        if not window:
+            return True
+        if user is not None:
+            watcher = 'user:%i' % user.pk
+        elif ip != '0.0.0.0':
+            watcher = 'ip:%s' % ip
+        else:
+            return True
+        key = 'localtv:watch:%i:%s' % (video.pk, watcher)
+        # cache.add only sets the key (and returns True) if it isn't already
+        # there, so this is a single atomic round-trip.
+        return cache.add(key, 1, window)
+
+
+class WatchBuffer(object):
+    """
+    Collects watches in memory so that they can be written with a single
+    ``INSERT`` per batch rather than one per page view. A batch is written
+    once it holds ``WATCH_BUFFER_SIZE`` watches, or ``WATCH_BUFFER_DELAY``
+    seconds after its first watch arrived, by a background timer. Repeat
+    watches of a video from the same user or IP address within a batch are
+    dropped before they are written.
+
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+        self._seen = set()
+        self._timer = None
+
+    def add(self, video, user, ip_address):
+        if lsettings.WATCH_BUFFER_SIZE <= 1:
+            self._write([(video, user, ip_address, datetime.datetime.now())])
+            return
+        if user is not None:
+            key = (video.pk, user.pk)
+        elif ip_address != '0.0.0.0':
+            key = (video.pk, ip_address)
+        else:
+            # There's no telling anonymous watchers without an address
+            # apart.
+            key = None
+        with self._lock:
+            if key is not None:
+                if key in self._seen:
+                    return
+                self._seen.add(key)
+            self._pending.append((video, user, ip_address,
+                                  datetime.datetime.now()))
+            ready = len(self._pending) >= lsettings.WATCH_BUFFER_SIZE
+            if not ready and self._timer is None:
+                self._timer = threading.Timer(lsettings.WATCH_BUFFER_DELAY,
+                                              self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if ready:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes all of the pending watches to the database.
+
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._seen = set()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if pending:
+            self._write(pending)
+
+    def _write(self, watches):
         try:
-            Class(video=video, user=user, ip_address=ip).save()
+            objs = [Watch(video=video, user=user, ip_address=ip_address,
+                          timestamp=timestamp)
+                    for video, user, ip_address, timestamp in watches]
+            for i in xrange(0, len(objs), 500):
+                Watch.objects.bulk_create(objs[i:i + 500])
+
+            buckets = {}
+            for video, user, ip_address, timestamp in watches:
+                key = video.pk, WatchBucket.get_hour(timestamp)
+                if key in buckets:
+                    buckets[key][1] += 1
+                else:
+                    buckets[key] = [video, 1]
+            for (pk, hour), (video, count) in buckets.iteritems():
+                WatchBucket.record(video, hour, count=count)
         except Exception:
-            pass
+            logging.warn('Failed to record %i watches' % len(watches),
+                         exc_info=True)
+
+
+#: The process-wide watch buffer.
+watch_buffer = WatchBuffer()
+atexit.register(watch_buffer.flush)
+
+
+def _increment_count(queryset, count, **lookup):
+    """
+    Adds ``count`` to the ``count`` of the row matching ``lookup``, creating
+    the row if it doesn't exist yet.
+
+    """
+    rows = queryset.filter(**lookup)
+    if rows.update(count=models.F('count') + count):
+        return
+    using = queryset.db
+    sid = transaction.savepoint(using=using)
+    try:
+        queryset.create(count=count, **lookup)
+    except IntegrityError:
+        # Someone else created the row first.
+        transaction.savepoint_rollback(sid, using=using)
+        rows.update(count=models.F('count') + count)
+    else:
+        transaction.savepoint_commit(sid, using=using)
+
+
+class WatchBucket(models.Model):
+    """
+    The number of times a video was watched during a given hour. Buckets are
+    incremented as watches come in and summed into :attr:`Video.watch_count`
+    by :meth:`update_watch_counts`, so that popularity never has to be
+    aggregated from the raw :class:`Watch` records.
+
+    fields:
+     - video: Video that was watched
+     - hour: the start of the hour the watches happened in
+     - count: the number of watches during that hour
+    """
+    #: The period over which watches count towards a video's popularity.
+    WINDOW = datetime.timedelta(days=7)
+
+    video = models.ForeignKey(Video)
+    hour = models.DateTimeField(db_index=True)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('video', 'hour')
+
+    @staticmethod
+    def get_hour(timestamp):
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+
+    @classmethod
+    def get_window_start(cls):
+        return cls.get_hour(datetime.datetime.now() - cls.WINDOW)
+
+    @classmethod
+    def record(cls, video, timestamp, count=1, using='default'):
+        """
+        Adds ``count`` watches of ``video`` to the bucket for ``timestamp``.
+
+        """
+        _increment_count(cls._default_manager.using(using), count,
+                         video_id=video.pk, hour=cls.get_hour(timestamp))
+
+    @classmethod
+    def rebuild(cls, since=None, using='default'):
+        """
+        Replaces the buckets from ``since`` onwards (default: the start of
+        the popularity window) with counts of the raw :class:`Watch` records.
+
+        """
+        if since is None:
+            since = cls.get_window_start()
+        else:
+            since = cls.get_hour(since)
+        manager = cls._default_manager.using(using)
+        manager.filter(hour__gte=since).delete()
+
+        counts = {}
+        watches = Watch.objects.using(using).filter(timestamp__gte=since
+                                  ).order_by().values_list('video',
+                                                           'timestamp')
+        for video_pk, timestamp in watches.iterator():
+            key = video_pk, cls.get_hour(timestamp)
+            counts[key] = counts.get(key, 0) + 1
+
+        buckets = [cls(video_id=video_pk, hour=hour, count=count)
+                   for (video_pk, hour), count in counts.iteritems()]
+        for i in xrange(0, len(buckets), 500):
+            manager.bulk_create(buckets[i:i + 500])
+
+    @classmethod
+    def update_watch_counts(cls, using='default'):
+        """
+        Sets :attr:`Video.watch_count` to the number of watches in the
+        popularity window and deletes buckets which have fallen out of it.
+        Returns a list of the pks of the videos whose count changed.
+
+        """
+        since = cls.get_window_start()
+        manager = cls._default_manager.using(using)
+        totals = dict(manager.filter(hour__gte=since).order_by(
+                             ).values_list('video'
+                             ).annotate(models.Sum('count')))
+        current = dict(Video.objects.using(using).filter(watch_count__gt=0
+                             ).order_by().values_list('pk', 'watch_count'))
+
+        by_count = {}
+        for pk in set(totals) | set(current):
+            count = totals.get(pk, 0)
+            if count != current.get(pk, 0):
+                by_count.setdefault(count, []).append(pk)
+
+        changed = []
+        for count, pks in by_count.iteritems():
+            for i in xrange(0, len(pks), 500):
+                Video.objects.using(using).filter(pk__in=pks[i:i + 500]
+                                          ).update(watch_count=count)
+            changed.extend(pks)
+
+        manager.filter(hour__lt=since).delete()
+        return changed
+
+
+class WatchDay(models.Model):
+    """
+    The number of times a video was watched on a given day. Raw
+    :class:`Watch` records are rolled up into these by :meth:`rollup` once
+    they are older than ``WATCH_RETENTION_DAYS``, and then deleted.
+
+    fields:
+     - video: Video that was watched
+     - date: the day the watches happened on
+     - count: the number of watches on that day
+    """
+    video = models.ForeignKey(Video)
+    date = models.DateField(db_index=True)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('video', 'date')
+
+    @classmethod
+    def get_total(cls, video, using='default'):
+        """
+        Returns the number of times ``video`` has ever been watched.
+
+        """
+        rolled_up = cls._default_manager.using(using).filter(video=video
+                                    ).aggregate(models.Sum('count'))
+        return ((rolled_up['count__sum'] or 0) +
+                Watch.objects.using(using).filter(video=video).count())
+
+    @classmethod
+    def rollup(cls, before, batch_size=1000, using='default'):
+        """
+        Adds the :class:`Watch` records from before ``before`` to the daily
+        counts and deletes them, ``batch_size`` at a time. Each batch is
+        committed on its own. Returns the number of watches rolled up.
+
+        """
+        manager = cls._default_manager.using(using)
+        watches = Watch.objects.using(using).filter(timestamp__lt=before
+                                           ).order_by('pk')
+        total = 0
+        while True:
+            batch = list(watches.values_list('pk', 'video', 'timestamp'
+                                             )[:batch_size])
+            if not batch:
+                break
+            counts = {}
+            for pk, video_pk, timestamp in batch:
+                key = video_pk, timestamp.date()
+                counts[key] = counts.get(key, 0) + 1
+            with transaction.commit_on_success(using=using):
+                for (video_pk, date), count in counts.iteritems():
+                    _increment_count(manager, count, video_id=video_pk,
+                                     date=date)
+                Watch.objects.using(using).filter(
+                    pk__in=[pk for pk, video_pk, timestamp in batch]
+                    ).delete()
+            total += len(batch)
+        return total
+
+
+class RecentComment(models.Model):
+    """
+    A denormalized record of a public comment on an active video, so that a
+    site's most recent comments can be read with a single indexed query
+    instead of matching ``object_pk`` against every active video. These are
+    kept up to date when comments and videos are saved.
+
+    fields:
+     - comment: the comment
+     - site: the comment's site
+     - video: the video which was commented on
+     - submit_date: when the comment was submitted
+    """
+    comment = models.OneToOneField('comments.Comment')
+    site = models.ForeignKey(Site)
+    video = models.ForeignKey(Video)
+    submit_date = models.DateTimeField()
+
+    @classmethod
+    def get_comments(cls, site):
+        """
+        Returns a QuerySet of the public comments on the site's active videos,
+        most recent first.
+
+        """
+        if isinstance(site, Site):
+            site = site.pk
+        return comments.get_model().objects.filter(
+                                  recentcomment__site=site
+                                  ).order_by('-recentcomment__submit_date')
+
+    @classmethod
+    def update_for_comment(cls, comment, using='default'):
+        """
+        Adds or removes the comment, depending on whether it should be
+        listed.
+
+        """
+        manager = cls._default_manager.using(using)
+        video_type = ContentType.objects.db_manager(using).get_for_model(
+                                                                   Video)
+        if (comment.content_type_id == video_type.pk and comment.is_public and
+            not comment.is_removed):
+            try:
+                video = Video.objects.using(using).get(pk=comment.object_pk,
+                                                       status=Video.ACTIVE)
+            except (Video.DoesNotExist, ValueError):
+                pass
+            else:
+                if not manager.filter(comment=comment).update(
+                                site=comment.site_id, video=video,
+                                submit_date=comment.submit_date):
+                    manager.create(comment=comment, site_id=comment.site_id,
+                                   video=video,
+                                   submit_date=comment.submit_date)
+                return
+        manager.filter(comment=comment).delete()
+
+    @classmethod
+    def update_for_video(cls, video, using='default'):
+        """
+        Replaces the records for the video's comments, which are only listed
+        while it's active.
+
+        """
+        cls.update_for_videos([video.pk], using=using)
+
+    @classmethod
+    def update_for_videos(cls, video_pks, using='default'):
+        """
+        Replaces the records for the comments on the videos with the given
+        pks, in a few queries no matter how many videos there are.
+
+        """
+        video_pks = list(video_pks)
+        if not video_pks:
+            return
+        manager = cls._default_manager.using(using)
+        manager.filter(video__in=video_pks).delete()
+        active_pks = list(Video.objects.using(using).filter(
+                                pk__in=video_pks, status=Video.ACTIVE
+                                ).values_list('pk', flat=True))
+        if not active_pks:
+            return
+        video_type = ContentType.objects.db_manager(using).get_for_model(
+                                                                   Video)
+        video_comments = comments.get_model().objects.using(using).filter(
+                    content_type=video_type,
+                    object_pk__in=[unicode(pk) for pk in active_pks],
+                    is_public=True, is_removed=False)
+        records = [cls(comment=comment, site_id=comment.site_id,
+                       video_id=int(comment.object_pk),
+                       submit_date=comment.submit_date)
+                   for comment in video_comments]
+        for i in xrange(0, len(records), 500):
+            manager.bulk_create(records[i:i + 500])
+
+
+class CategoryMembership(models.Model):
+    """
+    A denormalized record of a video being in a category, either directly or
+    through one of its subcategories, so that a category's videos can be
+    found with a single indexed join instead of MPTT range lookups. These are
+    kept up to date when videos are recategorized and when categories move.
+
+    fields:
+     - video: the video
+     - category: one of the video's categories, or one of their ancestors
+    """
+    video = models.ForeignKey(Video)
+    category = models.ForeignKey(Category)
+
+    class Meta:
+        unique_together = ('category', 'video')
+
+    @classmethod
+    def update_for_videos(cls, video_pks, using='default'):
+        """
+        Replaces the records for the videos with the given pks. The videos'
+        categories and the trees those are in are fetched with one query
+        each.
+
+        """
+        video_pks = set(video_pks)
+        if not video_pks:
+            return
+        opts = Category._mptt_meta
+        fields = opts.tree_id_attr, opts.left_attr, opts.right_attr
+        rows = Video.categories.through._default_manager.using(using).filter(
+                    video__in=video_pks).values_list(
+                    'video', *['category__%s' % field for field in fields])
+        video_categories = {}
+        for video_pk, tree_id, left, right in rows:
+            video_categories.setdefault(video_pk, []).append(
+                                                     (tree_id, left, right))
+        trees = {}
+        if video_categories:
+            tree_ids = set(tree_id for categories in video_categories.values()
+                           for tree_id, left, right in categories)
+            categories = Category.objects.using(using).filter(
+                                       **{'%s__in' % fields[0]: tree_ids}
+                                       ).values_list('pk', *fields)
+            for pk, tree_id, left, right in categories:
+                trees.setdefault(tree_id, []).append((pk, left, right))
+
+        memberships = []
+        for video_pk, categories in video_categories.iteritems():
+            ancestor_pks = set(pk for tree_id, left, right in categories
+                               for pk, tree_left, tree_right in trees[tree_id]
+                               if tree_left <= left and tree_right >= right)
+            memberships.extend(cls(video_id=video_pk, category_id=pk)
+                               for pk in ancestor_pks)
+
+        manager = cls._default_manager.using(using)
+        with transaction.commit_on_success(using=using):
+            manager.filter(video__in=video_pks).delete()
+            for i in xrange(0, len(memberships), 500):
+                manager.bulk_create(memberships[i:i + 500])
+
+    @classmethod
+    def update_for_category(cls, category, using='default'):
+        """
+        Replaces the records for the videos in ``category`` or any of its
+        subcategories, e.g. after it has moved.
+
+        """
+        video_pks = Video.categories.through._default_manager.using(using
+                        ).filter(category__in=category.get_descendants(
+                                                          include_self=True)
+                        ).values_list('video', flat=True)
+        cls.update_for_videos(video_pks, using=using)
 
 
 class VideoModerator(CommentModerator):
@@ -1339,7 +2184,7 @@ tagging.register(Video)
 
 
 def finished(sender, **kwargs):
-    SiteSettings.objects.clear_cache()
+    SiteSettings.objects.mark_unverified()
 request_finished.connect(finished)
 
 
@@ -1426,3 +2271,91 @@ def delete_comments(sender, instance, **kwargs):
         ).delete()
 models.signals.pre_delete.connect(delete_comments,
                                   sender=Video)
+
+
+def bump_content_version(sender, instance, **kwargs):
+    utils.bump_content_version(instance.site_id)
+models.signals.post_save.connect(bump_content_version, sender=Video)
+models.signals.post_delete.connect(bump_content_version, sender=Video)
+models.signals.post_save.connect(bump_content_version, sender=Category)
+models.signals.post_delete.connect(bump_content_version, sender=Category)
+
+
+def update_recent_comment(sender, instance, raw=False, using='default',
+                          **kwargs):
+    if not raw:
+        RecentComment.update_for_comment(instance, using=using)
+models.signals.post_save.connect(update_recent_comment,
+                                 sender=comments.get_model())
+
+
+def remember_video_status(sender, instance, **kwargs):
+    # Read from __dict__ so that deferred fields aren't loaded.
+    instance._loaded_status = instance.__dict__.get('status')
+models.signals.post_init.connect(remember_video_status, sender=Video)
+
+
+def update_recent_comments(sender, instance, created=False, raw=False,
+                           using='default', **kwargs):
+    # New videos don't have any comments yet, and the comments are only
+    # listed or hidden when the video's status changes.
+    loaded_status = instance.__dict__.get('_loaded_status')
+    instance._loaded_status = instance.status
+    if not (created or raw) and loaded_status != instance.status:
+        RecentComment.update_for_video(instance, using=using)
+models.signals.post_save.connect(update_recent_comments, sender=Video)
+
+
+def update_category_memberships(sender, instance, action, reverse=False,
+                                pk_set=None, using='default', **kwargs):
+    if reverse:
+        # The instance is a category; keep track of its videos before they're
+        # cleared.
+        if action == 'pre_clear':
+            instance._cleared_video_pks = list(sender._default_manager.using(
+                                              using).filter(category=instance
+                                              ).values_list('video',
+                                                            flat=True))
+        elif action == 'post_clear':
+            CategoryMembership.update_for_videos(
+                instance.__dict__.pop('_cleared_video_pks', ()), using=using)
+        elif action in ('post_add', 'post_remove'):
+            CategoryMembership.update_for_videos(pk_set, using=using)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        CategoryMembership.update_for_videos([instance.pk], using=using)
+models.signals.m2m_changed.connect(update_category_memberships,
+                                   sender=Video.categories.through)
+
+
+def remember_category_parent(sender, instance, **kwargs):
+    # MPTTModel.save() moves the category in the database before pre_save,
+    # so its old parent has to be remembered when it's loaded.
+    instance._loaded_parent_id = instance.__dict__.get('parent_id')
+models.signals.post_init.connect(remember_category_parent, sender=Category)
+
+
+def update_moved_category_memberships(sender, instance, created=False,
+                                      raw=False, using='default', **kwargs):
+    loaded_parent_id = instance.__dict__.get('_loaded_parent_id')
+    instance._loaded_parent_id = instance.parent_id
+    if not (created or raw) and loaded_parent_id != instance.parent_id:
+        CategoryMembership.update_for_category(instance, using=using)
+models.signals.post_save.connect(update_moved_category_memberships,
+                                 sender=Category)
+
+
+def remember_deleted_category_videos(sender, instance, using='default',
+                                     **kwargs):
+    instance._deleted_video_pks = list(
+        Video.categories.through._default_manager.using(using).filter(
+            category=instance).values_list('video', flat=True))
+models.signals.pre_delete.connect(remember_deleted_category_videos,
+                                  sender=Category)
+
+
+def update_deleted_category_memberships(sender, instance, using='default',
+                                        **kwargs):
+    CategoryMembership.update_for_videos(
+        instance.__dict__.pop('_deleted_video_pks', ()), using=using)
+models.signals.post_delete.connect(update_deleted_category_memberships,
+                                   sender=Category)
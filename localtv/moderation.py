@@ -0,0 +1,239 @@
+"""
+Bulk moderation and editing of videos. These update whole sets of videos
+with a few statements instead of saving them one at a time, and then do what
+saving would have done once for the whole set: the search index is updated
+in batches, the sites' content versions are bumped and the recent comments
+are refreshed. Lookups by pk are done 500 pks at a time, which keeps each
+``IN`` clause within SQLite's limit on query parameters.
+
+"""
+import datetime
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.mail import EmailMessage, get_connection
+from django.db import models, transaction
+from django.template import Context, loader
+from haystack import connections
+from notification import models as notification
+from tagging.models import TaggedItem
+from tagging.utils import parse_tag_input
+
+from localtv.models import Video, RecentComment
+from localtv.utils import bump_content_version, get_tags_in_bulk, hash_url
+
+
+def videos_changed(video_pks, site_pks=None, using='default'):
+    """
+    Does what saving the videos with the given pks one at a time would have
+    done, for all of them at once. If ``site_pks`` isn't given, the videos'
+    sites are looked up.
+
+    """
+    video_pks = list(video_pks)
+    if not video_pks:
+        return
+    if site_pks is None:
+        site_pks = set()
+        for i in xrange(0, len(video_pks), 500):
+            site_pks.update(Video.objects.using(using).filter(
+                                pk__in=video_pks[i:i + 500]
+                                ).values_list('site', flat=True).distinct())
+    index = connections[using].get_unified_index().get_index(Video)
+    index.enqueue_pks(video_pks, using=using)
+    for site_pk in set(site_pks):
+        bump_content_version(site_pk)
+    for i in xrange(0, len(video_pks), 500):
+        RecentComment.update_for_videos(video_pks[i:i + 500], using=using)
+
+
+def update_videos(videos, using='default', **kwargs):
+    """
+    Applies ``kwargs`` to the ``videos`` (a possibly sliced
+    :class:`QuerySet`) with a few statements, and then calls
+    :func:`videos_changed` for them. Returns the pks of the updated videos.
+
+    """
+    rows = list(videos.values_list('pk', 'site'))
+    if not rows:
+        return []
+    video_pks = [pk for pk, site_pk in rows]
+    now = datetime.datetime.now()
+    with transaction.commit_on_success(using=using):
+        # Keep the stored best dates current; see
+        # pre_save_video_set_best_dates.
+        if 'when_approved' in kwargs:
+            kwargs['best_date'] = (kwargs['when_approved'] or
+                                   models.F('when_submitted'))
+        if kwargs.get('when_published'):
+            kwargs['best_date_with_published'] = kwargs['when_published']
+        # And the url hashes used for duplicate checks; see
+        # pre_save_video_set_url_hashes.
+        for field_name in ('website_url', 'file_url'):
+            if field_name in kwargs:
+                kwargs[field_name + '_hash'] = hash_url(kwargs[field_name])
+        for i in xrange(0, len(video_pks), 500):
+            queryset = Video.objects.using(using).filter(
+                                                pk__in=video_pks[i:i + 500])
+            queryset.update(when_modified=now, **kwargs)
+            if 'best_date' in kwargs or 'when_published' in kwargs:
+                queryset.filter(when_published__isnull=True).update(
+                    best_date_with_published=models.F('best_date'))
+    videos_changed(video_pks, [site_pk for pk, site_pk in rows], using=using)
+    return video_pks
+
+
+def approve_videos(videos, feature=False, using='default'):
+    """
+    Approves the ``videos`` (a possibly sliced :class:`QuerySet`) and, if
+    ``feature`` is ``True``, features them. Returns the pks of the approved
+    videos.
+
+    """
+    now = datetime.datetime.now()
+    kwargs = {'status': Video.ACTIVE, 'when_approved': now}
+    if feature:
+        kwargs['last_featured'] = now
+    return update_videos(videos, using=using, **kwargs)
+
+
+def unapprove_videos(videos, using='default'):
+    """
+    Puts the ``videos`` back in the review queue. Returns their pks.
+
+    """
+    return update_videos(videos, using=using, status=Video.UNAPPROVED)
+
+
+def reject_videos(videos, using='default'):
+    """
+    Rejects the ``videos`` (a possibly sliced :class:`QuerySet`). Returns the
+    pks of the rejected videos.
+
+    """
+    return update_videos(videos, using=using, status=Video.REJECTED)
+
+
+def feature_videos(videos, using='default'):
+    """
+    Features the ``videos``, approving the ones which aren't active yet.
+    Returns their pks.
+
+    """
+    video_pks = list(videos.values_list('pk', flat=True))
+    now = datetime.datetime.now()
+    for i in xrange(0, len(video_pks), 500):
+        videos = Video.objects.using(using).filter(pk__in=video_pks[i:i + 500])
+        approve_videos(videos.exclude(status=Video.ACTIVE), using=using)
+        update_videos(videos, using=using, last_featured=now)
+    return video_pks
+
+
+def unfeature_videos(videos, using='default'):
+    """
+    Stops featuring the ``videos``. Returns their pks.
+
+    """
+    return update_videos(videos, using=using, last_featured=None)
+
+
+def add_video_categories(videos, categories, using='default'):
+    """
+    Adds the ``categories`` to the ``videos``, keeping the categories they're
+    already in. Returns the pks of the videos.
+
+    """
+    video_pks = list(videos.values_list('pk', flat=True))
+    if video_pks:
+        with transaction.commit_on_success(using=using):
+            for category in categories:
+                # This only inserts the missing rows, and keeps the category
+                # memberships up to date.
+                for i in xrange(0, len(video_pks), 500):
+                    category.video_set.add(*video_pks[i:i + 500])
+        videos_changed(video_pks, using=using)
+    return video_pks
+
+
+def set_video_authors(videos, authors, using='default'):
+    """
+    Replaces the authors of the ``videos`` with ``authors``. Returns the pks
+    of the videos.
+
+    """
+    video_pks = list(videos.values_list('pk', flat=True))
+    if video_pks:
+        manager = Video.authors.through._default_manager.db_manager(using)
+        rows = [manager.model(video_id=video_pk, user_id=author.pk)
+                for video_pk in video_pks for author in authors]
+        with transaction.commit_on_success(using=using):
+            for i in xrange(0, len(video_pks), 500):
+                manager.filter(video__in=video_pks[i:i + 500]).delete()
+            for i in xrange(0, len(rows), 500):
+                manager.bulk_create(rows[i:i + 500])
+        videos_changed(video_pks, using=using)
+    return video_pks
+
+
+def set_video_tags(videos, tag_string, using='default'):
+    """
+    Replaces the tags of the ``videos`` with the ones in ``tag_string``.
+    Returns the pks of the videos.
+
+    """
+    video_pks = list(videos.values_list('pk', flat=True))
+    if video_pks:
+        names = parse_tag_input(tag_string)
+        if settings.FORCE_LOWERCASE_TAGS:
+            names = [name.lower() for name in names]
+        tags = get_tags_in_bulk(names, using).values()
+        content_type = ContentType.objects.db_manager(using).get_for_model(
+                                                                      Video)
+        manager = TaggedItem._default_manager.db_manager(using)
+        rows = [TaggedItem(tag=tag, content_type=content_type,
+                           object_id=video_pk)
+                for video_pk in video_pks for tag in tags]
+        with transaction.commit_on_success(using=using):
+            for i in xrange(0, len(video_pks), 500):
+                manager.filter(content_type=content_type,
+                               object_id__in=video_pks[i:i + 500]).delete()
+            for i in xrange(0, len(rows), 500):
+                manager.bulk_create(rows[i:i + 500])
+        videos_changed(video_pks, using=using)
+    return video_pks
+
+
+def send_approval_notices(video_pks, using='default'):
+    """
+    Emails the submitters of the videos with the given pks who want to hear
+    about approvals. The notice settings are checked once per user, and the
+    emails are sent over a single connection.
+
+    """
+    video_pks = list(video_pks)
+    videos = []
+    for i in xrange(0, len(video_pks), 500):
+        videos.extend(Video.objects.using(using).filter(
+                        pk__in=video_pks[i:i + 500], user__isnull=False
+                      ).exclude(user__email='').select_related('user', 'site'))
+    if not videos:
+        return
+    video_approved = notification.NoticeType.objects.get(
+        label="video_approved")
+    template = loader.get_template(
+        'localtv/submit_video/approval_notification_email.txt')
+    should_send = {}
+    messages = []
+    for video in videos:
+        if video.user_id not in should_send:
+            should_send[video.user_id] = notification.should_send(
+                                              video.user, video_approved, "1")
+        if not should_send[video.user_id]:
+            continue
+        subject = '[%s] "%s" was approved!' % (video.site.name, video)
+        message = template.render(Context({'current_video': video}))
+        messages.append(EmailMessage(subject, message,
+                                     settings.DEFAULT_FROM_EMAIL,
+                                     [video.user.email]))
+    if messages:
+        get_connection(fail_silently=True).send_messages(messages)
@@ -19,7 +19,8 @@ from localtv.models import Video, Category, Feed
 from localtv.playlists.models import Playlist
 from localtv.search.query import SmartSearchQuerySet
 from localtv.search.utils import (BestDateSort, PopularSort, DummySort, Sort,
-                                  _q_for_queryset)
+                                  _q_for_queryset, encode_cursor,
+                                  decode_cursor)
 from localtv.search_indexes import DATETIME_NULL_PLACEHOLDER
 from localtv.settings import USE_HAYSTACK
 
@@ -142,7 +143,8 @@ class SearchForm(HaystackForm):
         ('newest', BestDateSort()),
         ('oldest', BestDateSort(descending=False)),
         ('popular', PopularSort(_('Popularity'))),
-        ('featured', Sort(_('Recently featured'), 'last_featured')),
+        ('featured', Sort(_('Recently featured'), 'last_featured',
+                          supports_cursor=False)),
         ('relevant', DummySort(_('Relevance')))
     ))
     sort = DefaultChoiceField(choices=tuple((k, s.verbose_name)
@@ -169,6 +171,10 @@ class SearchForm(HaystackForm):
                             field_lookups=('last_featured',),
                             label=_('Featured videos'))
 
+    #: An opaque position in the listing, from :meth:`get_cursor`. Results
+    #: start after it.
+    cursor = forms.CharField(required=False, widget=forms.HiddenInput)
+
     def __init__(self, *args, **kwargs):
         super(SearchForm, self).__init__(*args, **kwargs)
         # Avoid triggering app loading here; sometimes causes a circular import.
@@ -192,6 +198,7 @@ class SearchForm(HaystackForm):
         queryset = self._search()
         queryset = self._filter(queryset)
         queryset = self._sort(queryset)
+        queryset = self._after_cursor(queryset)
 
         if isinstance(queryset, SearchQuerySet) and self.load_all:
             queryset = queryset.load_all()
@@ -281,3 +288,60 @@ class SearchForm(HaystackForm):
         """Runs the cleaned sort on the given queryset."""
         sort = self.sorts[self.cleaned_data['sort']]
         return sort.sort(queryset)
+
+    def clean_cursor(self):
+        # Like the sort, an invalid cursor is ignored rather than an error.
+        cursor = self.cleaned_data['cursor']
+        if cursor:
+            try:
+                return decode_cursor(cursor)
+            except ValueError:
+                pass
+        return None
+
+    def _get_cursor_sort(self, queryset):
+        """
+        Returns the cleaned sort if the sorted ``queryset`` can be paged with
+        cursors, and otherwise ``None``.
+
+        """
+        if not self.is_valid():
+            return None
+        sort = self.sorts[self.cleaned_data['sort']]
+        # Unwrap NormalizedVideoLists.
+        queryset = getattr(queryset, 'queryset', queryset)
+        if sort.can_use_cursor(queryset):
+            return sort
+        return None
+
+    def uses_cursor(self, queryset):
+        """
+        Returns ``True`` if the results of ``queryset`` start after a cursor.
+
+        """
+        return (self._get_cursor_sort(queryset) is not None and
+                self.cleaned_data['cursor'] is not None)
+
+    def _after_cursor(self, queryset):
+        """Limits the sorted queryset to the results after the cursor."""
+        if not self.uses_cursor(queryset):
+            return queryset
+        sort = self.sorts[self.cleaned_data['sort']]
+        return sort.after(queryset, *self.cleaned_data['cursor'])
+
+    def get_cursor(self, queryset, obj):
+        """
+        Returns a cursor for the results of ``queryset`` which come after
+        ``obj``, or ``None`` if they can't be paged with cursors.
+
+        """
+        sort = self._get_cursor_sort(queryset)
+        if sort is None:
+            return None
+        # Unwrap NormalizedVideoLists and SearchResults.
+        queryset = getattr(queryset, 'queryset', queryset)
+        obj = getattr(obj, 'object', obj)
+        value = sort.get_cursor_value(queryset, obj)
+        if value is None:
+            return None
+        return encode_cursor(value, obj.pk)
@@ -1,18 +1,37 @@
-import itertools
+import base64
+import binascii
+import datetime
+from hashlib import sha1
 import operator
 
-from django.db.models.query import Q
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.query import Q, EmptyQuerySet
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.utils import simplejson
+from django.utils.encoding import smart_str
 from django.utils.translation import ugettext_lazy as _
 from haystack import connections
 from haystack.backends import SQ
-from haystack.query import SearchQuerySet
+from haystack.query import SearchQuerySet, EmptySearchQuerySet
 
-from localtv.models import SiteSettings
+from localtv import settings as lsettings
+from localtv.managers import best_date_field
+from localtv.models import SiteSettings, Video
+from localtv.utils import get_content_version
 
 
 EMPTY = object()
 
 
+def _is_whoosh(queryset):
+    # Returns True if the queryset is a search on a Whoosh backend, which
+    # needs a few HACKs.
+    return (isinstance(queryset, SearchQuerySet) and
+            'WhooshEngine' in
+            connections[queryset.query._using].options['ENGINE'])
+
+
 def _exact_q(queryset, field, value):
     # Returns a Q or SQ instance representing an __exact query for the given
     # field/value. This facilitates a HACK necessitated by Whoosh __exact
@@ -21,9 +40,7 @@ def _exact_q(queryset, field, value):
     q_class = SQ if isinstance(queryset, SearchQuerySet) else Q
     if value is None:
         return q_class(**{'{0}__isnull'.format(field): True})
-    if (q_class is SQ and
-       'WhooshEngine' in
-       connections[queryset.query._using].options['ENGINE']):
+    if _is_whoosh(queryset):
         return q_class(**{field: value})
     return q_class(**{'{0}__exact'.format(field): value})
 
@@ -34,9 +51,7 @@ def _in_q(queryset, field, values):
     # doesn't properly support __in with multiple values. Instead, we
     # calculate each value separately and OR them together.
     q_class = SQ if isinstance(queryset, SearchQuerySet) else Q
-    if (q_class is SQ and
-        'WhooshEngine' in
-        connections[queryset.query._using].options['ENGINE']):
+    if _is_whoosh(queryset):
         qs = [_exact_q(queryset, field, value) for value in values]
         return reduce(operator.or_, qs)
     return q_class(**{'{0}__in'.format(field): values})
@@ -49,47 +64,211 @@ def _q_for_queryset(queryset, field, values):
         return _in_q(queryset, field, values)
 
 
+def search_video_pks(query, site_pk, limit):
+    """
+    Returns the pks of at most ``limit`` indexed videos on the site with
+    ``site_pk`` which match ``query``, best matches first.
+
+    """
+    results = SearchQuerySet().models(Video)
+    results = results.filter(_exact_q(results, 'site', site_pk)
+                    ).auto_query(query)
+    return [int(result.pk) for result in results[:limit]]
+
+
+class ResultCounter(object):
+    """
+    Counts the results of a :class:`QuerySet` or :class:`SearchQuerySet`.
+    :meth:`count` returns a ``(count, exact)`` tuple; if ``exact`` is
+    ``False``, there are *at least* ``count`` results.
+
+    By default, the count is the backend's own hit count for searches and a
+    ``COUNT(*)`` for the database. If ``cap`` is given, database counts stop
+    at ``cap`` results. If ``timeout`` is given, counts are cached for that
+    many seconds per query and content version.
+
+    """
+    def __init__(self, cap=None, timeout=None):
+        self.cap = cap
+        self.timeout = timeout
+
+    def count(self, queryset):
+        if isinstance(queryset, (EmptyQuerySet, EmptySearchQuerySet)):
+            return 0, True
+        if not self.timeout:
+            return self._count(queryset)
+        try:
+            key = self._get_cache_key(queryset)
+        except EmptyResultSet:
+            return 0, True
+        result = cache.get(key)
+        if result is None:
+            result = self._count(queryset)
+            cache.set(key, result, self.timeout)
+        return result
+
+    def _count(self, queryset):
+        if isinstance(queryset, SearchQuerySet):
+            # The search backend returns its total hit count with any
+            # search, so this is cheap.
+            return queryset.count(), True
+        if not self.cap:
+            return queryset.count(), True
+        count = len(queryset.values_list('pk', flat=True)[:self.cap + 1])
+        if count > self.cap:
+            return self.cap, False
+        return count, True
+
+    def _get_cache_key(self, queryset):
+        if isinstance(queryset, SearchQuerySet):
+            query = queryset.query
+            description = u'%s|%s|%s' % (query.build_query(),
+                                         sorted(unicode(model)
+                                                for model in query.models),
+                                         sorted(query.narrow_queries))
+        else:
+            description = unicode(queryset.query)
+        return 'localtv:result_count:%s:%s:%s' % (
+                    settings.SITE_ID,
+                    get_content_version(settings.SITE_ID),
+                    sha1(smart_str(description)).hexdigest())
+
+
+def get_result_counter():
+    """
+    Returns a :class:`ResultCounter` configured by the
+    ``LOCALTV_RESULT_COUNT_*`` settings.
+
+    """
+    return ResultCounter(cap=lsettings.RESULT_COUNT_CAP,
+                         timeout=lsettings.RESULT_COUNT_CACHE_TIMEOUT)
+
+
 class NormalizedVideoList(object):
     """
     Wraps either a haystack :class:`SearchQuerySet` or a django
     :class:`QuerySet` and provides normalized access to the objects as
     efficiently as possible.
 
+    :param counter: The :class:`ResultCounter` used to count the results.
+                    Defaults to the one from :func:`get_result_counter`.
+
     """
-    def __init__(self, queryset):
-        self.is_haystack = isinstance(queryset, SearchQuerySet)
-        if self.is_haystack:
-            queryset = queryset.load_all()
-            if 'WhooshEngine' in connections[queryset.query._using
-                                             ].options['ENGINE']:
-                # Workaround for django-haystack #574.
-                # https://github.com/toastdriven/django-haystack/issues/574
-                list(queryset)
+    #: The number of haystack results hydrated at a time while iterating.
+    hydrate_chunk_size = 100
 
+    def __init__(self, queryset, counter=None):
+        self.is_haystack = isinstance(queryset, SearchQuerySet)
+        if _is_whoosh(queryset):
+            # Workaround for django-haystack #574: Whoosh fills slices of a
+            # partly-loaded result cache with None.
+            # https://github.com/toastdriven/django-haystack/issues/574
+            list(queryset)
         self.queryset = queryset
+        self.counter = counter or get_result_counter()
+        self._count = None
+
+    def _hydrate(self, results):
+        """
+        Returns the videos for a list of haystack ``results`` in rank order,
+        loaded in a single query (plus one per prefetched relation). Results
+        whose videos are gone or no longer active are dropped.
+
+        """
+        pks = [Video._meta.pk.to_python(result.pk) for result in results
+               if result is not None]
+        if not pks:
+            return []
+        index = connections[self.queryset.query._using
+                            ].get_unified_index().get_index(Video)
+        videos = index.read_queryset().prefetch_related('categories',
+                                                        'authors'
+                                                        ).in_bulk(pks)
+        return [videos[pk] for pk in pks if pk in videos]
 
     def __getitem__(self, k):
         if self.is_haystack:
             results = self.queryset[k]
             if isinstance(results, list):
-                return [result.object for result in results
-                        if result is not None]
-            if results is not None:
-                return results.object
+                return self._hydrate(results)
+            videos = self._hydrate([results])
+            if videos:
+                return videos[0]
             raise IndexError
         else:
             return self.queryset[k]
 
+    def count(self):
+        """
+        Returns the number of results, which may be capped; see
+        :attr:`count_is_exact`. Used by paginators instead of :meth:`__len__`.
+
+        """
+        if self._count is None:
+            self._count = self.counter.count(self.queryset)
+        return self._count[0]
+
+    @property
+    def count_is_exact(self):
+        """
+        ``False`` if there are more results than :meth:`count` says.
+
+        """
+        self.count()
+        return self._count[1]
+
     def __len__(self):
-        return len(self.queryset)
+        return self.count()
 
     def __iter__(self):
         if self.is_haystack:
-            return iter(result.object for result in self.queryset
-                        if result is not None)
+            return self._iter_haystack()
         else:
             return iter(self.queryset)
 
+    def _iter_haystack(self):
+        chunk = []
+        for result in self.queryset:
+            chunk.append(result)
+            if len(chunk) == self.hydrate_chunk_size:
+                for video in self._hydrate(chunk):
+                    yield video
+                chunk = []
+        for video in self._hydrate(chunk):
+            yield video
+
+
+CURSOR_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def encode_cursor(value, pk):
+    """
+    Returns an opaque string marking the position of an object with the
+    given sort ``value`` and ``pk`` in a sorted listing.
+
+    """
+    if isinstance(value, datetime.datetime):
+        value = ['datetime', value.strftime(CURSOR_DATETIME_FORMAT)]
+    return base64.urlsafe_b64encode(simplejson.dumps([value, pk]))
+
+
+def decode_cursor(cursor):
+    """
+    Returns the ``(value, pk)`` encoded in ``cursor``. Raises
+    :exc:`ValueError` if the cursor is invalid.
+
+    """
+    try:
+        value, pk = simplejson.loads(base64.urlsafe_b64decode(str(cursor)))
+        if isinstance(value, list):
+            kind, value = value
+            if kind != 'datetime':
+                raise ValueError
+            value = datetime.datetime.strptime(value, CURSOR_DATETIME_FORMAT)
+        return value, int(pk)
+    except (TypeError, ValueError, binascii.Error, UnicodeEncodeError):
+        raise ValueError('Invalid cursor: %r' % cursor)
+
 
 class Sort(object):
     """
@@ -100,19 +279,77 @@ class Sort(object):
     :param verbose_name: A human-readable name for this sort.
     :param field_lookup: The field lookup which will be used in the sort
                          query.
+    :param supports_cursor: Whether listings with this sort can be paged with
+                            cursors. This should be ``False`` if the field
+                            can be ``NULL``, since cursors can't point past
+                            ``NULL`` values (and databases don't agree on
+                            where to sort them).
 
     """
-    def __init__(self, verbose_name, field_lookup, descending=True):
+    def __init__(self, verbose_name, field_lookup, descending=True,
+                 supports_cursor=True):
         self.verbose_name = verbose_name
         self.descending = descending
         self.field_lookup = field_lookup
+        self.supports_cursor = supports_cursor
 
     def sort(self, queryset):
         """
-        Does the actual ordering.
+        Does the actual ordering. Where possible, ties are broken by pk, so
+        that the order is stable enough for cursors.
 
         """
-        return queryset.order_by(self.get_order_by(queryset))
+        if not self.can_break_ties(queryset):
+            return queryset.order_by(self.get_order_by(queryset))
+        return queryset.order_by(self.get_order_by(queryset),
+                                 self.get_pk_order_by(queryset))
+
+    def can_break_ties(self, queryset):
+        """
+        Returns ``True`` if ties can be broken by pk for the ``queryset``.
+        Whoosh only sorts on a single field.
+
+        """
+        return not _is_whoosh(queryset)
+
+    def can_use_cursor(self, queryset):
+        """
+        Returns ``True`` if the sorted ``queryset`` can be paged with cursors.
+
+        """
+        return self.supports_cursor and self.can_break_ties(queryset)
+
+    def _get_pk_lookup(self, queryset):
+        # HACK because xapian-haystack django_id/pk filtering is broken.
+        if isinstance(queryset, SearchQuerySet):
+            return 'pk_hack'
+        return 'pk'
+
+    def get_pk_order_by(self, queryset):
+        return ''.join(('-' if self.descending else '',
+                        self._get_pk_lookup(queryset)))
+
+    def get_cursor_value(self, queryset, obj):
+        """
+        Returns the value which ``obj`` is sorted by.
+
+        """
+        return getattr(obj, self.get_field_lookup(queryset))
+
+    def after(self, queryset, value, pk):
+        """
+        Returns the part of the sorted ``queryset`` which comes after the
+        object with the given sort ``value`` and ``pk``. Unlike slicing, this
+        can use an index no matter how deep into the listing it is.
+
+        """
+        lookup = self.get_field_lookup(queryset)
+        op = 'lt' if self.descending else 'gt'
+        q_class = SQ if isinstance(queryset, SearchQuerySet) else Q
+        return queryset.filter(
+            q_class(**{'%s__%s' % (lookup, op): value}) |
+            (_exact_q(queryset, lookup, value) &
+             q_class(**{'%s__%s' % (self._get_pk_lookup(queryset), op): pk})))
 
     def get_field_lookup(self, queryset):
         """
@@ -132,6 +369,7 @@ class DummySort(Sort):
     """Looks like a sort, but does nothing."""
     def __init__(self, verbose_name):
         self.verbose_name = verbose_name
+        self.supports_cursor = False
 
     def sort(self, queryset):
         return queryset
@@ -145,16 +383,8 @@ class BestDateSort(Sort):
                                            descending)
 
     def get_field_lookup(self, queryset):
-        if (isinstance(queryset, SearchQuerySet) and
-            SiteSettings.objects.get_current().use_original_date):
-            return 'best_date_with_published'
-        return 'best_date'
-
-    def sort(self, queryset):
-        if not isinstance(queryset, SearchQuerySet):
-            queryset = queryset.with_best_date(
-                           SiteSettings.objects.get_current().use_original_date)
-        return super(BestDateSort, self).sort(queryset)
+        return best_date_field(
+                          SiteSettings.objects.get_current().use_original_date)
 
 
 class PopularSort(Sort):
@@ -162,9 +392,3 @@ class PopularSort(Sort):
         super(PopularSort, self).__init__(verbose_name, 'watch_count',
                                           descending)
 
-    def sort(self, queryset):
-        if not isinstance(queryset, SearchQuerySet):
-            popular = queryset.popular()
-            not_popular = queryset.not_popular()
-            return itertools.chain(popular, not_popular)
-        return super(PopularSort, self).sort(queryset)
@@ -67,6 +67,34 @@ class SortFilterView(ListView, SortFilterMixin):
                                          filter_value)
         return form.search()
 
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Pages through the results with a cursor if one was given, and
+        otherwise by page number. Either way, :attr:`next_cursor` is set to
+        the cursor for the following page, if there is one.
+
+        """
+        self.next_cursor = None
+        if self.form.uses_cursor(queryset):
+            results = list(queryset[:page_size + 1])
+            object_list = results[:page_size]
+            if len(results) > page_size:
+                self.next_cursor = self.form.get_cursor(queryset,
+                                                        object_list[-1])
+            return None, None, object_list, False
+
+        paginator, page, object_list, is_paginated = super(SortFilterView,
+                                 self).paginate_queryset(queryset, page_size)
+        # When the count is capped, the last numbered page isn't really the
+        # last one; the cursor is the only way past it.
+        if (page.has_next() or
+            not getattr(queryset, 'count_is_exact', True)):
+            object_list = list(object_list)
+            if object_list:
+                self.next_cursor = self.form.get_cursor(queryset,
+                                                        object_list[-1])
+        return paginator, page, object_list, is_paginated
+
     def get_object(self):
         if self.filter_name is not None:
             field = self.form_class.base_fields[self.filter_name]
@@ -85,6 +113,13 @@ class SortFilterView(ListView, SortFilterMixin):
     def get_context_data(self, **kwargs):
         context = super(SortFilterView, self).get_context_data(**kwargs)
         context['form'] = self.form
+        next_cursor = getattr(self, 'next_cursor', None)
+        context['next_cursor'] = next_cursor
+        if next_cursor is not None:
+            query = self.request.GET.copy()
+            query.pop('page', None)
+            query['cursor'] = next_cursor
+            context['next_cursor_query'] = query.urlencode()
         if (self.filter_name is not None and
             isinstance(self.form_class.base_fields.get(self.filter_name),
                        ModelFilterField)):
@@ -1,16 +1,22 @@
-from datetime import datetime, timedelta
+import atexit
+from datetime import datetime
+import threading
+import time
 
+from celery.signals import task_postrun
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
+from django.core.signals import request_finished
 from django.db.models import signals
-from django.template import loader
+from django.template import loader, Context
 from haystack import indexes
 from haystack.query import SearchQuerySet
-from tagging.models import Tag
+from tagging.models import Tag, TaggedItem
 
-from localtv.models import Video, Feed, SavedSearch
+from localtv import settings as lsettings
+from localtv.models import Video, Feed, SavedSearch, CategoryMembership
 from localtv.playlists.models import PlaylistItem
 from localtv.tasks import haystack_update, haystack_remove
 
@@ -25,6 +31,74 @@ CELERY_USING = getattr(settings, 'LOCALTV_CELERY_USING', 'default')
 DATETIME_NULL_PLACEHOLDER = datetime(1900, 1, 1)
 
 
+class IndexQueue(object):
+    """
+    Coalesces the pks which need to be updated in or removed from the search
+    index, per model, task and database, so that bulk changes turn into a
+    few index tasks rather than one per instance. A batch is sent once it
+    holds ``INDEX_QUEUE_BATCH_SIZE`` pks or its first pk has waited
+    ``INDEX_QUEUE_DELAY`` seconds; everything else is sent by :meth:`flush`,
+    which runs at the end of every request and celery task.
+
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._queued_at = {}
+
+    def add(self, app_label, model_name, pks, task, using='default'):
+        batch_size = lsettings.INDEX_QUEUE_BATCH_SIZE
+        if batch_size <= 1:
+            task.delay(app_label, model_name, pks, using=using)
+            return
+        # haystack_update removes instances which are no longer indexable,
+        # so whichever of an update or a removal was queued last wins.
+        other_task = (haystack_remove if task is haystack_update
+                      else haystack_update)
+        key = (app_label, model_name, task, using)
+        with self._lock:
+            other = self._pending.get((app_label, model_name, other_task,
+                                       using))
+            if other:
+                other.difference_update(pks)
+            pending = self._pending.setdefault(key, set())
+            pending.update(pks)
+            queued_at = self._queued_at.setdefault(key, time.time())
+            ready = (len(pending) >= batch_size or
+                     time.time() - queued_at >= lsettings.INDEX_QUEUE_DELAY)
+        if ready:
+            self.flush(key)
+
+    def flush(self, key=None):
+        """
+        Sends the pending pks for ``key`` (or for all keys, if ``key`` is
+        ``None``) to their index tasks.
+
+        """
+        with self._lock:
+            keys = self._pending.keys() if key is None else [key]
+            batches = [(k, self._pending.pop(k, set())) for k in keys]
+            for k in keys:
+                self._queued_at.pop(k, None)
+        batch_size = max(lsettings.INDEX_QUEUE_BATCH_SIZE, 1)
+        for (app_label, model_name, task, using), pks in batches:
+            pks = sorted(pks)
+            for start in xrange(0, len(pks), batch_size):
+                task.delay(app_label, model_name,
+                           pks[start:start + batch_size], using=using)
+
+
+#: The process-wide search index queue.
+index_queue = IndexQueue()
+
+
+def flush_index_queue(**kwargs):
+    index_queue.flush()
+request_finished.connect(flush_index_queue)
+task_postrun.connect(flush_index_queue)
+atexit.register(flush_index_queue)
+
+
 class QueuedSearchIndex(indexes.SearchIndex):
     def _setup_save(self):
         signals.post_save.connect(self._enqueue_update,
@@ -54,6 +128,16 @@ class QueuedSearchIndex(indexes.SearchIndex):
                       [instance.pk], task,
                       using=instance._state.db)
 
+    def enqueue_pks(self, pks, task=haystack_update, using='default'):
+        """
+        Queues ``task`` for the instances of this index's model with the
+        given ``pks``, for changes which didn't send the model's signals.
+
+        """
+        model = self.get_model()
+        self._enqueue(model._meta.app_label, model._meta.module_name,
+                      list(pks), task, using=using)
+
     def _enqueue(self, app_label, model_name, pks, task, using='default'):
         if using == 'default':
             # This gets called from both Celery and from the MC application.
@@ -61,11 +145,13 @@ class QueuedSearchIndex(indexes.SearchIndex):
             # need to use CELERY_USING as our database.  If they're the same,
             # or we're not using separate databases, this is a no-op.
             using = CELERY_USING
-        task.delay(app_label, model_name, pks, using=using)
+        index_queue.add(app_label, model_name, pks, task, using=using)
 
 
 class VideoIndex(QueuedSearchIndex, indexes.Indexable):
-    text = indexes.CharField(document=True, use_template=True)
+    #: Rendered from :attr:`text_template_name` by :meth:`prepare_text`.
+    text = indexes.CharField(document=True)
+    text_template_name = 'search/indexes/localtv/video_text.txt'
 
     # HACK because xapian-haystack django_id/pk filtering is broken.
     pk_hack = indexes.IntegerField(model_attr='pk')
@@ -150,10 +236,11 @@ class VideoIndex(QueuedSearchIndex, indexes.Indexable):
                       pks, haystack_remove,
                       using=instance._state.db)
 
-    def prepare(self, obj):
+    def get_text_template(self):
         """
-        Disable uploadtemplate loader - it always uses the default database.
-        This is a trailing necessity of the CELERY_USING hack.
+        Loads the template for the text field with the uploadtemplate loader
+        disabled - it always uses the default database. This is a trailing
+        necessity of the CELERY_USING hack.
 
         """
         if 'uploadtemplate.loader.Loader' in settings.TEMPLATE_LOADERS:
@@ -162,20 +249,64 @@ class VideoIndex(QueuedSearchIndex, indexes.Indexable):
             settings.TEMPLATE_LOADERS = tuple(loader
                                      for loader in settings.TEMPLATE_LOADERS
                                      if loader != 'uploadtemplate.loader.Loader')
-            super(VideoIndex, self).prepare(obj)
-            loader.template_source_loaders = None
-            settings.TEMPLATE_LOADERS = old_template_loaders
-        else:
-            super(VideoIndex, self).prepare(obj)
-        return self.prepared_data
+            try:
+                return loader.get_template(self.text_template_name)
+            finally:
+                loader.template_source_loaders = None
+                settings.TEMPLATE_LOADERS = old_template_loaders
+        return loader.get_template(self.text_template_name)
+
+    def prefetch_batch(self, queryset):
+        """
+        Returns a list of the videos in ``queryset``, with everything that
+        :meth:`prepare` needs loaded for the whole batch in a handful of
+        queries, rather than several queries per video. The text template is
+        also only loaded once per batch.
+
+        """
+        videos = list(queryset.select_related('feed', 'user', 'search'
+                             ).prefetch_related('authors', 'categories',
+                                                'playlists'))
+        if not videos:
+            return videos
+        using = videos[0]._state.db
+        pks = [video.pk for video in videos]
+
+        ct = ContentType.objects.db_manager(using).get_for_model(Video)
+        items = TaggedItem.objects.using(using).filter(content_type=ct,
+                                                       object_id__in=pks
+                                                       ).select_related('tag')
+        tags = {}
+        for item in items:
+            tags.setdefault(item.object_id, []).append(item.tag)
+
+        # Each video's categories and their ancestors, all at once.
+        memberships = CategoryMembership.objects.using(using).filter(
+                                 video__in=pks).select_related('category')
+        all_categories = {}
+        for membership in memberships:
+            all_categories.setdefault(membership.video_id, []).append(
+                                                         membership.category)
+
+        template = self.get_text_template()
+        for video in videos:
+            video._all_categories = all_categories.get(video.pk, [])
+            video._index_tags = tags.get(video.pk, [])
+            video._index_text_template = template
+        return videos
+
+    def prepare_text(self, video):
+        template = getattr(video, '_index_text_template', None)
+        if template is None:
+            template = self.get_text_template()
+        return template.render(Context({'object': video}))
 
     def get_model(self):
         return Video
 
     def index_queryset(self):
         """
-        Custom queryset to only search active videos and to annotate them
-        with the watch_count.
+        Custom queryset to only search active videos.
 
         """
         model = self.get_model()
@@ -197,6 +328,8 @@ class VideoIndex(QueuedSearchIndex, indexes.Indexable):
         return [int(rel.pk) for rel in getattr(video, field).all()]
 
     def prepare_tags(self, video):
+        if hasattr(video, '_index_tags'):
+            return [int(tag.pk) for tag in video._index_tags]
         # We manually run this process to be sure that the tags are fetched
         # from the correct database (not just "default").
         using = video._state.db
@@ -215,8 +348,7 @@ class VideoIndex(QueuedSearchIndex, indexes.Indexable):
         return self._prepare_rel_field(video, 'playlists')
 
     def prepare_watch_count(self, video):
-        since = datetime.now() - timedelta(7)
-        return video.watch_set.filter(timestamp__gt=since).count()
+        return video.watch_count
 
     def prepare_best_date(self, video):
         return video.when_approved or video.when_submitted
@@ -8,6 +8,76 @@ SHOW_ADMIN_DASHBOARD = getattr(settings, 'LOCALTV_SHOW_ADMIN_DASHBOARD', True)
 SHOW_ADMIN_ACCOUNT_LEVEL = getattr(settings, 'LOCALTV_SHOW_ADMIN_ACCOUNT_LEVEL',
                                    True)
 USE_HAYSTACK = getattr(settings, 'LOCALTV_USE_HAYSTACK', True)
+#: The number of videos which are sent to each import task. If this is 1,
+#: each video gets its own task. Default: 1.
+IMPORT_BATCH_SIZE = getattr(settings, 'LOCALTV_IMPORT_BATCH_SIZE', 1)
+#: The number of an import's approved videos which are sent to each index
+#: task once the import is done. Default: 100.
+IMPORT_INDEX_BATCH_SIZE = getattr(settings, 'LOCALTV_IMPORT_INDEX_BATCH_SIZE',
+                                  100)
+#: Imports move between stages as soon as their last video or index update is
+#: handled; the import status tasks only re-check stalled imports this often
+#: (in seconds) as a fallback. Default: 300.
+IMPORT_SWEEP_DELAY = getattr(settings, 'LOCALTV_IMPORT_SWEEP_DELAY', 300)
+#: The initial time (in seconds) between updates of a feed or saved search.
+#: Each source's interval then shrinks the more of its recent updates found
+#: new videos, and grows the fewer did, within the bounds below.
+#: Default: 1 hour.
+SOURCE_UPDATE_INTERVAL = getattr(settings, 'LOCALTV_SOURCE_UPDATE_INTERVAL',
+                                 60 * 60)
+SOURCE_UPDATE_MIN_INTERVAL = getattr(settings,
+                                     'LOCALTV_SOURCE_UPDATE_MIN_INTERVAL',
+                                     15 * 60)
+SOURCE_UPDATE_MAX_INTERVAL = getattr(settings,
+                                     'LOCALTV_SOURCE_UPDATE_MAX_INTERVAL',
+                                     24 * 60 * 60)
+#: The number of recent imports of a source whose results decide its update
+#: interval. Default: 10.
+SOURCE_UPDATE_HISTORY = getattr(settings, 'LOCALTV_SOURCE_UPDATE_HISTORY', 10)
+#: The fraction by which update times are randomly spread out, so that
+#: sources added together don't stay in lockstep. Default: 0.1.
+SOURCE_UPDATE_JITTER = getattr(settings, 'LOCALTV_SOURCE_UPDATE_JITTER', 0.1)
+#: The maximum number of updates which may run at once against a single
+#: host. Default: 4.
+SOURCE_UPDATE_HOST_LIMIT = getattr(settings,
+                                   'LOCALTV_SOURCE_UPDATE_HOST_LIMIT', 4)
+#: The number of pks which the search index queue collects (per model) before
+#: sending them to a single index task. Pending pks are also sent when
+#: INDEX_QUEUE_DELAY seconds have passed since the first of them was queued,
+#: and at the end of each request and celery task. If this is 1, every save
+#: gets its own index task. Default: 1.
+INDEX_QUEUE_BATCH_SIZE = getattr(settings, 'LOCALTV_INDEX_QUEUE_BATCH_SIZE', 1)
+INDEX_QUEUE_DELAY = getattr(settings, 'LOCALTV_INDEX_QUEUE_DELAY', 5)
+#: The number of watches which are buffered in memory before they are written
+#: to the database in one batch. Buffered watches are also written
+#: WATCH_BUFFER_DELAY seconds after the first of them arrived, and when the
+#: process exits. If this is 1, every watch is written as it happens.
+#: Default: 1.
+WATCH_BUFFER_SIZE = getattr(settings, 'LOCALTV_WATCH_BUFFER_SIZE', 1)
+WATCH_BUFFER_DELAY = getattr(settings, 'LOCALTV_WATCH_BUFFER_DELAY', 5)
+#: The number of seconds during which repeat watches of a video by the same
+#: user (or, for anonymous users, the same IP address) are not counted. If
+#: this is 0, every watch is counted. Default: 30 minutes.
+WATCH_DEDUPE_WINDOW = getattr(settings, 'LOCALTV_WATCH_DEDUPE_WINDOW',
+                              30 * 60)
+#: The number of days for which raw watch records are kept before
+#: ``rollup_watches`` folds them into daily per-video counts. This should be
+#: longer than the one-week popularity window. Default: 30.
+WATCH_RETENTION_DAYS = getattr(settings, 'LOCALTV_WATCH_RETENTION_DAYS', 30)
+#: The number of seconds for which the front page is cached. Anonymous users
+#: get a cached copy of the whole page; everyone shares cached copies of its
+#: video and comment lists. Stale copies keep being served while one request
+#: rebuilds them. If this is 0, the front page isn't cached. Default: 0.
+INDEX_CACHE_TIMEOUT = getattr(settings, 'LOCALTV_INDEX_CACHE_TIMEOUT', 0)
+#: If set, database result counts for listings and feeds stop at this many
+#: results, and larger totals are reported as "at least" this many.
+#: Default: None (exact counts).
+RESULT_COUNT_CAP = getattr(settings, 'LOCALTV_RESULT_COUNT_CAP', None)
+#: The number of seconds for which result counts are cached per query. They
+#: are also invalidated by content changes. If this is 0, counts aren't
+#: cached. Default: 0.
+RESULT_COUNT_CACHE_TIMEOUT = getattr(settings,
+                                     'LOCALTV_RESULT_COUNT_CACHE_TIMEOUT', 0)
 
 API_KEYS = {
     'vimeo_key': getattr(settings, 'VIMEO_API_KEY', None),
@@ -20,14 +20,15 @@ class SubmitURLForm(forms.Form):
     url = forms.URLField(verify_exists=False)
 
     def _validate_unique(self, url=None, guid=None):
-        identifiers = Q()
-        if url is not None:
-            identifiers |= Q(website_url=url) | Q(file_url=url)
-        if guid is not None:
-            identifiers |= Q(guid=guid)
-        videos = Video.objects.filter(identifiers,
-                                      ~Q(status=Video.REJECTED),
-                                      site=Site.objects.get_current())
+        urls = [url] if url is not None else []
+        videos = Video.objects.filter(
+            ~Q(status=Video.REJECTED),
+            site=Site.objects.get_current()
+        ).matching_identifiers(
+            guids=[guid] if guid is not None else [],
+            website_urls=urls,
+            file_urls=urls
+        )
 
         # HACK: We set attributes on the form so that we can provide
         # backwards-compatible template context. We should remove this when it's
@@ -103,17 +104,12 @@ class SubmitVideoFormBase(forms.ModelForm):
     def _post_clean(self):
         super(SubmitVideoFormBase, self)._post_clean()
         # By this time, cleaned data has been applied to the instance.
-        identifiers = Q()
-        if self.instance.website_url:
-            identifiers |= Q(website_url=self.instance.website_url)
-        if self.instance.file_url:
-            identifiers |= Q(file_url=self.instance.file_url)
-        if self.instance.guid:
-            identifiers |= Q(guid=self.instance.guid)
-
-        videos = Video.objects.filter(identifiers,
-                                      ~Q(status=Video.REJECTED),
-                                      site=Site.objects.get_current())
+        videos = Video.objects.filter(~Q(status=Video.REJECTED),
+                                      site=Site.objects.get_current()
+                             ).matching_identifiers(
+                                 guids=[self.instance.guid],
+                                 website_urls=[self.instance.website_url],
+                                 file_urls=[self.instance.file_url])
         if videos.exists():
             self._update_errors({NON_FIELD_ERRORS: ["That video has already "
                                                     "been submitted!"]})
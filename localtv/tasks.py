@@ -8,8 +8,8 @@ import urlparse
 from celery.exceptions import MaxRetriesExceededError
 from celery.task import task
 from django.conf import settings
-from django.core.exceptions import ValidationError
-from django.db.models import Q
+from django.core.exceptions import ValidationError, NON_FIELD_ERRORS
+from django.db.models import F, Q
 from django.db.models.loading import get_model
 from django.contrib.auth.models import User
 from django.core.files.base import ContentFile
@@ -33,24 +33,68 @@ try:
 except ImportError:
     LockError = DummyException
 
-from localtv.models import Video, Feed, SavedSearch, Category
-from localtv.settings import USE_HAYSTACK
+from localtv.models import (Video, Feed, SavedSearch, Category, FeedImport,
+                            SearchImport, WatchBucket, WatchDay)
+from localtv import settings as lsettings
+from localtv.settings import (USE_HAYSTACK, IMPORT_SWEEP_DELAY,
+                              WATCH_RETENTION_DAYS)
 from localtv.utils import quote_unicode_url
 
 
 CELERY_USING = getattr(settings, 'LOCALTV_CELERY_USING', 'default')
 
 
+def _dispatch_due_sources(sources, import_class, update_task, using='default'):
+    """
+    Queues ``update_task`` for each of the ``sources`` which is due, most
+    overdue first, and pushes its :attr:`next_update` back by its update
+    interval so that it isn't dispatched again while it runs. No more than
+    ``LOCALTV_SOURCE_UPDATE_HOST_LIMIT`` imports may be running against a
+    single host; sources over that limit stay due for the next run.
+
+    """
+    now = datetime.datetime.now()
+    due_q = Q(next_update__isnull=True) | Q(next_update__lte=now)
+    manager = sources.model._default_manager.using(using)
+
+    # Imports which have been running for longer than the longest interval
+    # are assumed to be stuck, and don't count against the limit.
+    running = import_class._default_manager.using(using).filter(
+        status=import_class.STARTED,
+        start__gte=now - datetime.timedelta(
+                                seconds=lsettings.SOURCE_UPDATE_MAX_INTERVAL)
+    ).select_related('source')
+    host_counts = {}
+    for source_import in running:
+        host = source_import.source.get_update_host()
+        host_counts[host] = host_counts.get(host, 0) + 1
+
+    for source in sources.filter(due_q).order_by('next_update'):
+        host = source.get_update_host()
+        if host_counts.get(host, 0) >= lsettings.SOURCE_UPDATE_HOST_LIMIT:
+            continue
+        # Claim the source; if it's no longer due, another run got to it.
+        if not manager.filter(due_q, pk=source.pk).update(
+                            next_update=now + source.get_update_delay()):
+            continue
+        host_counts[host] = host_counts.get(host, 0) + 1
+        update_task.delay(source.pk, using=using)
+
+
 @task(ignore_result=True)
 def update_sources(using='default'):
+    """
+    Queues updates for the auto-updating feeds and saved searches which are
+    due. This should be run every few minutes; each source is updated on its
+    own adaptive schedule (see :meth:`.Source.schedule_next_update`).
+
+    """
     feeds = Feed.objects.using(using).filter(status=Feed.ACTIVE,
                                              auto_update=True)
-    for feed_pk in feeds.values_list('pk', flat=True):
-        feed_update.delay(feed_pk, using=using)
+    _dispatch_due_sources(feeds, FeedImport, feed_update, using=using)
 
     searches = SavedSearch.objects.using(using).filter(auto_update=True)
-    for search_pk in searches.values_list('pk', flat=True):
-        search_update.delay(search_pk, using=using)
+    _dispatch_due_sources(searches, SearchImport, search_update, using=using)
 
 
 @task(ignore_result=True)
@@ -78,47 +122,73 @@ def search_update(search_id, using='default'):
     search.update(using=using, clear_rejected=True)
 
 
-@task(ignore_result=True, max_retries=None, default_retry_delay=30)
-def mark_import_pending(import_app_label, import_model, import_pk,
-                        using='default'):
+def _get_running_import(task, import_class, import_pk, status, using):
     """
-    Checks whether an import's first stage is complete. If it's not, retries
-    the task with a countdown of 30.
+    Returns the import with the given pk if it has the given ``status``, or
+    ``None`` if it has already moved on to another status (for example,
+    because another task got there first). If the import can't be found at
+    all, ``task`` is retried a limited number of times.
 
     """
-    import_class = get_model(import_app_label, import_model)
+    manager = import_class._default_manager.using(using)
     try:
-        source_import = import_class._default_manager.using(using).get(
-                                                    pk=import_pk,
-                                                    status=import_class.STARTED)
+        return manager.get(pk=import_pk, status=status)
     except import_class.DoesNotExist:
+        if manager.filter(pk=import_pk).exists():
+            return None
         logging.debug('Expected %s instance (pk=%r) missing.',
                       import_class.__name__, import_pk)
         # If this is the problem, don't retry indefinitely.
-        if mark_import_pending.request.retries > 10:
+        if task.request.retries > 10:
             raise MaxRetriesExceededError
-        mark_import_pending.retry()
-    source_import.last_activity = datetime.datetime.now()
+        task.retry()
+
+
+@task(ignore_result=True, max_retries=None,
+      default_retry_delay=IMPORT_SWEEP_DELAY)
+def mark_import_pending(import_app_label, import_model, import_pk,
+                        using='default'):
+    """
+    Moves an import to its second stage once all of its videos have been
+    imported or skipped. This is queued as soon as the import's counters show
+    that the last video has been handled; if the import isn't finished yet,
+    the task acts as a fallback sweeper and retries every
+    ``IMPORT_SWEEP_DELAY`` seconds.
+
+    """
+    import_class = get_model(import_app_label, import_model)
+    source_import = _get_running_import(mark_import_pending, import_class,
+                                        import_pk, import_class.STARTED, using)
+    if source_import is None:
+        return
+    manager = import_class._default_manager.using(using)
+    now = datetime.datetime.now()
     if source_import.total_videos is None:
-        source_import.save()
+        manager.filter(pk=import_pk).update(last_activity=now)
         mark_import_pending.retry()
-    # get the correct counts from the database, rather than the race-condition
-    # prone count fields
-    import_count = source_import.indexes.count()
-    skipped_count = source_import.errors.filter(is_skip=True).count()
-    if import_count != source_import.videos_imported:
-        source_import.videos_imported = import_count
-    if skipped_count != source_import.videos_skipped:
-        source_import.videos_skipped = skipped_count
+
     if (source_import.videos_imported + source_import.videos_skipped
         < source_import.total_videos):
-        # Then the import is incomplete. Requeue it.
-        source_import.save()
-        # Retry raises an exception, ending task execution.
-        mark_import_pending.retry()
+        # The counters are updated atomically, but double-check them against
+        # the database before deciding that the import is stalled.
+        import_count = source_import.indexes.count()
+        skipped_count = source_import.errors.filter(is_skip=True).count()
+        manager.filter(pk=import_pk).update(last_activity=now,
+                                            videos_imported=import_count,
+                                            videos_skipped=skipped_count)
+        if import_count + skipped_count < source_import.total_videos:
+            # Then the import is incomplete. Requeue it.
+            # Retry raises an exception, ending task execution.
+            mark_import_pending.retry()
+
+    # Otherwise the first stage is complete. Claim the transition so that
+    # only one task approves the videos.
+    if not manager.filter(pk=import_pk, status=import_class.STARTED
+                          ).update(status=import_class.PENDING,
+                                   last_activity=now):
+        return
 
-    # Otherwise the first stage is complete. Check whether they can take all
-    # the videos.
+    # Check whether they can take all the videos.
     if source_import.auto_approve:
         active_set = source_import.get_videos(using).filter(
             status=Video.PENDING)
@@ -137,48 +207,58 @@ def mark_import_pending(import_app_label, import_model, import_pk,
     source_import.get_videos(using).filter(status=Video.PENDING).update(
         status=Video.UNAPPROVED)
 
-    source_import.status = import_class.PENDING
-    source_import.save()
-
-    active_pks = source_import.get_videos(using).filter(
-                         status=Video.ACTIVE).values_list('pk', flat=True)
-    if active_pks:
-        opts = Video._meta
-        haystack_batch_update.delay(opts.app_label, opts.module_name,
-                                    pks=list(active_pks), remove=False,
-                                    using=using)
-
-    mark_import_complete.delay(import_app_label, import_model, import_pk,
-                               using=using)
-
+    active_pks = list(source_import.get_videos(using).filter(
+                         status=Video.ACTIVE).values_list('pk', flat=True))
+    batch_size = lsettings.IMPORT_INDEX_BATCH_SIZE
+    batches = [active_pks[start:start + batch_size]
+               for start in xrange(0, len(active_pks), batch_size)]
+    if not USE_HAYSTACK or not batches:
+        mark_import_complete.delay(import_app_label, import_model, import_pk,
+                                   using=using)
+        return
 
-@task(ignore_result=True, max_retries=None, default_retry_delay=30)
+    manager.filter(pk=import_pk).update(index_batches_pending=len(batches))
+    opts = Video._meta
+    for pks in batches:
+        haystack_update.delay(opts.app_label, opts.module_name, pks,
+                              remove=False, using=using,
+                              import_app_label=import_app_label,
+                              import_model=import_model,
+                              import_pk=import_pk)
+    # The last index update marks the import complete; this is only a
+    # fallback in case that never happens.
+    mark_import_complete.apply_async(args=(import_app_label, import_model,
+                                           import_pk),
+                                     kwargs={'using': using},
+                                     countdown=IMPORT_SWEEP_DELAY)
+
+
+@task(ignore_result=True, max_retries=None,
+      default_retry_delay=IMPORT_SWEEP_DELAY)
 def mark_import_complete(import_app_label, import_model, import_pk,
                          using='default'):
     """
-    Checks whether an import's second stage is complete. If it's not, retries
-    the task with a countdown of 30.
+    Marks an import as complete once all of its active videos have been
+    indexed. This is queued by the import's last index update; if the import
+    still has index updates pending, the task acts as a fallback sweeper,
+    checks the search index directly and retries every
+    ``IMPORT_SWEEP_DELAY`` seconds.
 
     """
     import_class = get_model(import_app_label, import_model)
-    try:
-        source_import = import_class._default_manager.using(using).get(
-                                                    pk=import_pk,
-                                                    status=import_class.PENDING)
-    except import_class.DoesNotExist:
-        logging.warn('Expected %s instance (pk=%r) missing.',
-                     import_class.__name__, import_pk)
-        # If this is the problem, don't retry indefinitely.
-        if mark_import_complete.request.retries > 10:
-            raise MaxRetriesExceededError
-        mark_import_complete.retry()
+    source_import = _get_running_import(mark_import_complete, import_class,
+                                        import_pk, import_class.PENDING, using)
+    if source_import is None:
+        return
+    manager = import_class._default_manager.using(using)
+    now = datetime.datetime.now()
 
-    if not USE_HAYSTACK:
+    if not USE_HAYSTACK or not source_import.index_batches_pending:
         # No need to do any comparisons - just mark it complete.
         video_count = haystack_count = 0
         logging.debug(('mark_import_complete(%s, %s, %i, using=%s). Skipping '
-                       'check because haystack is disabled.'), import_app_label,
-                       import_model, import_pk, using)
+                       'check because no index updates are pending.'),
+                       import_app_label, import_model, import_pk, using)
     else:
         video_pks = list(source_import.get_videos(using).filter(
                                 status=Video.ACTIVE).values_list('pk', flat=True))
@@ -199,17 +279,39 @@ def mark_import_complete(import_app_label, import_model, import_pk,
                        '%i, haystack_count: %i'), import_app_label, import_model,
                        import_pk, using, video_count, haystack_count)
 
-    if haystack_count >= video_count:
-        source_import.status = import_class.COMPLETE
-        if import_app_label == 'localtv' and import_model == 'feedimport':
-            source_import.source.status = source_import.source.ACTIVE
-            source_import.source.save()
+    if haystack_count < video_count:
+        manager.filter(pk=import_pk).update(last_activity=now)
+        mark_import_complete.retry()
 
-    source_import.last_activity = datetime.datetime.now()
-    source_import.save()
+    if not manager.filter(pk=import_pk, status=import_class.PENDING
+                          ).update(status=import_class.COMPLETE,
+                                   index_batches_pending=0,
+                                   last_activity=now):
+        return
 
-    if source_import.status == import_class.PENDING:
-        mark_import_complete.retry()
+    source = source_import.source
+    if import_app_label == 'localtv' and import_model == 'feedimport':
+        source.status = source.ACTIVE
+        source.save()
+    source.schedule_next_update(using=using)
+
+
+def _index_batch_finished(import_app_label, import_model, import_pk,
+                          using='default'):
+    """
+    Counts down the index updates pending for an import, and queues
+    :func:`mark_import_complete` when the last one has finished.
+
+    """
+    import_class = get_model(import_app_label, import_model)
+    manager = import_class._default_manager.using(using).filter(
+                                                pk=import_pk,
+                                                status=import_class.PENDING)
+    manager.filter(index_batches_pending__gt=0).update(
+        index_batches_pending=F('index_batches_pending') - 1)
+    if manager.filter(index_batches_pending=0).exists():
+        mark_import_complete.delay(import_app_label, import_model, import_pk,
+                                   using=using)
 
 
 @task(ignore_result=True, max_retries=6, default_retry_delay=10)
@@ -284,6 +386,187 @@ def video_from_vidscraper_video(vidscraper_video, site_pk,
                                    with_exception=True)
         raise # so it shows up in the Celery log
 
+@task(ignore_result=True, max_retries=6, default_retry_delay=10)
+def video_from_vidscraper_videos(vidscraper_videos, site_pk,
+                                 import_app_label=None, import_model=None,
+                                 import_pk=None, status=None, author_pks=None,
+                                 category_pks=None, clear_rejected=False,
+                                 using='default'):
+    """
+    Batched version of :func:`video_from_vidscraper_video`. Duplicate checks
+    for the whole batch are run in a single query, and the related rows for
+    the imported videos are created in bulk. Errors are still recorded on the
+    import for each video.
+
+    """
+    import_class = get_model(import_app_label, import_model)
+    try:
+        source_import = import_class.objects.using(using).get(
+           pk=import_pk,
+           status=import_class.STARTED)
+    except import_class.DoesNotExist:
+        logging.warn('Retrying batch of %i videos: expected %s instance '
+                     '(pk=%r) missing.', len(vidscraper_videos),
+                     import_class.__name__, import_pk)
+        video_from_vidscraper_videos.retry()
+
+    if category_pks:
+        categories = list(Category.objects.using(using).filter(
+                                                      pk__in=category_pks))
+    else:
+        categories = None
+
+    if author_pks:
+        authors = list(User.objects.using(using).filter(pk__in=author_pks))
+    else:
+        authors = None
+
+    videos = []
+    for vidscraper_video in vidscraper_videos:
+        try:
+            vidscraper_video.load()
+        except Exception:
+            source_import.handle_error(
+                ('Skipped %r: Could not load video data.'
+                 % vidscraper_video.url),
+                using=using, is_skip=True,
+                with_exception=True)
+            continue
+
+        try:
+            video = Video.from_vidscraper_video(vidscraper_video,
+                                                status=status,
+                                                using=using,
+                                                source_import=source_import,
+                                                authors=authors,
+                                                categories=categories,
+                                                site_pk=site_pk,
+                                                commit=False,
+                                                update_index=False)
+            # Run everything in full_clean() except the duplicate checks,
+            # which are done for the whole batch at once.
+            errors = {}
+            try:
+                video.clean_fields()
+            except ValidationError, e:
+                errors = e.update_error_dict(errors)
+            try:
+                video.clean_media()
+            except ValidationError, e:
+                errors = e.update_error_dict(errors)
+        except Exception:
+            source_import.handle_error(('Unknown error during import of %r'
+                                        % vidscraper_video.url),
+                                       is_skip=True, using=using,
+                                       with_exception=True)
+        else:
+            if errors:
+                source_import.handle_error(("Skipping %r: %r" % (
+                                            vidscraper_video.url, errors)),
+                                            is_skip=True, using=using)
+            else:
+                videos.append(video)
+
+    videos = _exclude_duplicates(videos, site_pk, source_import, using)
+
+    saved = []
+    for video in videos:
+        try:
+            video.save(update_index=False)
+        except Exception:
+            source_import.handle_error(('Unknown error during import of %r'
+                                        % video._vidscraper_video.url),
+                                       is_skip=True, using=using,
+                                       with_exception=True)
+        else:
+            saved.append(video)
+
+    try:
+        Video.bulk_save_m2m(saved, using=using, source_import=source_import,
+                            authors=authors, categories=categories,
+                            update_index=False)
+    except Exception:
+        Video.objects.using(using).filter(
+                            pk__in=[video.pk for video in saved]).delete()
+        for video in saved:
+            source_import.handle_error(('Unknown error during import of %r'
+                                        % video._vidscraper_video.url),
+                                       is_skip=True, using=using,
+                                       with_exception=True)
+        raise # so it shows up in the Celery log
+
+    if clear_rejected:
+        _clear_rejected_duplicates(saved, site_pk, using)
+
+    for video in saved:
+        logging.debug('Made video %i: %r', video.pk, video.name)
+        if video.thumbnail_url:
+            video_save_thumbnail.delay(video.pk, using=using)
+
+
+_DUPLICATE_FIELDS = ('guid', 'website_url', 'file_url')
+
+
+def _identifiers(videos):
+    """
+    Returns the identifier kwargs for :meth:`.VideoQuerySet.matching_identifiers`
+    covering all of the given ``videos``.
+
+    """
+    return {
+        'guids': [video.guid for video in videos],
+        'website_urls': [video.website_url for video in videos],
+        'file_urls': [video.file_url for video in videos],
+    }
+
+
+def _exclude_duplicates(videos, site_pk, source_import, using='default'):
+    """
+    Returns the ``videos`` which don't duplicate an existing, non-rejected
+    video or an earlier video in the same list. The existing videos are
+    found with a single query; skipped videos are recorded on the
+    ``source_import``.
+
+    """
+    if not videos:
+        return videos
+    seen = Video.objects.using(using).filter(site=site_pk).exclude(
+                                status=Video.REJECTED).existing_identifiers(
+                                **_identifiers(videos))
+
+    unique = []
+    for video in videos:
+        for field in _DUPLICATE_FIELDS:
+            value = getattr(video, field)
+            if value and value in seen[field]:
+                message_dict = {NON_FIELD_ERRORS: [
+                    "Another video with the same %s already exists." %
+                    field.replace('_', ' ')]}
+                source_import.handle_error(("Skipping %r: %r" % (
+                                    video._vidscraper_video.url,
+                                    message_dict)),
+                                    is_skip=True, using=using)
+                break
+        else:
+            for field in _DUPLICATE_FIELDS:
+                if getattr(video, field):
+                    seen[field].add(getattr(video, field))
+            unique.append(video)
+    return unique
+
+
+def _clear_rejected_duplicates(videos, site_pk, using='default'):
+    """
+    Batched version of :meth:`Video.clear_rejected_duplicates`.
+
+    """
+    if not videos:
+        return
+    Video.objects.using(using).filter(site=site_pk, status=Video.REJECTED
+                             ).matching_identifiers(**_identifiers(videos)
+                             ).delete()
+
+
 @task(ignore_result=True)
 def video_save_thumbnail(video_pk, using='default'):
     try:
@@ -362,7 +645,8 @@ def _haystack_database_retry(task, callback):
 
 
 @task(ignore_result=True, max_retries=None)
-def haystack_update(app_label, model_name, pks, remove=True, using='default'):
+def haystack_update(app_label, model_name, pks, remove=True, using='default',
+                    import_app_label=None, import_model=None, import_pk=None):
     """
     Updates the haystack records for any valid instances with the given pks.
     Generally, ``remove`` should be ``True`` so that items which are no longer
@@ -370,35 +654,94 @@ def haystack_update(app_label, model_name, pks, remove=True, using='default'):
     ``remove`` can be set to ``False`` to save some time if that behavior
     isn't needed.
 
+    If an import is given, the update counts as one of that import's pending
+    index batches.
+
     """
     model_class = get_model(app_label, model_name)
     backend = connections[using].get_backend()
     index = connections[using].get_unified_index().get_index(model_class)
 
     qs = index.index_queryset().using(using).filter(pk__in=pks)
+    if hasattr(index, 'prefetch_batch'):
+        instances = index.prefetch_batch(qs)
+    else:
+        instances = list(qs)
 
-    if qs:
+    if instances:
         _haystack_database_retry(haystack_update,
-                                 lambda: backend.update(index, qs))
+                                 lambda: backend.update(index, instances))
 
     if remove:
-        unseen_pks = set(pks) - set((instance.pk for instance in qs))
+        unseen_pks = set(pks) - set((instance.pk for instance in instances))
         haystack_remove.apply(args=(app_label, model_name, unseen_pks, using))
 
+    if import_pk is not None:
+        _index_batch_finished(import_app_label, import_model, import_pk,
+                              using=using)
 
-@task(ignore_result=True, max_retries=None)
-def haystack_remove(app_label, model_name, pks, using='default'):
+
+def _whoosh_bulk_remove(backend, identifiers):
+    from haystack.constants import ID
+    if not backend.setup_complete:
+        backend.setup()
+    backend.index = backend.index.refresh()
+    writer = backend.index.writer()
+    try:
+        for identifier in identifiers:
+            writer.delete_by_term(ID, identifier)
+    except Exception:
+        writer.cancel()
+        raise
+    writer.commit()
+
+
+def _xapian_bulk_remove(backend, identifiers):
+    try:
+        from xapian_backend import DOCUMENT_ID_TERM_PREFIX
+    except ImportError:
+        DOCUMENT_ID_TERM_PREFIX = 'Q'
+    database = backend._database(writable=True)
+    database.begin_transaction()
+    try:
+        for identifier in identifiers:
+            database.delete_document(DOCUMENT_ID_TERM_PREFIX + identifier)
+    except Exception:
+        database.cancel_transaction()
+        raise
+    database.commit_transaction()
+
+
+def _bulk_remove(identifiers, using='default'):
     """
-    Removes the haystack records for any instances with the given pks.
+    Removes the documents with the given ``identifiers`` from the index. For
+    whoosh and xapian, this is done with a single writer and commit, rather
+    than one per document; other backends fall back to calling
+    ``backend.remove()`` for each document.
 
     """
     backend = connections[using].get_backend()
+    engine = connections[using].options['ENGINE']
+    if 'whoosh' in engine:
+        _whoosh_bulk_remove(backend, identifiers)
+    elif 'xapian' in engine:
+        _xapian_bulk_remove(backend, identifiers)
+    else:
+        for identifier in identifiers:
+            backend.remove(identifier)
 
-    def callback():
-        for pk in pks:
-            backend.remove(".".join((app_label, model_name, str(pk))))
 
-    _haystack_database_retry(haystack_remove, callback)
+@task(ignore_result=True, max_retries=None)
+def haystack_remove(app_label, model_name, pks, using='default'):
+    """
+    Removes the haystack records for any instances with the given pks.
+
+    """
+    identifiers = [".".join((app_label, model_name, str(pk))) for pk in pks]
+    if not identifiers:
+        return
+    _haystack_database_retry(haystack_remove,
+                             lambda: _bulk_remove(identifiers, using))
 
 
 @task(ignore_result=True)
@@ -433,3 +776,30 @@ def haystack_batch_update(app_label, model_name, pks=None, start=None,
         haystack_update.delay(app_label, model_name, pks[start:end],
                               remove=remove, using=using)
 
+
+@task(ignore_result=True)
+def update_popularity(using='default'):
+    """
+    Recomputes :attr:`Video.watch_count` from the hourly watch buckets and
+    reindexes the videos whose count changed.
+
+    """
+    pks = WatchBucket.update_watch_counts(using=using)
+    if pks and USE_HAYSTACK:
+        haystack_batch_update.delay(Video._meta.app_label,
+                                    Video._meta.module_name,
+                                    pks=pks, using=using)
+
+
+@task(ignore_result=True)
+def rollup_watches(days=WATCH_RETENTION_DAYS, batch_size=1000,
+                   using='default'):
+    """
+    Rolls watches from more than ``days`` days ago up into daily per-video
+    counts and deletes them.
+
+    """
+    before = datetime.datetime.combine(datetime.date.today(),
+                                       datetime.time()
+                                       ) - datetime.timedelta(days)
+    WatchDay.rollup(before, batch_size=batch_size, using=using)
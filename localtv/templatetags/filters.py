@@ -127,6 +127,9 @@ def same_db_tags(video):
     from localtv.models import Video
     if not isinstance(video, Video):
         return u''
+    if hasattr(video, '_index_tags'):
+        # Prefetched by VideoIndex.prefetch_batch.
+        return u'\n'.join([unicode(t) for t in video._index_tags])
     using = video._state.db
     ct = ContentType.objects.db_manager(using).get_for_model(video)
     tags = Tag.objects.using(using).filter(items__content_type__pk=ct.pk,
@@ -6,6 +6,7 @@ from django.conf import settings
 from django.contrib.auth.models import User, AnonymousUser
 from django.contrib.sites.models import Site
 from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import cache
 from django.core.management import call_command
 from django.db import transaction
 from django.http import QueryDict
@@ -21,8 +22,8 @@ from tagging.models import Tag
 import vidscraper
 
 import localtv
-from localtv.models import (Video, SiteSettings, Watch, Category, Feed,
-                            SavedSearch)
+from localtv.models import (Video, SiteSettings, Watch, WatchBucket, Category,
+                            Feed, SavedSearch)
 from localtv.middleware import UserIsAdminMiddleware
 from localtv.playlists.models import Playlist
 
@@ -105,6 +106,7 @@ class BaseTestCase(TestCase):
         super(BaseTestCase, self).setUp()
         self.factory = FakeRequestFactory()
         SiteSettings.objects.clear_cache()
+        cache.clear()
 
     @classmethod
     def create_video(cls, name='Test.', status=Video.ACTIVE, site_id=1,
@@ -132,6 +134,8 @@ class BaseTestCase(TestCase):
 
         for i in xrange(watches):
             cls.create_watch(video, days=i)
+        if watches:
+            video.watch_count = Video.objects.get(pk=video.pk).watch_count
 
         if categories is not None:
             video.categories.add(*categories)
@@ -204,6 +208,8 @@ class BaseTestCase(TestCase):
         watch = Watch.objects.create(video=video, ip_address=ip_address)
         watch.timestamp = datetime.now() - timedelta(days)
         watch.save()
+        WatchBucket.record(video, watch.timestamp)
+        WatchBucket.update_watch_counts()
         return watch
 
     @classmethod
@@ -8,7 +8,6 @@ from django.core.files.base import File
 from django.core.paginator import Page
 from django.core import mail
 from django.core.urlresolvers import reverse_lazy, reverse
-from django.db.models import Q
 from django.forms.models import model_to_dict
 from django.test.client import Client
 from django.test.utils import override_settings
@@ -2345,13 +2344,24 @@ class BulkEditAdministrationTestCase(AdministrationBaseTestCase):
         c = Client()
         c.login(username='admin', password='admin')
         response = c.get(self.url, {'q': 'blend'})
-        self.assertEqual(list(response.context['page'].object_list),
-                          list(self.Video_sort_lower(
-                    Q(name__icontains="blend") |
-                    Q(description__icontains="blend") |
-                    Q(feed__name__icontains="blend"),
-                    status=Video.ACTIVE,
-                    )))
+        self.assertEqual([video.pk for video in
+                          response.context['page'].object_list],
+                         [36])
+
+    def test_GET_search_not_indexed(self):
+        """
+        Unapproved and rejected videos aren't in the search index, so their
+        names and descriptions should be searched instead.
+        """
+        c = Client()
+        c.login(username='admin', password='admin')
+        for filter_type, pks in (
+            ('unapproved', [34, 32, 30, 28, 26, 24, 22, 18, 16, 1, 14]),
+            ('rejected', [11])):
+            response = c.get(self.url, {'filter': filter_type, 'q': 'blend'})
+            self.assertEqual([video.pk for video in
+                              response.context['page'].object_list],
+                             pks)
 
     def test_POST_failure(self):
         """
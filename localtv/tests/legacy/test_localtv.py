@@ -5,6 +5,7 @@ import tempfile
 from urllib import quote_plus, urlencode
 
 import feedparser
+import mock
 import vidscraper
 
 from django.conf import settings
@@ -17,6 +18,7 @@ from django.contrib.sessions.middleware import SessionMiddleware
 from django.contrib.sites.models import Site
 from django.core.files import storage
 from django.core import mail
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.db.models import Q
 from django.http import HttpRequest
@@ -31,10 +33,11 @@ import localtv
 import localtv.templatetags.filters
 from localtv.middleware import UserIsAdminMiddleware
 from localtv import models
-from localtv.models import Watch, Category, SiteSettings, Video, Feed
+from localtv.models import (Watch, WatchBucket, Category, SiteSettings, Video,
+                            Feed)
 from localtv import utils
 import localtv.feeds.views
-from localtv.search.utils import NormalizedVideoList
+from localtv.search.utils import NormalizedVideoList, ResultCounter
 from localtv.tasks import haystack_batch_update
 
 from notification import models as notification
@@ -256,6 +259,8 @@ class ViewTestCase(BaseTestCase):
         the base categories (those without parents).
         """
         Watch.objects.update(timestamp=datetime.datetime.now())
+        WatchBucket.rebuild()
+        WatchBucket.update_watch_counts()
         # Rebuild index to work around https://bitbucket.org/mchaput/whoosh/issue/237
         #haystack_batch_update.apply(args=(Video._meta.app_label,
         #                                  Video._meta.module_name))
@@ -331,6 +336,8 @@ class ViewTestCase(BaseTestCase):
             watched.timestamp = datetime.datetime.now() # so that they're
                                                         # recent
             watched.save()
+        WatchBucket.rebuild()
+        WatchBucket.update_watch_counts()
         self._rebuild_index()
 
         video = Video.objects.get(pk=20)
@@ -665,8 +672,9 @@ class ViewTestCase(BaseTestCase):
         self.assertEqual(response.templates[0].name,
                           'localtv/category.html')
         self.assertEqual(response.context['category'], category)
-        videos = list(models.Video.objects.with_best_date().filter(
-                status=models.Video.ACTIVE).order_by('-best_date')[:15])
+        videos = list(models.Video.objects.filter(
+                status=models.Video.ACTIVE).order_by(
+                '-best_date_with_published')[:15])
         self.assertEqual(videos, sorted(videos, key=lambda v: v.when(),
                                         reverse=True))
         self.assertEqual(response.context['page_obj'].object_list,
@@ -700,7 +708,7 @@ class ViewTestCase(BaseTestCase):
         expected = list(
             Video.objects.get_latest_videos(site_settings).filter(
                 Q(user=author) | Q(authors=author)
-            ).distinct().order_by('-best_date')
+            ).distinct()
         )
         self.assertStatusCodeEquals(response, 200)
         self.assertEqual(response.templates[0].name,
@@ -754,6 +762,8 @@ class ListingViewTestCase(BaseTestCase):
         all the videos, sorted by popularity.
         """
         Watch.objects.update(timestamp=datetime.datetime.now())
+        WatchBucket.rebuild()
+        WatchBucket.update_watch_counts()
         haystack_batch_update.apply(args=(Video._meta.app_label,
                                           Video._meta.module_name))
 
@@ -1229,6 +1239,11 @@ class WatchModelTestCase(BaseTestCase):
 
     fixtures = BaseTestCase.fixtures + ['feeds', 'videos']
 
+    def setUp(self):
+        BaseTestCase.setUp(self)
+        # Repeat watches are recognized through the cache.
+        cache.clear()
+
     def test_add(self):
         """
         Watch.add(request, video) should add a Watch object to the database for
@@ -1303,6 +1318,20 @@ class WatchModelTestCase(BaseTestCase):
 
         self.assertEqual(Watch.objects.count(), 0)
 
+    def test_add_repeat(self):
+        """
+        Repeat watches from the same IP address within the dedupe window
+        shouldn't count, but watches from other addresses should.
+        """
+        video = Video.objects.get(pk=1)
+
+        for ip in ('123.123.123.123', '123.123.123.123', '124.124.124.124'):
+            request = HttpRequest()
+            request.META['REMOTE_ADDR'] = ip
+            Watch.add(request, video)
+
+        self.assertEqual(Watch.objects.count(), 2)
+
 
 class TestWmodeFilter(BaseTestCase):
     def test_add_transparent_wmode_to_object(self):
@@ -1347,6 +1376,24 @@ class LegacyFeedViewTestCase(BaseTestCase):
         # 23, because that's the number of videos in the fixture
         self.assertEqual(23, len(feed.items(obj)))
 
+    def test_opensearch_items__capped_count(self):
+        """
+        If the count was capped, a next page should be offered unless the
+        page came up short.
+
+        """
+        feed = localtv.feeds.views.NewVideosFeed(json=False)
+        form = mock.Mock()
+        form.uses_cursor.return_value = False
+        form.get_cursor.return_value = 'cursor'
+        videos = Video.objects.filter(status=Video.ACTIVE)
+        for count, has_next in ((10, True), (30, False)):
+            obj = feed.get_object(self.factory.get('?count=%i' % count))
+            items = NormalizedVideoList(videos, counter=ResultCounter(cap=5))
+            page = feed._opensearch_items(items, obj, form)
+            self.assertEqual(len(page), min(count, 23))
+            self.assertEqual('next_cursor' in obj, has_next)
+
     def test_category_feed_renders_at_all(self):
         fake_request = self.factory.get('?count=10')
         view = localtv.feeds.views.CategoryVideosFeed()
@@ -34,6 +34,30 @@ class NormalizedVideoListUnitTestCase(BaseTestCase):
         self.assertTrue(all(isinstance(v, Video) for v in self.nvl2[:]))
         self.assertTrue(isinstance(self.nvl2[0], Video))
 
+    def test_getitem__queries(self):
+        """
+        Haystack results should be hydrated in one query, plus one per
+        prefetched relation, however many results there are.
+
+        """
+        with self.assertNumQueries(3):
+            videos = self.nvl2[:]
+            [list(v.categories.all()) + list(v.authors.all()) for v in videos]
+        self.assertEqual(len(videos), 2)
+
+    def test_getitem__stale(self):
+        """
+        Haystack results for videos which are no longer active should be
+        dropped.
+
+        """
+        video = self.nvl2[0]
+        Video.objects.filter(pk=video.pk).update(status=Video.REJECTED)
+        videos = self.nvl2[:]
+        self.assertEqual(len(videos), 1)
+        self.assertNotEqual(videos[0].pk, video.pk)
+        self.assertEqual(list(self.nvl2), videos)
+
     def test_len(self):
         """
         __len__ should return the length of the video list.
@@ -42,6 +66,36 @@ class NormalizedVideoListUnitTestCase(BaseTestCase):
         self.assertEqual(len(self.nvl1), 2)
         self.assertEqual(len(self.nvl2), 2)
 
+    def test_count__capped(self):
+        """
+        A capped counter should stop counting database results at the cap
+        and say that the count isn't exact.
+
+        """
+        nvl = utils.NormalizedVideoList(Video.objects.all(),
+                                        counter=utils.ResultCounter(cap=2))
+        self.assertEqual(nvl.count(), 2)
+        self.assertFalse(nvl.count_is_exact)
+        nvl = utils.NormalizedVideoList(Video.objects.all(),
+                                        counter=utils.ResultCounter(cap=3))
+        self.assertEqual(nvl.count(), 3)
+        self.assertTrue(nvl.count_is_exact)
+
+    def test_count__cached(self):
+        """
+        A caching counter should only query once for the same query, until
+        the site's content changes.
+
+        """
+        counter = utils.ResultCounter(timeout=60)
+        qs = Video.objects.filter(status=Video.ACTIVE)
+        self.assertEqual(utils.NormalizedVideoList(qs, counter).count(), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(utils.NormalizedVideoList(qs, counter).count(),
+                             2)
+        self.create_video()
+        self.assertEqual(utils.NormalizedVideoList(qs, counter).count(), 3)
+
     def test_iter(self):
         """
         Iterating over a NormalizedVideoList should yield video instances.
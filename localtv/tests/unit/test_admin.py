@@ -1,6 +1,9 @@
 from django.contrib.sites.models import Site
+import mock
 
+from localtv.admin.bulk_edit_views import search_videos
 from localtv.admin.forms import AddFeedForm
+from localtv.models import Video
 from localtv.tests import BaseTestCase
 
 
@@ -14,3 +17,30 @@ class AddFeedTestCase(BaseTestCase):
         self.assertFalse(form.is_valid())
         self.assertEqual(form.errors.get('feed_url'),
                          ["Feed with this URL already exists."])
+
+
+class SearchVideosTestCase(BaseTestCase):
+    def test_truncated(self):
+        """
+        Index searches with more than SEARCH_LIMIT hits should be cut down to
+        the best ones, and say so.
+
+        """
+        site = Site.objects.get_current()
+        videos = [self.create_video(name=str(i)) for i in xrange(3)]
+        pks = [video.pk for video in videos]
+        with mock.patch('localtv.admin.bulk_edit_views.SEARCH_LIMIT', 2):
+            with mock.patch('localtv.admin.bulk_edit_views.search_video_pks',
+                            return_value=pks) as search_video_pks:
+                results, truncated = search_videos(Video.objects.all(),
+                                                   'query', site)
+            search_video_pks.assert_called_once_with('query', site.pk, 3)
+            self.assertTrue(truncated)
+            self.assertEqual(set(results), set(videos[:2]))
+
+            with mock.patch('localtv.admin.bulk_edit_views.search_video_pks',
+                            return_value=pks[:2]):
+                results, truncated = search_videos(Video.objects.all(),
+                                                   'query', site)
+            self.assertFalse(truncated)
+            self.assertEqual(set(results), set(videos[:2]))
@@ -0,0 +1,75 @@
+from __future__ import with_statement
+from StringIO import StringIO
+
+import mock
+from django.core.management import call_command
+from django.db import connections
+from django.test import TransactionTestCase
+
+from localtv.management.commands.explain_queries import Command
+from localtv.models import SiteSettings
+from localtv.tests import BaseTestCase
+
+
+class ExplainQueriesTestCase(TransactionTestCase):
+    """
+    SQLite commits the open transaction before an ``EXPLAIN``, so these tests
+    can't be rolled back; the database is flushed after each one instead.
+
+    """
+    def setUp(self):
+        SiteSettings.objects.clear_cache()
+        BaseTestCase.create_feed('http://google.com/')
+
+    def tearDown(self):
+        SiteSettings.objects.clear_cache()
+        call_command('flush', verbosity=0, interactive=False)
+
+    def test_get_queries(self):
+        """
+        The listing, feed and duplicate-check queries should be explained.
+
+        """
+        self.assertEqual([name for name, queryset
+                          in Command().get_queries('default')],
+                         ['latest', 'featured', 'approved', 'feed',
+                          'duplicates'])
+
+    def test_explain(self):
+        """
+        The latest videos and duplicate checks should be served by indexes.
+
+        """
+        command = Command()
+        connection = connections['default']
+        for name, queryset in command.get_queries('default'):
+            if name not in ('latest', 'duplicates'):
+                continue
+            sql, params = queryset.query.get_compiler('default').as_sql()
+            self.assertEqual(command.explain(connection, sql, params), [],
+                             name)
+
+    def test_handle_noargs(self):
+        """
+        Each query should be reported, and full table scans should make the
+        command fail.
+
+        """
+        stdout = StringIO()
+        with mock.patch.object(Command, 'explain', return_value=[]):
+            call_command('explain_queries', verbosity=2, stdout=stdout)
+        self.assertEqual(stdout.getvalue().splitlines(),
+                         ['latest: ok', 'featured: ok', 'approved: ok',
+                          'feed: ok', 'duplicates: ok'])
+
+        # call_command reports a CommandError on stderr and exits.
+        stdout, stderr = StringIO(), StringIO()
+        with mock.patch.object(Command, 'explain',
+                               return_value=['SCAN TABLE localtv_video']):
+            self.assertRaises(SystemExit, call_command, 'explain_queries',
+                              stdout=stdout, stderr=stderr)
+        self.assertEqual(stdout.getvalue().splitlines()[:2],
+                         ['latest: 1 full table scan(s)',
+                          '    SCAN TABLE localtv_video'])
+        self.assertTrue('5 queries use full table scans.' in
+                        stderr.getvalue())
@@ -3,13 +3,16 @@ import datetime
 from celery.signals import task_postrun
 from haystack.query import SearchQuerySet
 import mock
+from tagging.models import Tag
 import vidscraper
 from vidscraper.suites.youtube import Suite as YouTubeSuite
 from vidscraper.videos import (Video as VidscraperVideo,
                                VideoFile as VidscraperVideoFile)
 
 from localtv.models import Source, Feed, FeedImport, Video, FeedImportIndex
-from localtv.tasks import haystack_update, haystack_remove, video_save_thumbnail
+from localtv.tasks import (haystack_update, haystack_remove,
+                           video_save_thumbnail, video_from_vidscraper_videos,
+                           mark_import_pending, mark_import_complete)
 from localtv.tests import BaseTestCase
 
 
@@ -47,6 +50,76 @@ class SourceImportUnitTestCase(BaseTestCase):
             Video.objects.get(pk=video.pk)
         self.assertEqual(feed_import.errors.count(), 1)
 
+    def test_check_videos_handled(self):
+        """
+        The first stage of the import should be finished as soon as the last
+        video is handled, rather than waiting for a polling task.
+
+        """
+        feed = self.create_feed('http://google.com/')
+        feed_import = FeedImport.objects.create(source=feed, total_videos=2)
+        with mock.patch.object(mark_import_pending, 'delay') as delay:
+            feed_import.handle_error('Skipped', is_skip=True)
+            self.assertFalse(delay.called)
+            feed_import.handle_error('Skipped', is_skip=True)
+            delay.assert_called_once_with(
+                import_app_label=FeedImport._meta.app_label,
+                import_model=FeedImport._meta.module_name,
+                import_pk=feed_import.pk,
+                using='default')
+
+    def test_index_batches(self):
+        """
+        Once the videos are handled, the approved ones should be sent to the
+        index in batches of IMPORT_INDEX_BATCH_SIZE.
+
+        """
+        feed = self.create_feed('http://google.com/')
+        feed_import = FeedImport.objects.create(source=feed, total_videos=3,
+                                                videos_imported=3,
+                                                auto_approve=True)
+        for i in xrange(3):
+            video = self.create_video(feed=feed, status=Video.PENDING,
+                                      update_index=False)
+            FeedImportIndex.objects.create(source_import=feed_import,
+                                           video=video)
+        opts = FeedImport._meta
+        with mock.patch('localtv.settings.IMPORT_INDEX_BATCH_SIZE', 2):
+            with mock.patch.object(haystack_update, 'delay') as delay:
+                with mock.patch.object(mark_import_complete, 'apply_async'):
+                    mark_import_pending.apply(args=(opts.app_label,
+                                                    opts.module_name,
+                                                    feed_import.pk))
+        self.assertEqual([len(call[0][2]) for call in delay.call_args_list],
+                         [2, 1])
+        feed_import = FeedImport.objects.get(pk=feed_import.pk)
+        self.assertEqual(feed_import.index_batches_pending, 2)
+
+    def test_index_batches_complete_import(self):
+        """
+        The last pending index update for an import should mark the import
+        complete.
+
+        """
+        feed = self.create_feed('http://google.com/')
+        video = self.create_video(feed=feed, update_index=False)
+        feed_import = FeedImport.objects.create(source=feed,
+                                                status=FeedImport.PENDING,
+                                                index_batches_pending=1)
+        FeedImportIndex.objects.create(source_import=feed_import,
+                                       video=video)
+        opts = FeedImport._meta
+        haystack_update.apply(args=(Video._meta.app_label,
+                                    Video._meta.module_name,
+                                    [video.pk]),
+                              kwargs={'remove': False,
+                                      'import_app_label': opts.app_label,
+                                      'import_model': opts.module_name,
+                                      'import_pk': feed_import.pk})
+        feed_import = FeedImport.objects.get(pk=feed_import.pk)
+        self.assertEqual(feed_import.status, FeedImport.COMPLETE)
+        self.assertEqual(feed_import.index_batches_pending, 0)
+
 
 class FeedImportUnitTestCase(BaseTestCase):
     def create_vidscraper_video(self, url='http://youtube.com/watch/?v=fake',
@@ -70,6 +143,27 @@ class FeedImportUnitTestCase(BaseTestCase):
         Source.update(feed, video_iter, feed_import, using='default')
         self.assertEqual(Feed.objects.get(pk=feed.pk).status, Feed.ACTIVE)
 
+    def test_update_not_modified(self):
+        """
+        Active feeds should be fetched conditionally; if the server says the
+        feed hasn't changed, no import should be created.
+
+        """
+        feed = self.create_feed('http://google.com', etag='"abc"')
+        video_iter = mock.Mock(headers={})
+
+        def next_page():
+            video_iter._response = {'status': 304}
+        video_iter._next_page.side_effect = next_page
+
+        with mock.patch.object(vidscraper, 'auto_feed',
+                               return_value=video_iter):
+            feed.update()
+        self.assertEqual(video_iter.headers['If-None-Match'], '"abc"')
+        self.assertTrue('If-Modified-Since' in video_iter.headers)
+        self.assertFalse(video_iter.load.called)
+        self.assertEqual(FeedImport.objects.count(), 0)
+
     def test_auto_approve_True(self):
         """
         If Feed.auto_approve is True, the imported videos should be marked as
@@ -153,6 +247,70 @@ class FeedImportUnitTestCase(BaseTestCase):
         self.assertEqual(feed_import.videos_imported, 1)
         self.assertEqual(Video.objects.count(), 1)
 
+    def test_batched_import(self):
+        """
+        If LOCALTV_IMPORT_BATCH_SIZE is greater than 1, the videos should be
+        imported in batches, with duplicates within and across batches
+        skipped.
+
+        """
+        feed = self.create_feed('http://google.com')
+        feed_import = FeedImport.objects.create(source=feed)
+        video_iter = [
+            self.create_vidscraper_video(guid='1'),
+            self.create_vidscraper_video(guid='duplicate'),
+            self.create_vidscraper_video(guid='duplicate'),
+            self.create_vidscraper_video(guid='2'),
+            self.create_vidscraper_video(guid='duplicate'),
+            ]
+        self.batches = 0
+        def count_batch(sender, **kwargs):
+            self.batches += 1
+        task_postrun.connect(count_batch, sender=video_from_vidscraper_videos)
+        with mock.patch('localtv.settings.IMPORT_BATCH_SIZE', 2):
+            Source.update(feed, video_iter, feed_import, using='default')
+        task_postrun.disconnect(count_batch,
+                                sender=video_from_vidscraper_videos)
+        self.assertEqual(self.batches, 3)
+        feed_import = FeedImport.objects.get(pk=feed_import.pk) # reload
+        self.assertEqual(feed_import.videos_skipped, 2)
+        self.assertEqual(feed_import.videos_imported, 3)
+        self.assertEqual(feed_import.errors.filter(is_skip=True).count(), 2)
+        self.assertEqual(sorted(Video.objects.values_list('guid', flat=True)),
+                         ['1', '2', 'duplicate'])
+        db_guids = Video.objects.in_feed_order().values_list('guid',
+                                                             flat=True)
+        self.assertEqual(list(db_guids), ['2', 'duplicate', '1'])
+
+    def test_bulk_tags_and_authors(self):
+        """
+        Tags and authors should be shared between the videos of an import,
+        with new tags created as needed.
+
+        """
+        Tag.objects.create(name='old')
+        feed = self.create_feed('http://google.com')
+        feed_import = FeedImport.objects.create(source=feed)
+        video_iter = [
+            self.create_vidscraper_video(guid='1', tags=['old', 'new'],
+                                         user='Author Name'),
+            self.create_vidscraper_video(guid='2', tags=['new', 'newer'],
+                                         user='Author Name'),
+            ]
+        with mock.patch('localtv.settings.IMPORT_BATCH_SIZE', 2):
+            Source.update(feed, video_iter, feed_import, using='default')
+        self.assertEqual(sorted(Tag.objects.values_list('name', flat=True)),
+                         ['new', 'newer', 'old'])
+        video1 = Video.objects.get(guid='1')
+        video2 = Video.objects.get(guid='2')
+        self.assertEqual(sorted(tag.name for tag in video1.tags),
+                         ['new', 'old'])
+        self.assertEqual(sorted(tag.name for tag in video2.tags),
+                         ['new', 'newer'])
+        self.assertEqual(list(video1.authors.all()),
+                         list(video2.authors.all()))
+        self.assertEqual(video1.authors.get().username, 'Author Name')
+
     def test_entries_include_feed_data(self):
         """
         Videos imported from feeds should pull the following from the RSS feed:
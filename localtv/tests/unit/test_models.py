@@ -1,11 +1,18 @@
 from __future__ import with_statement
+import datetime
 
 from daguerre.models import Image, AdjustedImage
+import mock
+from django.contrib.comments import get_model as get_comment_model
 from django.contrib.sites.models import Site
 from django.core.files.base import File
 
-from localtv.models import SiteSettings, SiteRelatedManager, WidgetSettings
+from localtv.comments.views import undo
+from localtv.models import (SiteSettings, SiteRelatedManager, WidgetSettings,
+                            Video, Watch, WatchBucket, WatchBuffer,
+                            RecentComment, Category)
 from localtv.tests import BaseTestCase
+from localtv.utils import get_content_version
 
 
 class SiteRelatedManagerTestCase(BaseTestCase):
@@ -54,6 +61,34 @@ class SiteRelatedManagerTestCase(BaseTestCase):
             self.assertFalse(site_settings2 is site_settings)
             self.assertEqual(site_settings2, site_settings)
 
+    def test_get_cached__verified(self):
+        """
+        After the end of a request, a cached instance should be reused without
+        queries as long as nobody else has saved it. Once it has been saved
+        elsewhere, it should be fetched again.
+
+        """
+        site = Site.objects.get_current()
+        site_settings = SiteSettings.objects.create(site=site)
+        using = site_settings._state.db
+
+        SiteSettings.objects.mark_unverified()
+        with self.assertNumQueries(0):
+            site_settings2 = SiteSettings.objects.get_cached(site.pk, using)
+            self.assertTrue(site_settings2 is site_settings)
+
+        # Simulate a save in another process.
+        SiteSettings.objects._bump_version(using, site.pk)
+        with self.assertNumQueries(0):
+            site_settings3 = SiteSettings.objects.get_cached(site.pk, using)
+            self.assertTrue(site_settings3 is site_settings)
+
+        SiteSettings.objects.mark_unverified()
+        with self.assertNumQueries(1):
+            site_settings4 = SiteSettings.objects.get_cached(site.pk, using)
+            self.assertFalse(site_settings4 is site_settings)
+            self.assertEqual(site_settings4, site_settings)
+
     def test_get_cached__create(self):
         """
         If the instance doesn't exist, we should need three queries: one
@@ -146,3 +181,322 @@ class ThumbnailableTestCase(BaseTestCase):
         video.thumbnail.save('logo.png', File(self._data_file('logo.png')))
         image2 = Image.objects.for_storage_path(video.thumbnail_path)
         self.assertFalse(image2.adjustedimage_set.all())
+
+
+class VideoQuerySetTestCase(BaseTestCase):
+    def setUp(self):
+        BaseTestCase.setUp(self)
+        self.video1 = self.create_video(guid='guid1',
+                                        website_url='http://example.com/1',
+                                        update_index=False)
+        self.video2 = self.create_video(file_url='http://example.com/2.mp4',
+                                        update_index=False)
+        self.video3 = self.create_video(website_url='http://example.com/3',
+                                        update_index=False)
+
+    def test_matching_identifiers(self):
+        """
+        Videos matching any of the given identifiers should be returned;
+        urls are matched through their hashes.
+
+        """
+        qs = Video.objects.matching_identifiers(
+            guids=['guid1'],
+            file_urls=['http://example.com/2.mp4', 'http://example.com/3'])
+        self.assertEqual(set(qs), set([self.video1, self.video2]))
+
+    def test_matching_identifiers__empty(self):
+        """
+        If no identifiers are given, nothing should match (and no query
+        should be needed).
+
+        """
+        with self.assertNumQueries(0):
+            self.assertEqual(list(Video.objects.matching_identifiers()), [])
+
+    def test_existing_identifiers(self):
+        """
+        A single query should tell us which of the given identifiers are
+        already taken.
+
+        """
+        with self.assertNumQueries(1):
+            existing = Video.objects.existing_identifiers(
+                guids=['guid1', 'guid2'],
+                website_urls=['http://example.com/1',
+                              'http://example.com/2.mp4'],
+                file_urls=['http://example.com/2.mp4'])
+        self.assertEqual(existing, {
+            'guid': set(['guid1']),
+            'website_url': set(['http://example.com/1']),
+            'file_url': set(['http://example.com/2.mp4']),
+        })
+
+
+class VideoBestDateTestCase(BaseTestCase):
+    def test_save(self):
+        """
+        The stored best dates should be kept current when a video is saved.
+
+        """
+        video = self.create_video(when_approved=datetime.datetime(2011, 1, 1),
+                                  update_index=False)
+        self.assertEqual(video.best_date, video.when_approved)
+        self.assertEqual(video.best_date_with_published, video.when_approved)
+        video.when_published = datetime.datetime(2010, 1, 1)
+        video.save(update_index=False)
+        self.assertEqual(video.best_date, video.when_approved)
+        self.assertEqual(video.best_date_with_published,
+                         video.when_published)
+
+    def test_update_best_dates(self):
+        """
+        update_best_dates() should backfill the best dates of every video.
+
+        """
+        published = datetime.datetime(2010, 1, 1)
+        video1 = self.create_video(when_approved=datetime.datetime(2011, 1, 1),
+                                   update_index=False)
+        video2 = self.create_video(status=Video.UNAPPROVED,
+                                   when_published=published,
+                                   update_index=False)
+        Video.objects.update(best_date=None, best_date_with_published=None)
+        Video.update_best_dates(batch_size=1)
+        video1 = Video.objects.get(pk=video1.pk)
+        video2 = Video.objects.get(pk=video2.pk)
+        self.assertEqual(video1.best_date, video1.when_approved)
+        self.assertEqual(video1.best_date_with_published,
+                         video1.when_approved)
+        self.assertEqual(video2.best_date, video2.when_submitted)
+        self.assertEqual(video2.best_date_with_published, published)
+
+
+class WatchBucketTestCase(BaseTestCase):
+    def test_record(self):
+        """
+        Watches during the same hour should share a bucket.
+
+        """
+        video = self.create_video(update_index=False)
+        now = datetime.datetime.now()
+        WatchBucket.record(video, now)
+        WatchBucket.record(video, now)
+        WatchBucket.record(video, now - datetime.timedelta(hours=2))
+        self.assertEqual(sorted(WatchBucket.objects.values_list('count',
+                                                                flat=True)),
+                         [1, 2])
+
+    def test_update_watch_counts(self):
+        """
+        Only watches inside the popularity window should count, and buckets
+        outside it should be pruned. Only videos whose count changed should
+        be returned.
+
+        """
+        video1 = self.create_video(name='video1', update_index=False)
+        video2 = self.create_video(name='video2', update_index=False)
+        now = datetime.datetime.now()
+        WatchBucket.record(video1, now, count=3)
+        WatchBucket.record(video2, now - datetime.timedelta(days=10))
+        self.assertEqual(WatchBucket.update_watch_counts(), [video1.pk])
+        self.assertEqual(Video.objects.get(pk=video1.pk).watch_count, 3)
+        self.assertEqual(Video.objects.get(pk=video2.pk).watch_count, 0)
+        self.assertFalse(WatchBucket.objects.filter(video=video2).exists())
+        self.assertEqual(WatchBucket.update_watch_counts(), [])
+        self.assertEqual(list(Video.objects.popular()), [video1])
+
+
+class WatchBufferTestCase(BaseTestCase):
+    def test_flush(self):
+        """
+        Watches should be held until the buffer is flushed, and repeat
+        watches from the same address should be dropped.
+
+        """
+        video = self.create_video(update_index=False)
+        buffer = WatchBuffer()
+        with mock.patch('localtv.settings.WATCH_BUFFER_SIZE', 10):
+            buffer.add(video, None, '1.2.3.4')
+            buffer.add(video, None, '1.2.3.4')
+            buffer.add(video, None, '5.6.7.8')
+            self.assertEqual(Watch.objects.count(), 0)
+            buffer.flush()
+        self.assertEqual(sorted(Watch.objects.values_list('ip_address',
+                                                          flat=True)),
+                         ['1.2.3.4', '5.6.7.8'])
+        self.assertEqual(WatchBucket.objects.get(video=video).count, 2)
+
+    def test_full(self):
+        """
+        A full buffer should be written straight away.
+
+        """
+        video = self.create_video(update_index=False)
+        buffer = WatchBuffer()
+        with mock.patch('localtv.settings.WATCH_BUFFER_SIZE', 2):
+            buffer.add(video, None, '1.2.3.4')
+            buffer.add(video, None, '5.6.7.8')
+        self.assertEqual(Watch.objects.count(), 2)
+
+    def test_flush__timestamp(self):
+        """
+        Watches should be written with the time they happened at, not the
+        time the buffer was flushed.
+
+        """
+        video = self.create_video(update_index=False)
+        buffer = WatchBuffer()
+        watched = datetime.datetime.now() - datetime.timedelta(days=2)
+        with mock.patch('localtv.settings.WATCH_BUFFER_SIZE', 10):
+            with mock.patch('localtv.models.datetime') as mock_datetime:
+                mock_datetime.datetime.now.return_value = watched
+                buffer.add(video, None, '1.2.3.4')
+            buffer.flush()
+        self.assertEqual(Watch.objects.get(video=video).timestamp, watched)
+        self.assertEqual(WatchBucket.objects.get(video=video).hour,
+                         WatchBucket.get_hour(watched))
+
+
+class ContentVersionTestCase(BaseTestCase):
+    def test_bumped(self):
+        """
+        Saving or deleting a video or category should change the content
+        version for its site.
+
+        """
+        version = get_content_version(1)
+        self.assertEqual(get_content_version(1), version)
+        video = self.create_video(update_index=False)
+        version2 = get_content_version(1)
+        self.assertNotEqual(version2, version)
+        self.create_category()
+        version3 = get_content_version(1)
+        self.assertNotEqual(version3, version2)
+        video.delete()
+        self.assertNotEqual(get_content_version(1), version3)
+
+
+class RecentCommentTestCase(BaseTestCase):
+    def test_moderation(self):
+        """
+        Comments should be listed only while they are public and their video
+        is active.
+
+        """
+        site = Site.objects.get_current()
+        video = self.create_video(update_index=False)
+        comment = get_comment_model().objects.create(site=site,
+                                                     content_object=video,
+                                                     comment='Test')
+        self.assertEqual(list(RecentComment.get_comments(site)), [comment])
+
+        comment.is_removed = True
+        comment.save()
+        self.assertEqual(list(RecentComment.get_comments(site)), [])
+
+        comment.is_removed = False
+        comment.save()
+        video.status = Video.UNAPPROVED
+        video.save()
+        self.assertEqual(list(RecentComment.get_comments(site)), [])
+
+        video.status = Video.ACTIVE
+        video.save()
+        self.assertEqual(list(RecentComment.get_comments(site)), [comment])
+
+    def test_video_save(self):
+        """
+        Saving a video should only refresh its comments if its status
+        changed.
+
+        """
+        video = self.create_video(update_index=False)
+        video = Video.objects.get(pk=video.pk)
+        with mock.patch.object(RecentComment,
+                               'update_for_videos') as update_for_videos:
+            video.name = 'New name'
+            video.save()
+            self.assertFalse(update_for_videos.called)
+            video.status = Video.UNAPPROVED
+            video.save()
+            update_for_videos.assert_called_once_with([video.pk],
+                                                      using='default')
+            video.save()
+            self.assertEqual(update_for_videos.call_count, 1)
+
+    def test_undo(self):
+        """
+        Comments hidden by undoing a moderation action should no longer be
+        listed.
+
+        """
+        site = Site.objects.get_current()
+        video = self.create_video(update_index=False)
+        comment = get_comment_model().objects.create(site=site,
+                                                     content_object=video,
+                                                     comment='Test')
+        admin = self.create_user(username='admin', is_superuser=True)
+        request = self.factory.post('/', {'actions': str(comment.pk)},
+                                    user=admin)
+        request._dont_enforce_csrf_checks = True
+        response = undo(request)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(RecentComment.get_comments(site)), [])
+
+
+class CategoryMembershipTestCase(BaseTestCase):
+    def setUp(self):
+        BaseTestCase.setUp(self)
+        self.parent = self.create_category(name='Parent')
+        self.child = self.create_category(name='Child', parent=self.parent)
+        self.other = self.create_category(name='Other')
+        self.video = self.create_video(categories=[self.child],
+                                       update_index=False)
+
+    def assertMemberships(self, categories):
+        self.assertEqual(set(self.video.all_categories), set(categories))
+        for category in (self.parent, self.child, self.other):
+            self.assertEqual(list(category.approved_set),
+                             [self.video] if category in categories else [])
+
+    def test_categories(self):
+        """
+        A video should be listed in its categories and their ancestors, and
+        stop being listed when it's taken out of them.
+
+        """
+        self.assertMemberships([self.parent, self.child])
+        self.video.categories.add(self.other)
+        self.assertMemberships([self.parent, self.child, self.other])
+        self.video.categories.remove(self.child)
+        self.assertMemberships([self.other])
+        self.other.video_set.clear()
+        self.assertMemberships([])
+
+    def test_move(self):
+        """
+        Moving a category should update the memberships of its videos.
+
+        """
+        child = Category.objects.get(pk=self.child.pk)
+        child.parent = self.other
+        child.save()
+        self.assertMemberships([self.other, self.child])
+
+    def test_delete(self):
+        """
+        Deleting a category should take its videos out of its ancestors.
+
+        """
+        Category.objects.get(pk=self.child.pk).delete()
+        self.assertMemberships([])
+
+    def test_all_categories__queries(self):
+        """
+        A video's categories and their ancestors should be found with one
+        query.
+
+        """
+        video = Video.objects.get(pk=self.video.pk)
+        with self.assertNumQueries(1):
+            list(video.all_categories)
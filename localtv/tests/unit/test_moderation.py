@@ -0,0 +1,141 @@
+from __future__ import with_statement
+import re
+
+import mock
+from django.core import mail
+from django.db import connection
+from notification import models as notification
+
+from localtv.models import Video
+from localtv.moderation import (add_video_categories, approve_videos,
+                                reject_videos, send_approval_notices,
+                                set_video_authors, set_video_tags,
+                                update_videos)
+from localtv.tasks import haystack_update
+from localtv.tests import BaseTestCase
+from localtv.utils import hash_url
+
+
+class ModerationTestCase(BaseTestCase):
+    def setUp(self):
+        BaseTestCase.setUp(self)
+        self.videos = [self.create_video(status=Video.UNAPPROVED,
+                                         update_index=False)
+                       for i in xrange(3)]
+        self.pks = sorted(video.pk for video in self.videos)
+
+    def test_approve_videos(self):
+        """
+        The videos should be approved (and featured, if asked) with their
+        best dates kept current, and sent to the index in one batch.
+
+        """
+        with mock.patch.object(haystack_update, 'delay') as delay:
+            pks = approve_videos(Video.objects.filter(pk__in=self.pks),
+                                 feature=True)
+        self.assertEqual(sorted(pks), self.pks)
+        self.assertEqual(delay.call_count, 1)
+        self.assertEqual(sorted(delay.call_args[0][2]), self.pks)
+        for video in Video.objects.filter(pk__in=self.pks):
+            self.assertEqual(video.status, Video.ACTIVE)
+            self.assertTrue(video.last_featured is not None)
+            self.assertEqual(video.best_date, video.when_approved)
+            self.assertEqual(video.best_date_with_published,
+                             video.when_approved)
+
+    def test_update_videos__url_hashes(self):
+        """
+        The url hashes used for duplicate checks should follow url edits.
+
+        """
+        update_videos(Video.objects.filter(pk__in=self.pks),
+                      file_url='http://example.com/new.mp4')
+        for video in Video.objects.filter(pk__in=self.pks):
+            self.assertEqual(video.file_url_hash,
+                             hash_url('http://example.com/new.mp4'))
+
+    def test_reject_videos__sliced(self):
+        """
+        Sliced querysets, like paginator pages, should be accepted.
+
+        """
+        pks = reject_videos(Video.objects.order_by('pk')[:2])
+        self.assertEqual(pks, self.pks[:2])
+        self.assertEqual(
+            list(Video.objects.filter(status=Video.REJECTED
+                             ).order_by('pk').values_list('pk', flat=True)),
+            self.pks[:2])
+
+    def test_reject_videos__large(self):
+        """
+        Queues longer than SQLite's limit on query parameters should be
+        handled.
+
+        """
+        Video.objects.bulk_create([Video(site_id=self.videos[0].site_id,
+                                         name=str(i),
+                                         status=Video.UNAPPROVED)
+                                   for i in xrange(1200)])
+        connection.use_debug_cursor = True
+        try:
+            with mock.patch.object(haystack_update, 'delay'):
+                pks = reject_videos(Video.objects.filter(
+                                                status=Video.UNAPPROVED))
+        finally:
+            connection.use_debug_cursor = None
+        self.assertEqual(len(pks), 1203)
+        for query in connection.queries:
+            for values in re.findall(r' IN \(([^)]*)\)', query['sql']):
+                self.assertTrue(len(values.split(',')) <= 500)
+        self.assertFalse(Video.objects.filter(
+                                    status=Video.UNAPPROVED).exists())
+
+    def test_set_relations(self):
+        """
+        Categories should be added to the videos' existing ones, while
+        authors and tags should replace the existing ones.
+
+        """
+        old, new = self.create_category(name='old'), self.create_category(
+                                                                  name='new')
+        user = self.create_user(username='author')
+        self.videos[0].categories.add(old)
+        self.videos[0].tags = 'old'
+        videos = Video.objects.filter(pk__in=self.pks)
+
+        self.assertEqual(sorted(add_video_categories(videos, [new])),
+                         self.pks)
+        self.assertEqual(sorted(set_video_authors(videos, [user])), self.pks)
+        self.assertEqual(sorted(set_video_tags(videos, 'Foo, bar')),
+                         self.pks)
+        for video in Video.objects.filter(pk__in=self.pks):
+            expected = [new] if video.pk != self.videos[0].pk else [old, new]
+            self.assertEqual(list(video.categories.order_by('pk')), expected)
+            self.assertEqual(list(video.authors.all()), [user])
+            self.assertEqual(sorted(tag.name for tag in video.tags),
+                             ['bar', 'foo'])
+
+    def test_send_approval_notices(self):
+        """
+        Only users who want approval notices should get them, one per video.
+
+        """
+        notice_type = notification.NoticeType.objects.get(
+            label='video_approved')
+        wants = self.create_user(username='wants', email='wants@example.com')
+        other = self.create_user(username='other', email='other@example.com')
+        for user, send in ((wants, True), (other, False)):
+            setting = notification.get_notification_setting(user, notice_type,
+                                                            "1")
+            setting.send = send
+            setting.save()
+        Video.objects.filter(pk__in=self.pks[:2]).update(user=wants)
+        Video.objects.filter(pk=self.pks[2]).update(user=other)
+        # Creating the users sent welcome emails.
+        mail.outbox = []
+
+        send_approval_notices(self.pks)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(set(tuple(message.recipients())
+                             for message in mail.outbox),
+                         set([('wants@example.com',)]))
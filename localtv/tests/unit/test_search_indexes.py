@@ -1,7 +1,10 @@
 from haystack import connections
 from haystack.query import SearchQuerySet
+import mock
 
 from localtv.models import Video
+from localtv.search_indexes import IndexQueue
+from localtv.tasks import haystack_update, haystack_remove
 from localtv.tests import BaseTestCase
 
 
@@ -77,3 +80,81 @@ class VideoIndexUnitTestCase(BaseTestCase):
         playlist.playlistitem_set.get().delete()
         r = SearchQuerySet()[0]
         self.assertEqual(r.playlists, [])
+
+    def test_prefetch_batch(self):
+        """
+        Prefetched videos should be prepared exactly like videos prepared one
+        at a time, without any further queries.
+
+        """
+        parent = self.create_category(name='Parent')
+        child = self.create_category(name='Child', parent=parent)
+        user = self.create_user(username='author', first_name='Jane')
+        playlist = self.create_playlist(user)
+        video1 = self.create_video(name='One', categories=[child],
+                                   authors=[user], tags=['tag1', 'tag2'],
+                                   watches=2, update_index=False)
+        video2 = self.create_video(name='Two', tags=['tag2'],
+                                   update_index=False)
+        playlist.add_video(video2)
+        qs = Video.objects.filter(pk__in=[video1.pk, video2.pk]
+                                  ).order_by('pk')
+        expected = [self.index.full_prepare(video) for video in qs]
+
+        videos = self.index.prefetch_batch(qs)
+        with self.assertNumQueries(0):
+            prepared = [self.index.full_prepare(video) for video in videos]
+        self.assertEqual(prepared, expected)
+        self.assertEqual(set(prepared[0]['categories']),
+                         set([parent.pk, child.pk]))
+
+
+class IndexQueueUnitTestCase(BaseTestCase):
+    def setUp(self):
+        BaseTestCase.setUp(self)
+        self.queue = IndexQueue()
+        self.opts = Video._meta
+
+    def test_coalesce(self):
+        """
+        Pks should be deduplicated and sent in batches once there are enough
+        of them; the rest should wait for a flush.
+
+        """
+        with mock.patch('localtv.settings.INDEX_QUEUE_BATCH_SIZE', 3):
+            with mock.patch.object(haystack_update, 'delay') as delay:
+                for pk in (1, 2, 1, 3, 4):
+                    self.queue.add(self.opts.app_label,
+                                   self.opts.module_name, [pk],
+                                   haystack_update)
+                delay.assert_called_once_with(self.opts.app_label,
+                                              self.opts.module_name,
+                                              [1, 2, 3], using='default')
+                self.queue.flush()
+                delay.assert_called_with(self.opts.app_label,
+                                         self.opts.module_name,
+                                         [4], using='default')
+                self.assertEqual(delay.call_count, 2)
+
+    def test_last_task_wins(self):
+        """
+        A pk queued for removal shouldn't also be sent for an update queued
+        before it.
+
+        """
+        with mock.patch('localtv.settings.INDEX_QUEUE_BATCH_SIZE', 10):
+            with mock.patch.object(haystack_update, 'delay') as update:
+                with mock.patch.object(haystack_remove, 'delay') as remove:
+                    self.queue.add(self.opts.app_label,
+                                   self.opts.module_name, [1, 2],
+                                   haystack_update)
+                    self.queue.add(self.opts.app_label,
+                                   self.opts.module_name, [2],
+                                   haystack_remove)
+                    self.queue.flush()
+                    update.assert_called_once_with(self.opts.app_label,
+                                                   self.opts.module_name,
+                                                   [1], using='default')
+                    remove.assert_called_once_with(self.opts.app_label,
+                                                   self.opts.module_name,
+                                                   [2], using='default')
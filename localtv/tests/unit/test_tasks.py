@@ -6,10 +6,11 @@ from django.test.utils import override_settings
 from haystack.query import SearchQuerySet
 import mock
 
-from localtv.models import Video
+from localtv.models import Video, Feed, FeedImport, Watch, WatchDay
 from localtv.tasks import (haystack_update, haystack_remove,
                            haystack_batch_update, video_from_vidscraper_video,
-                           video_save_thumbnail)
+                           video_save_thumbnail, update_sources, feed_update,
+                           rollup_watches)
 from localtv.tests import BaseTestCase
 
 
@@ -37,6 +38,144 @@ class VideoFromVidscraperTestCase(BaseTestCase):
         video.delete.assert_called_once_with()
 
 
+class UpdateSourcesTestCase(BaseTestCase):
+    def test_only_due(self):
+        """
+        Only sources which are due should be dispatched, and they should be
+        scheduled again so that the next run doesn't pick them up.
+
+        """
+        due = self.create_feed('http://example.com/1')
+        not_due = self.create_feed('http://example.com/2',
+                                   next_update=datetime.now() + timedelta(1))
+        with mock.patch.object(feed_update, 'delay') as delay:
+            update_sources.apply()
+            delay.assert_called_once_with(due.pk, using='default')
+        due = Feed.objects.get(pk=due.pk)
+        self.assertTrue(due.next_update > datetime.now())
+        self.assertEqual(Feed.objects.get(pk=not_due.pk).next_update,
+                         not_due.next_update)
+
+        with mock.patch.object(feed_update, 'delay') as delay:
+            update_sources.apply()
+            self.assertFalse(delay.called)
+
+    def test_host_limit(self):
+        """
+        No more than SOURCE_UPDATE_HOST_LIMIT imports should run against a
+        single host at once.
+
+        """
+        running = self.create_feed('http://example.com/running',
+                                   next_update=datetime.now() + timedelta(1))
+        FeedImport.objects.create(source=running)
+        self.create_feed('http://example.com/1')
+        other_host = self.create_feed('http://example.org/1')
+        with mock.patch('localtv.settings.SOURCE_UPDATE_HOST_LIMIT', 1):
+            with mock.patch.object(feed_update, 'delay') as delay:
+                update_sources.apply()
+                delay.assert_called_once_with(other_host.pk, using='default')
+
+    def _add_imports(self, feed, *counts):
+        """
+        Adds a finished import to ``feed`` for each of the ``counts``, the
+        last one being the most recent.
+
+        """
+        start = datetime.now() - timedelta(1)
+        for i, count in enumerate(counts, feed.imports.count()):
+            feed_import = FeedImport.objects.create(source=feed,
+                                                    status=FeedImport.COMPLETE,
+                                                    videos_imported=count)
+            FeedImport.objects.filter(pk=feed_import.pk).update(
+                                        start=start + timedelta(seconds=i))
+
+    def test_schedule_next_update(self):
+        """
+        The update interval should follow the share of the source's recent
+        imports which found videos, within the configured bounds.
+
+        """
+        feed = self.create_feed('http://example.com/')
+        with mock.patch.multiple('localtv.settings',
+                                 SOURCE_UPDATE_INTERVAL=4000,
+                                 SOURCE_UPDATE_MIN_INTERVAL=1000,
+                                 SOURCE_UPDATE_MAX_INTERVAL=16000,
+                                 SOURCE_UPDATE_HISTORY=4):
+            # No history yet.
+            feed.schedule_next_update()
+            self.assertEqual(feed.update_interval, 4000)
+            self._add_imports(feed, 1, 5, 2, 1)
+            feed.schedule_next_update()
+            self.assertEqual(feed.update_interval, 1000)
+            self._add_imports(feed, 0, 0)
+            feed.schedule_next_update()
+            self.assertEqual(feed.update_interval, 4000)
+            # Only the most recent imports count.
+            self._add_imports(feed, 0, 0)
+            feed.schedule_next_update()
+            self.assertEqual(feed.update_interval, 16000)
+
+        feed = Feed.objects.get(pk=feed.pk)
+        self.assertEqual(feed.update_interval, 16000)
+        self.assertTrue(feed.next_update > datetime.now())
+
+    def test_schedule_next_update__zero_settings(self):
+        """
+        A minimum interval or history of 0 should be treated as 1 rather than
+        dividing by zero.
+
+        """
+        feed = self.create_feed('http://example.com/')
+        self._add_imports(feed, 1, 0)
+        with mock.patch.multiple('localtv.settings',
+                                 SOURCE_UPDATE_INTERVAL=4000,
+                                 SOURCE_UPDATE_MIN_INTERVAL=0,
+                                 SOURCE_UPDATE_MAX_INTERVAL=16000,
+                                 SOURCE_UPDATE_HISTORY=0):
+            feed.schedule_next_update()
+            self.assertEqual(feed.update_interval, 16000)
+            with mock.patch('localtv.settings.SOURCE_UPDATE_HISTORY', 2):
+                feed.schedule_next_update()
+                self.assertEqual(feed.update_interval, 126)
+
+    def test_schedule_next_update__not_modified(self):
+        """
+        If the source wasn't modified, the interval should grow by half, up
+        to the maximum.
+
+        """
+        feed = self.create_feed('http://example.com/', update_interval=3000)
+        with mock.patch.multiple('localtv.settings',
+                                 SOURCE_UPDATE_MIN_INTERVAL=1000,
+                                 SOURCE_UPDATE_MAX_INTERVAL=5000):
+            feed.schedule_next_update(not_modified=True)
+            self.assertEqual(feed.update_interval, 4500)
+            feed.schedule_next_update(not_modified=True)
+            self.assertEqual(feed.update_interval, 5000)
+
+
+class RollupWatchesTestCase(BaseTestCase):
+    def test_rollup(self):
+        """
+        Watches older than the retention period should be folded into daily
+        counts and deleted; newer watches should be left alone. The total
+        should not change.
+
+        """
+        video = self.create_video(update_index=False)
+        for days in (0, 40, 40, 41):
+            self.create_watch(video, days=days)
+        self.assertEqual(WatchDay.get_total(video), 4)
+
+        rollup_watches.apply(kwargs={'days': 30, 'batch_size': 2})
+        self.assertEqual(Watch.objects.count(), 1)
+        self.assertEqual(sorted(WatchDay.objects.values_list('count',
+                                                             flat=True)),
+                         [1, 2])
+        self.assertEqual(WatchDay.get_total(video), 4)
+
+
 class HaystackUpdateUnitTestCase(BaseTestCase):
     def setUp(self):
         BaseTestCase.setUp(self)
@@ -131,6 +270,24 @@ class HaystackRemoveUnitTestCase(BaseTestCase):
         results = set((int(r.pk) for r in SearchQuerySet()))
         self.assertEqual(results, expected)
 
+    def test_fallback(self):
+        """
+        Backends without a bulk removal path should have each document
+        removed separately.
+
+        """
+        backend = mock.Mock()
+        connection = mock.Mock(options={'ENGINE': 'other'})
+        connection.get_backend.return_value = backend
+        with mock.patch('localtv.tasks.connections', {'default': connection}):
+            haystack_remove.apply(args=(Video._meta.app_label,
+                                        Video._meta.module_name,
+                                        [self.video1.pk, self.video2.pk]))
+        self.assertEqual(backend.remove.call_args_list, [
+            ((u'localtv.video.%i' % self.video1.pk,), {}),
+            ((u'localtv.video.%i' % self.video2.pk,), {}),
+        ])
+
 
 class HaystackBatchUpdateUnitTestCase(BaseTestCase):
     def test_batch(self):
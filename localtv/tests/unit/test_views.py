@@ -1,12 +1,44 @@
 from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.http import Http404
+from haystack.query import SearchQuerySet
+import mock
 
 from localtv.listing.views import CompatibleListingView
 from localtv.models import Video
+from localtv.search.forms import SearchForm
 from localtv.search.utils import NormalizedVideoList
 from localtv.search.views import SortFilterView
 from localtv.tests import BaseTestCase
-from localtv.views import VideoView
+from localtv.views import IndexView, VideoView
+
+
+class IndexViewTestCase(BaseTestCase):
+    def test_cached_modules(self):
+        """
+        With caching on, the page's lists should be fetched once and reused.
+        After a content change, a stale copy should be served while someone
+        else is rebuilding it, and a fresh one otherwise.
+
+        """
+        video1 = self.create_video(update_index=False)
+        view = IndexView()
+        with mock.patch('localtv.settings.INDEX_CACHE_TIMEOUT', 60):
+            self.assertEqual(view.get_cached_modules()['new_videos'],
+                             [video1])
+            with self.assertNumQueries(0):
+                self.assertEqual(view.get_cached_modules()['new_videos'],
+                                 [video1])
+
+            video2 = self.create_video(update_index=False)
+            cache.add('localtv:index_modules:1:lock', 1)
+            with self.assertNumQueries(0):
+                self.assertEqual(view.get_cached_modules()['new_videos'],
+                                 [video1])
+
+            cache.delete('localtv:index_modules:1:lock')
+            self.assertEqual(view.get_cached_modules()['new_videos'],
+                             [video2, video1])
 
 
 class VideoViewTestCase(BaseTestCase):
@@ -99,6 +131,78 @@ class CompatibleListingViewTestCase(BaseTestCase):
         for f in context['form'].filter_fields():
             self.assertFalse(f.name in context)
 
+    def test_cursor(self):
+        """
+        The context should include a cursor for the next page, and following
+        it should give the rest of the results without any offset.
+
+        """
+        videos = [self.create_video(name=str(i)) for i in xrange(3)]
+        videos.reverse()
+        view = CompatibleListingView()
+        view.kwargs = {}
+        view.request = self.factory.get('/', {'sort': 'newest', 'count': 2})
+        # Whoosh can't break ties, so cursors are tested on the database.
+        with mock.patch.object(SearchForm, 'get_queryset',
+                               lambda form, use_haystack=False:
+                               Video.objects.filter(status=Video.ACTIVE)):
+            context = view.get_context_data(object_list=view.get_queryset())
+            self.assertEqual(list(context['videos']), videos[:2])
+            cursor = context['next_cursor']
+            self.assertTrue(cursor)
+
+            view.request = self.factory.get('/', {'sort': 'newest',
+                                                  'count': 2,
+                                                  'cursor': cursor})
+            context = view.get_context_data(object_list=view.get_queryset())
+            self.assertEqual(list(context['videos']), videos[2:])
+            self.assertTrue(context['next_cursor'] is None)
+            self.assertTrue(context['page_obj'] is None)
+
+    def test_cursor__capped_count(self):
+        """
+        If the result count is capped, the last numbered page should still
+        have a cursor for the results past the cap.
+
+        """
+        videos = [self.create_video(name=str(i)) for i in xrange(5)]
+        videos.reverse()
+        view = CompatibleListingView()
+        view.kwargs = {}
+        view.request = self.factory.get('/', {'sort': 'newest', 'count': 2,
+                                              'page': 2})
+        with mock.patch.object(SearchForm, 'get_queryset',
+                               lambda form, use_haystack=False:
+                               Video.objects.filter(status=Video.ACTIVE)):
+            with mock.patch('localtv.settings.RESULT_COUNT_CAP', 4):
+                context = view.get_context_data(
+                                        object_list=view.get_queryset())
+            self.assertEqual(list(context['videos']), videos[2:4])
+            self.assertFalse(context['page_obj'].has_next())
+            cursor = context['next_cursor']
+            self.assertTrue(cursor)
+
+            view.request = self.factory.get('/', {'sort': 'newest',
+                                                  'count': 2,
+                                                  'cursor': cursor})
+            context = view.get_context_data(object_list=view.get_queryset())
+            self.assertEqual(list(context['videos']), videos[4:])
+
+    def test_cursor__unsupported(self):
+        """
+        Sorts on nullable fields, and Whoosh searches, which can't break ties,
+        shouldn't be paged with cursors.
+
+        """
+        sorts = SearchForm.sorts
+        videos = Video.objects.all()
+        self.assertTrue(sorts['newest'].can_use_cursor(videos))
+        self.assertFalse(sorts['featured'].can_use_cursor(videos))
+        self.assertFalse(sorts['relevant'].can_use_cursor(videos))
+        with mock.patch('localtv.search.utils._is_whoosh',
+                        return_value=True):
+            self.assertFalse(sorts['newest'].can_use_cursor(SearchQuerySet()))
+
 
 class SortFilterViewTestCase(BaseTestCase):
     def test_get_object(self):
@@ -1,6 +1,7 @@
 import datetime
 import hashlib
 import string
+import time
 import urllib
 import urllib2
 import types
@@ -12,8 +13,10 @@ from django.conf import settings
 from django.core.cache import cache
 from django.core.files.storage import default_storage
 from django.core.mail import EmailMessage
+from django.db import transaction, IntegrityError
 from django.db.models import get_model, Q
 from django.db.models.query import QuerySet
+from django.utils.datastructures import SortedDict
 from django.utils.encoding import force_unicode, smart_str
 import tagging
 import vidscraper
@@ -22,6 +25,10 @@ from notification import models as notification
 from localtv.settings import API_KEYS
 
 
+#: How long content versions are kept in the cache.
+CONTENT_VERSION_TIMEOUT = 60 * 60 * 24 * 30
+
+
 def get_tag(tag_text, using='default'):
     while True:
         try:
@@ -41,6 +48,39 @@ def get_tag(tag_text, using='default'):
             pass # try again to create the tag
 
 
+def get_tags_in_bulk(tag_names, using='default'):
+    """
+    Returns a dictionary mapping each of the given ``tag_names`` to its
+    :class:`tagging.models.Tag`. Existing tags are fetched with a single
+    query, and the missing ones are created with a single bulk insert.
+
+    """
+    tag_names = set(tag_names)
+    manager = tagging.models.Tag._default_manager.db_manager(using)
+
+    def fetch(names):
+        return dict((tag.name, tag)
+                    for tag in manager.filter(name__in=names))
+
+    tags = fetch(tag_names)
+    missing = tag_names - set(tags)
+    if missing:
+        sid = transaction.savepoint(using=using)
+        try:
+            manager.bulk_create([tagging.models.Tag(name=name)
+                                 for name in missing])
+        except IntegrityError:
+            # Some of them were created in the meantime, or the database
+            # compares names case-insensitively; go one at a time instead.
+            transaction.savepoint_rollback(sid, using=using)
+            for name in missing:
+                tags[name] = manager.get_or_create(name=name)[0]
+        else:
+            transaction.savepoint_commit(sid, using=using)
+            tags.update(fetch(missing))
+    return tags
+
+
 def edit_string_for_tags(tag_list):
     """
     Converts a list of tagging.Tag instances into an edit string. Thin wrapper
@@ -71,6 +111,37 @@ def get_or_create_tags(tag_list, using='default'):
     return edit_string_for_tags(list(tag_set))
 
 
+class LRUCache(object):
+    """
+    A small dictionary-like cache which discards the least recently used
+    items once it holds more than ``size`` of them.
+
+    """
+    def __init__(self, size=1000):
+        self.size = size
+        self._data = SortedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            return default
+        self._data[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._data.pop(key, None)
+        self._data[key] = value
+        while len(self._data) > self.size:
+            del self._data[self._data.keyOrder[0]]
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        self._data.clear()
+
+
 def hash_file_obj(file_obj, hash_constructor=hashlib.sha1, close_it=True):
     hasher = hash_constructor()
     for chunk in iter(lambda: file_obj.read(4096), ''):
@@ -80,6 +151,88 @@ def hash_file_obj(file_obj, hash_constructor=hashlib.sha1, close_it=True):
     return hasher.hexdigest()
 
 
+def hash_url(url):
+    """
+    Returns a sha1 hex digest of the given url, or an empty string if no url
+    was given. This is used for indexed lookups on url fields which are too
+    long to be indexed directly.
+
+    """
+    if not url:
+        return ''
+    return hashlib.sha1(smart_str(url)).hexdigest()
+
+
+def is_not_modified(response):
+    """
+    Returns ``True`` if ``response`` -- either a :mod:`feedparser` result or
+    a :mod:`requests` response, as fetched by :mod:`vidscraper` -- is an HTTP
+    "304 Not Modified" response.
+
+    """
+    status = getattr(response, 'status_code', None)
+    if status is None and isinstance(response, dict):
+        status = response.get('status')
+    return status == 304
+
+
+def _content_version_key(site_pk):
+    return 'localtv:content_version:%i' % site_pk
+
+
+def get_content_version(site_pk):
+    """
+    Returns a number which changes whenever a video or category on the site
+    changes, for use in cache keys. This is a single cache lookup.
+
+    """
+    key = _content_version_key(site_pk)
+    version = cache.get(key)
+    if version is None:
+        # Start from the current time so that a version which was evicted
+        # from the cache is never handed out again.
+        cache.add(key, int(time.time() * 1000), CONTENT_VERSION_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def bump_content_version(site_pk):
+    """
+    Changes the content version for the site, invalidating anything that was
+    cached under the old one.
+
+    """
+    try:
+        cache.incr(_content_version_key(site_pk))
+    except ValueError:
+        cache.set(_content_version_key(site_pk), int(time.time() * 1000),
+                  CONTENT_VERSION_TIMEOUT)
+
+
+def get_cached_with_revalidation(key, version, timeout, generate,
+                                 stale_timeout=60 * 60 * 24):
+    """
+    Returns the value cached under ``key`` for ``version``, calling
+    ``generate`` to compute (and cache) it when necessary. Values are fresh
+    for ``timeout`` seconds. After that, or once ``version`` changes, a single
+    caller regenerates the value while everyone else keeps getting the stale
+    one, for up to ``stale_timeout`` seconds.
+
+    """
+    cached = cache.get(key)
+    if cached is not None:
+        cached_version, expires, value = cached
+        if cached_version == version and expires > time.time():
+            return value
+        if not cache.add(key + ':lock', 1, 30):
+            return value
+    value = generate()
+    cache.set(key, (version, time.time() + timeout, value),
+              max(timeout, stale_timeout))
+    cache.delete(key + ':lock')
+    return value
+
+
 def unicode_set(iterable):
     output = set()
     for thing in iterable:
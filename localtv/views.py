@@ -1,16 +1,17 @@
-from django.contrib import comments
-from django.contrib.contenttypes.models import ContentType
 from django.core.urlresolvers import resolve, Resolver404
 from django.conf import settings
 from django.db.models import Q
-from django.http import HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import render_to_response
 from django.template import RequestContext
 from django.views.generic import TemplateView, DetailView
 
-from localtv.models import Video, Watch, Category, SiteSettings
+from localtv import settings as lsettings
+from localtv.models import (Video, Watch, Category, SiteSettings,
+                            RecentComment)
 from localtv.search.forms import SearchForm
 from localtv.search.utils import NormalizedVideoList
+from localtv.utils import get_cached_with_revalidation, get_content_version
 
 from localtv.playlists.models import Playlist, PlaylistItem
 
@@ -21,27 +22,67 @@ MAX_VOTES_PER_CATEGORY = getattr(settings, 'MAX_VOTES_PER_CATEGORY', 3)
 class IndexView(TemplateView):
     template_name = 'localtv/index.html'
 
-    def get_context_data(self, **kwargs):
-        context = super(IndexView, self).get_context_data(**kwargs)
+    #: The number of items from each list on the page which are cached.
+    cached_module_length = 30
+
+    def get(self, request, *args, **kwargs):
+        timeout = lsettings.INDEX_CACHE_TIMEOUT
+        if (not timeout or request.user.is_authenticated() or request.GET or
+            request.COOKIES.get('messages')):
+            return super(IndexView, self).get(request, *args, **kwargs)
+
+        def render_page():
+            response = super(IndexView, self).get(request, *args, **kwargs)
+            response.render()
+            return (response.status_code, response['Content-Type'],
+                    response.content)
+        key = 'localtv:index_page:%i' % settings.SITE_ID
+        status, content_type, content = get_cached_with_revalidation(
+                                 key, get_content_version(settings.SITE_ID),
+                                 timeout, render_page)
+        return HttpResponse(content, status=status, content_type=content_type)
+
+    def get_modules(self):
+        """
+        Returns a dictionary of the video and comment lists shown on the
+        page.
+
+        """
         featured_videos = Video.objects.get_featured_videos()
         form = SearchForm({'sort': 'popular'})
         popular_videos = form.search()
         new_videos = Video.objects.get_latest_videos()
 
-        site_settings_videos = Video.objects.get_site_settings_videos()
-        recent_comments = comments.get_model().objects.filter(
-            site=settings.SITE_ID,
-            content_type=ContentType.objects.get_for_model(Video),
-            object_pk__in=site_settings_videos.values_list('pk', flat=True),
-            is_removed=False,
-            is_public=True).order_by('-submit_date')
+        recent_comments = RecentComment.get_comments(settings.SITE_ID)
 
-        context.update({
+        return {
             'featured_videos': featured_videos,
             'popular_videos': NormalizedVideoList(popular_videos),
             'new_videos': new_videos,
             'comments': recent_comments
-        })
+        }
+
+    def get_cached_modules(self):
+        """
+        Returns the lists from :meth:`get_modules`, truncated to
+        :attr:`cached_module_length` and shared through the cache.
+
+        """
+        def generate():
+            length = self.cached_module_length
+            return dict((name, list(module[:length]))
+                        for name, module in self.get_modules().iteritems())
+        key = 'localtv:index_modules:%i' % settings.SITE_ID
+        return get_cached_with_revalidation(
+                                 key, get_content_version(settings.SITE_ID),
+                                 lsettings.INDEX_CACHE_TIMEOUT, generate)
+
+    def get_context_data(self, **kwargs):
+        context = super(IndexView, self).get_context_data(**kwargs)
+        if lsettings.INDEX_CACHE_TIMEOUT:
+            context.update(self.get_cached_modules())
+        else:
+            context.update(self.get_modules())
         return context
 
 